@@ -0,0 +1,195 @@
+import os
+import time
+import threading
+import contextlib
+
+# 並列数を見直す間隔（秒）
+ADJUST_INTERVAL = 5.0
+# 並列数を増やしたとき、処理量がこの割合以上増えなければ元に戻す
+MIN_IMPROVEMENT = 0.05
+# これ以上のCPU使用率・ディスクの使用時間の割合で飽和したとみなす
+CPU_SATURATION = 0.95
+DISK_SATURATION = 0.90
+# 並列数を戻した後、増やすのを試さずに待つ回数（続けて効果がなかった場合は倍にし、MAX_HOLD_ROUNDS まで延ばす）
+HOLD_ROUNDS = 3
+MAX_HOLD_ROUNDS = 24
+# 自動の場合の並列数の上限（CPU数に対する倍率）
+MAX_WORKERS_FACTOR = 2
+
+
+def cpu_count():
+    return os.cpu_count() or 1
+
+
+def auto_threads(workers):
+    """並列に workers 個実行する場合の、ffmpegの1プロセスあたりのスレッド数（CPUを分け合う）"""
+    return max(1, cpu_count() // max(1, workers))
+
+
+def _read_cpu_times():
+    """/proc/stat の全CPUの (使用時間, 合計時間)（Linux以外ではNone）"""
+    try:
+        with open('/proc/stat', encoding='ascii') as f:
+            fields = f.readline().split()
+    except OSError:
+        return None
+    if not fields or fields[0] != 'cpu':
+        return None
+    values = [int(value) for value in fields[1:]]
+    # idle と iowait 以外を使用時間とする
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values) - idle, sum(values)
+
+
+def _read_disk_ticks():
+    """/proc/diskstats のデバイスごとの入出力に費やした時間（ミリ秒、Linux以外ではNone）"""
+    try:
+        with open('/proc/diskstats', encoding='ascii') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    ticks = {}
+    for line in lines:
+        fields = line.split()
+        # パーティションや仮想デバイスは物理デバイスと重複するため除く
+        if len(fields) < 13 or fields[2].startswith(('loop', 'ram', 'dm-', 'zram')):
+            continue
+        if os.path.exists(f"/sys/block/{fields[2]}"):
+            ticks[fields[2]] = int(fields[12])
+    return ticks
+
+
+class SystemLoad:
+    """前回の sample() からのCPU使用率と、最も混んでいるディスクの使用時間の割合を求める
+
+    Linuxでは /proc から求め、それ以外ではCPUはロードアベレージから推定し、ディスクは不明（None）とする。
+    """
+
+    def __init__(self):
+        self._cpu = _read_cpu_times()
+        self._disk = _read_disk_ticks()
+        self._time = time.monotonic()
+
+    def sample(self):
+        """(CPU使用率, ディスクの使用時間の割合) を0〜1で返す（求められない値はNone）"""
+        now = time.monotonic()
+        elapsed = now - self._time
+        self._time = now
+
+        cpu = None
+        times = _read_cpu_times()
+        if times is not None and self._cpu is not None and times[1] > self._cpu[1]:
+            cpu = (times[0] - self._cpu[0]) / (times[1] - self._cpu[1])
+        elif times is None and hasattr(os, 'getloadavg'):
+            cpu = min(1.0, os.getloadavg()[0] / cpu_count())
+        self._cpu = times
+
+        disk = None
+        ticks = _read_disk_ticks()
+        if ticks and self._disk and elapsed > 0:
+            busy = [ticks[name] - self._disk[name] for name in ticks if name in self._disk]
+            if busy:
+                disk = min(1.0, max(busy) / (elapsed * 1000))
+        self._disk = ticks
+        return cpu, disk
+
+
+class ConcurrencyLimiter:
+    """同時に実行する処理の数を制限する（workers を指定しない場合は処理量と負荷から自動で調整する）
+
+    自動の場合はCPU数から始め、ADJUST_INTERVAL ごとに完了した処理量（weight の合計）を比べて
+    並列数を1ずつ増減する。増やしても処理量が増えなければ戻し、ディスクが飽和している場合は減らし、
+    CPUが飽和している場合は増やさない。ffmpeg_threads() はffmpegの1プロセスあたりのスレッド数を返す。
+    """
+
+    def __init__(self, workers=None, threads=None, maximum=None, interval=ADJUST_INTERVAL):
+        self.adaptive = not workers
+        self.limit = workers or cpu_count()
+        self.minimum = 1
+        self.maximum = workers or max(self.limit, maximum or cpu_count() * MAX_WORKERS_FACTOR)
+        self.threads = threads  # ffmpegのスレッド数（Noneの場合は並列数から決める）
+        self.interval = interval
+        self.history = []  # 並列数を変更した記録
+        self._active = 0
+        self._condition = threading.Condition()
+        self._load = SystemLoad() if self.adaptive else None
+        self._window_start = time.monotonic()
+        self._window_weight = 0.0
+        self._previous = None  # 前回の区間の処理量（1秒あたり）
+        self._last_step = 0
+        self._hold = 0
+        self._hold_rounds = HOLD_ROUNDS
+
+    @contextlib.contextmanager
+    def slot(self, weight=1.0):
+        """実行できる数に空きができるまで待ち、処理が終わったら weight を処理量として記録する
+
+        weight には、処理が終わったときに呼んで処理量を求める関数も指定できる
+        （枠を確保してから処理するファイルが決まる場合に使う）。
+        """
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._window_weight += weight() if callable(weight) else weight
+                if self.adaptive:
+                    self._adjust()
+                self._condition.notify_all()
+
+    def ffmpeg_threads(self):
+        """ffmpegの1プロセスあたりのスレッド数（指定がない場合はCPU数を並列数で分ける）"""
+        return self.threads or auto_threads(self.limit)
+
+    def _adjust(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+        throughput = self._window_weight / elapsed
+        self._window_start = now
+        self._window_weight = 0.0
+        cpu, disk = self._load.sample()
+
+        step = 0
+        reason = None
+        if disk is not None and disk >= DISK_SATURATION:
+            step, reason = -1, "ディスクが飽和"
+        elif self._last_step > 0 and throughput < self._previous * (1 + MIN_IMPROVEMENT):
+            step, reason = -1, "増やしても処理量が増えない"
+            self._hold = self._hold_rounds
+            self._hold_rounds = min(MAX_HOLD_ROUNDS, self._hold_rounds * 2)
+        elif self._last_step < 0 and throughput < self._previous * (1 - MIN_IMPROVEMENT):
+            step, reason = 1, "減らして処理量が落ちた"
+            self._hold = self._hold_rounds
+        elif self._hold:
+            self._hold -= 1
+        elif cpu is None or cpu < CPU_SATURATION:
+            step, reason = 1, "CPUに余裕がある"
+        if self._last_step > 0 and step >= 0:
+            # 増やした効果があった
+            self._hold_rounds = HOLD_ROUNDS
+
+        limit = min(self.maximum, max(self.minimum, self.limit + step))
+        self._last_step = limit - self.limit
+        self._previous = throughput
+        if self._last_step:
+            self.limit = limit
+            self.history.append({
+                'limit': limit,
+                'throughput': throughput,
+                'cpu': cpu,
+                'disk': disk,
+                'reason': reason,
+            })
+
+
+def as_limiter(workers):
+    """並列数（Noneまたは0の場合は自動）または ConcurrencyLimiter から ConcurrencyLimiter を返す"""
+    if isinstance(workers, ConcurrencyLimiter):
+        return workers
+    return ConcurrencyLimiter(workers)
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from audio_core import ANALYSIS_FIELDS
+
+# キャッシュに保存する解析結果のキー
+CACHE_FIELDS = ANALYSIS_FIELDS
+
+# 件数とデータの合計サイズ（バイト、ヒストグラムによってエントリごとの大きさが異なるため）の上限
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# 最終アクセス日時はこの件数ごとにまとめて書き込む
+TOUCH_FLUSH_SIZE = 256
+# 上限を超えたエントリの削除はこの件数の保存ごとに行う
+EVICT_INTERVAL = 100
+
+
+def compute_content_hash(file_path):
+    """ファイル内容のハッシュ値を計算"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """解析結果をパス・サイズ・更新日時をキーにディスクへ保存するキャッシュ
+
+    エントリ数が max_entries、または保存した解析結果の合計サイズが max_bytes バイトを超えると
+    最終アクセスが古いものから削除する（LRU）。
+    ヒットのたびに書き込みのトランザクションが発生しないよう、最終アクセス日時の更新は
+    まとめて書き込み、上限の確認は EVICT_INTERVAL 件の保存ごとに行う
+    （そのため一時的に上限を EVICT_INTERVAL 件未満だけ超えることがある）。
+    use_content_hash を有効にすると内容のハッシュでも検証し、
+    移動・コピーされたファイルも同じ内容であればキャッシュを利用する。
+    解析結果には測定した方式（backend）も保存し、異なる方式の結果は使用しない。
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES, use_content_hash=False,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.use_content_hash = use_content_hash
+        # 解析ワーカーの複数スレッドから共有するため、接続はロックで保護する
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        # 書き込んでいない最終アクセス日時（パス -> 日時）と、前回の削除からの保存件数
+        self._pending_access = {}
+        self._stores_since_evict = 0
+        with self._lock:
+            # 複数プロセスから同時に開かれても読み書きできるようにWALモードを使用
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " content_hash TEXT,"
+                " data TEXT NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_content ON entries(size, content_hash)")
+            self._conn.commit()
+
+    def get(self, file_path):
+        """キャッシュ済みの解析結果を返す（未登録・変更済みの場合はNone）"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, content_hash, data FROM entries WHERE path = ?",
+                (file_path,)
+            ).fetchone()
+
+        content_hash = None
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            if not self.use_content_hash or row[2] is None:
+                self._touch(file_path)
+                return json.loads(row[3])
+            content_hash = compute_content_hash(file_path)
+            if content_hash == row[2]:
+                self._touch(file_path)
+                return json.loads(row[3])
+
+        if not self.use_content_hash:
+            return None
+
+        # パスが一致しない場合でも、同じ内容のファイルの結果があれば利用する
+        if content_hash is None:
+            content_hash = compute_content_hash(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM entries WHERE size = ? AND content_hash = ? LIMIT 1",
+                (stat.st_size, content_hash)
+            ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self._store(file_path, stat, content_hash, data)
+        return data
+
+    def put(self, file_path, file_info, backend=None):
+        """file_info の解析結果を、測定した方式 backend とともにキャッシュに保存"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        content_hash = compute_content_hash(file_path) if self.use_content_hash else None
+        data = {key: file_info.get(key) for key in CACHE_FIELDS}
+        data['backend'] = backend
+        self._store(file_path, stat, content_hash, data)
+
+    def apply(self, file_info, backends=None):
+        """キャッシュ済みの値を file_info に反映（反映できた場合は True を返す）
+
+        backends を指定すると、そのいずれかの方式で測定した結果だけを反映する。
+        """
+        data = self.get(file_info['path'])
+        if data is None or data.get('lufs') is None:
+            return False
+        if backends is not None and data.get('backend') not in backends:
+            return False
+        # 保存後に追加された項目（ヒストグラムなど）がない古いエントリは再解析する
+        if any(key not in data for key in CACHE_FIELDS):
+            return False
+        for key in CACHE_FIELDS:
+            file_info[key] = data.get(key)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._pending_access.clear()
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._pending_access:
+                self._flush_access()
+                self._conn.commit()
+            self._conn.close()
+
+    def _store(self, file_path, stat, content_hash, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (path, size, mtime_ns, content_hash, data, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (file_path, stat.st_size, stat.st_mtime_ns, content_hash, json.dumps(data), time.time())
+            )
+            self._pending_access.pop(file_path, None)
+            # 削除の前に最終アクセス日時を反映する（同じトランザクションで書き込む）
+            self._flush_access()
+            self._stores_since_evict += 1
+            if self._stores_since_evict >= EVICT_INTERVAL:
+                self._stores_since_evict = 0
+                self._evict()
+            self._conn.commit()
+
+    def _touch(self, file_path):
+        with self._lock:
+            self._pending_access[file_path] = time.time()
+            if len(self._pending_access) >= TOUCH_FLUSH_SIZE:
+                self._flush_access()
+                self._conn.commit()
+
+    def _flush_access(self):
+        # 呼び出し側でロック済み（コミットも呼び出し側で行う）
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE entries SET last_access = ? WHERE path = ?",
+            [(accessed, path) for path, accessed in self._pending_access.items()]
+        )
+        self._pending_access.clear()
+
+    def _evict(self):
+        # 上限を超えた分を最終アクセスが古い順に削除（呼び出し側でロック済み）
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM entries").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE path IN"
+                " (SELECT path FROM entries ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+        if total > self.max_bytes:
+            # 新しい順に合計したサイズが上限を超える古いエントリを削除する
+            self._conn.execute(
+                "DELETE FROM entries WHERE path IN"
+                " (SELECT path FROM (SELECT path, SUM(LENGTH(data)) OVER"
+                " (ORDER BY last_access DESC, path ROWS UNBOUNDED PRECEDING) AS total FROM entries)"
+                " WHERE total > ?)",
+                (self.max_bytes,)
+            )
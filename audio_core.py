@@ -0,0 +1,2003 @@
+import os
+import re
+import sys
+import csv
+import json
+import errno
+import math
+import zlib
+import array
+import time
+import shutil
+import tempfile
+import queue
+import threading
+import subprocess
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import gain_tags
+import mp3_gain
+import r128_meter
+from adaptive_concurrency import as_limiter
+from io_scheduler import IOScheduler
+
+# Windowsの場合、STARTUPINFOをインポート
+if os.name == 'nt':
+    from subprocess import STARTUPINFO, STARTF_USESHOWWINDOW
+
+# loudnormの解析パスで使用するターゲット値
+ANALYZE_TARGET_I = -16.0
+LOUDNORM_LRA = 11
+LOUDNORM_TP = -1.5
+
+# 2パス目のloudnormに渡す解析結果のキー（loudnormの出力キー -> オプション名）
+LOUDNORM_MEASURED_KEYS = {
+    'input_i': 'measured_I',
+    'input_tp': 'measured_TP',
+    'input_lra': 'measured_LRA',
+    'input_thresh': 'measured_thresh',
+}
+
+# チャンネルレイアウト名とチャンネル数の対応
+CHANNEL_LAYOUTS = {
+    'mono': 1,
+    'stereo': 2,
+    '2.1': 3,
+    '3.0': 3,
+    'quad': 4,
+    '4.0': 4,
+    '5.0': 5,
+    '5.1': 6,
+    '6.1': 7,
+    '7.1': 8,
+}
+
+# コーデックに応じたエンコーダー
+CODEC_ENCODERS = {
+    'mp3': 'libmp3lame',
+    'aac': 'aac',
+    'vorbis': 'libvorbis',
+    'opus': 'libopus',
+    'flac': 'flac'
+}
+
+# 出力プロファイルでコーデックを指定した場合の出力ファイルの拡張子
+CODEC_EXTENSIONS = {
+    'mp3': '.mp3',
+    'aac': '.m4a',
+    'vorbis': '.ogg',
+    'opus': '.opus',
+    'flac': '.flac'
+}
+
+# 正規化の方法（Normalizer.plan で選択する）
+# copy: 入力をそのまま出力（ハードリンク、できない場合はコピー）、gain: volumeフィルタで一定のゲインのみ適用、
+# loudnorm: loudnormで正規化（未解析、またはゲインだけではトゥルーピークが上限を超える場合）
+NORMALIZE_ACTIONS = ('copy', 'gain', 'loudnorm')
+
+# アートワーク（ビデオストリーム）をコピーできる出力形式（Oggには埋め込めない）
+ARTWORK_EXTENSIONS = ('.mp3', '.m4a', '.flac')
+
+# ディレクトリから追加する対象の拡張子
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.aac', '.m4a', '.flac', '.ogg', '.opus')
+
+# 解析方式（loudnorm: ffmpegのloudnormフィルタ, native: デコードしたPCMをNumPyで測定）
+ANALYSIS_BACKENDS = ('loudnorm', 'native')
+DEFAULT_BACKEND = 'loudnorm'
+# 長いファイルを区間に分けて測定した結果（解析方式の設定によらず使用するため、キャッシュではどちらにも一致させる）
+SEGMENTED_BACKEND = 'segmented'
+
+# 長いファイルを区間に分けて並列に解析する設定
+# しきい値（秒）以上のファイルは、SEGMENT_MIN_SECONDS 以上の区間に分けて同時にデコード・測定する
+DEFAULT_SEGMENT_THRESHOLD = 1800.0
+SEGMENT_MIN_SECONDS = 120.0
+# 区間の前に重ねて読み込む秒数（K特性フィルタ・トゥルーピークの補間の準備に使い、測定値には含めない）
+SEGMENT_WARMUP_SECONDS = 1.0
+# 長さを確認するファイルの最小ビットレート（バイト/秒）。これより小さいファイルはしきい値に届かない
+SEGMENT_MIN_BYTES_PER_SECOND = 4000
+
+# 簡易スキャンの設定
+# ファイル全体に均等に配置した QUICK_SCAN_WINDOWS 個の区間（各 QUICK_SCAN_WINDOW_SECONDS 秒）だけをデコードする
+QUICK_SCAN_WINDOWS = 6
+QUICK_SCAN_WINDOW_SECONDS = 10.0
+# 区間の合計がファイルの長さのこの割合以上になる短いファイルは、全体を解析する
+QUICK_SCAN_MAX_COVERAGE = 0.5
+# 推定値の信頼区間（標準誤差に対する倍率、約95%）と、区間のばらつきが小さい場合の最小の幅（LU）
+QUICK_SCAN_CONFIDENCE = 2.0
+QUICK_SCAN_MIN_MARGIN = 0.5
+# 推定値が信頼区間を含めてターゲットからこれ以上離れる可能性があるファイルを要確認とする（LU）
+QUICK_SCAN_OUTLIER_LU = 2.0
+
+# 解析結果として file_info に保持するキー
+# histogram はモーメンタリーラウドネスのヒストグラム（アルバム単位のラウドネスの計算に使用）
+ANALYSIS_FIELDS = ('lufs', 'channels', 'loudnorm', 'probe', 'histogram')
+
+# FileRecord に保持する入力ファイルの情報（parse_probe_output のキー）
+PROBE_KEYS = ('channels', 'sample_rate', 'codec', 'duration', 'album')
+
+# FileRecord に保持する簡易スキャンの推定値（統合ラウドネスと信頼区間の幅）
+ESTIMATE_KEYS = ('lufs', 'margin')
+
+# アルバム単位で同じゲインを適用するファイルのまとめ方
+# directory: 同じフォルダのファイル、album: アルバム名のタグが同じファイル（タグのないファイルは単独で扱う）
+ALBUM_GROUPINGS = ('directory', 'album')
+
+# loudnormに指定できるターゲットの範囲
+LOUDNORM_MIN_I = -70.0
+LOUDNORM_MAX_I = -5.0
+
+# FileRecord に保持するloudnormの測定値（2パス目で使用するもの）
+RECORD_LOUDNORM_KEYS = tuple(LOUDNORM_MEASURED_KEYS) + ('target_offset', 'backend')
+
+# ffmpegのエラー出力のうち保持する行数（先頭は入力ファイルの情報、末尾はエラーやloudnormの結果）
+OUTPUT_HEAD_LINES = 500
+OUTPUT_TAIL_LINES = 200
+
+# 1ファイルあたりの進捗値の分解能
+PROGRESS_SCALE = 1000
+
+# -progress の出力に含まれるキー（標準エラー出力に混在させた場合の判別に使用）
+PROGRESS_KEYS = frozenset((
+    'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time', 'dup_frames',
+    'drop_frames', 'speed', 'progress', 'frame', 'fps', 'stream_0_0_q',
+))
+
+# 標準出力をバイナリで読み取る単位（バイト）
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 計測値の項目（CSVの列の順序）
+# spawn: 起動から最初の出力まで、open: 入力ファイルを開いて情報を取得するまで、
+# process: デコード・フィルタ・エンコード・書き込み（ffmpeg内部では区別できないためまとめて計測）
+METRIC_FIELDS = ('path', 'stage', 'status', 'exit_code', 'wall', 'spawn', 'open', 'process',
+                 'cpu_user', 'cpu_system', 'max_rss_kb', 'bytes_read', 'bytes_written')
+
+# ゲインタグのみを書き込むモード（None は再エンコード）
+# copy: 音声をストリームコピーした出力ファイルに書き込む、inplace: 元のファイルに書き込む
+TAG_MODES = ('copy', 'inplace')
+
+# 集計の表示で挙げる、時間のかかったファイルの数
+SLOWEST_COUNT = 5
+
+# -benchmark の出力（ffmpegプロセス自身のCPU時間と最大メモリ使用量）
+BENCH_TIME_PATTERN = re.compile(r'bench: utime=([\d.]+)s stime=([\d.]+)s')
+BENCH_RSS_PATTERN = re.compile(r'bench: maxrss=(\d+)\s*KiB')
+
+# ebur128フィルタ（framelog=info）が100msごとに出力するモーメンタリーラウドネス
+MOMENTARY_PATTERN = re.compile(r'\[Parsed_ebur128_\d+ @ [^\]]*\] t:.*?\sM:\s*(-?[\d.]+|-?inf|nan)')
+
+DURATION_PATTERN = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+class FFmpegError(Exception):
+    """ffmpegが異常終了した場合のエラー（メッセージはffmpegの出力）"""
+
+
+class JobCancelled(Exception):
+    """キャンセルによってffmpegの処理が中断された"""
+
+
+class CancelToken:
+    """キャンセル要求と実行中のffmpegプロセスを管理する
+
+    cancel() を呼ぶと、登録されているすべてのプロセスを直ちに終了させる（並列実行中でも有効）。
+    """
+
+    def __init__(self):
+        self.is_cancelled = False
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    def register(self, process):
+        with self._lock:
+            if not self.is_cancelled:
+                self._processes.add(process)
+                return
+        # 起動直後にキャンセルされていた場合
+        kill_process(process)
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def cancel(self):
+        with self._lock:
+            self.is_cancelled = True
+            processes = list(self._processes)
+            self._processes.clear()
+        for process in processes:
+            kill_process(process)
+
+    def check(self):
+        if self.is_cancelled:
+            raise JobCancelled("キャンセルされました")
+
+
+def kill_process(process):
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+def remove_partial_output(output_path, input_path):
+    """途中まで書き込まれた出力ファイルを削除（入力ファイルと同じ場合は削除しない）"""
+    if os.path.abspath(output_path) == os.path.abspath(input_path):
+        return
+    try:
+        os.remove(output_path)
+    except OSError:
+        pass
+
+
+def create_temp_output(output_path, prefix=".normalize-"):
+    """出力先と同じフォルダに一時ファイルを作成してパスを返す
+
+    書き込みが終わってから os.replace で出力先に置き換えることで、中断や異常終了の際に
+    途中まで書き込まれたファイルが出力先に残らないようにする（拡張子はffmpegの形式の判定に使われる）。
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=prefix, suffix=os.path.splitext(output_path)[1],
+                                     dir=os.path.dirname(os.path.abspath(output_path)))
+    os.close(fd)
+    return temp_path
+
+
+def create_staged_output(output_path, staging_dir=None, prefix=".normalize-"):
+    """一時ファイルを staging_dir（Noneの場合は出力先と同じフォルダ）に作成してパスを返す
+
+    出力先がネットワーク共有などの場合に、ffmpegの細かい書き込みをローカルのディスクで受けるために使う。
+    書き込みが終わったら commit_output で出力先に移す。
+    """
+    if staging_dir is None:
+        return create_temp_output(output_path, prefix)
+    os.makedirs(staging_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=prefix, suffix=os.path.splitext(output_path)[1], dir=staging_dir)
+    os.close(fd)
+    return temp_path
+
+
+def commit_output(temp_path, output_path):
+    """書き込みが終わった一時ファイルを出力先に置き換える
+
+    別のファイルシステムにある場合は、出力先のフォルダの一時ファイルにまとめてコピーしてから置き換える
+    （出力先に途中までのファイルが見えないようにする。パーミッションと更新日時もコピーする）。
+    """
+    try:
+        os.replace(temp_path, output_path)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copy_path = create_temp_output(output_path)
+    try:
+        shutil.copy2(temp_path, copy_path)
+        os.replace(copy_path, output_path)
+    except BaseException:
+        remove_partial_output(copy_path, temp_path)
+        raise
+    os.remove(temp_path)
+
+
+def encoder_for(codec):
+    """コーデックに応じたエンコーダー
+
+    CODEC_ENCODERS にないコーデック（WAVのPCMなど）はコーデック名をそのまま渡し、
+    ffmpeg にそのコーデックの既定のエンコーダーを選ばせる。
+    フィルタを通すため -c:a copy は使えない。
+    """
+    return CODEC_ENCODERS.get(codec, codec)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def create_startupinfo():
+    # Windowsの場合、コンソールウィンドウを表示しないようにSTARTUPINFOを設定
+    if os.name != 'nt':
+        return None
+    startupinfo = STARTUPINFO()
+    startupinfo.dwFlags |= STARTF_USESHOWWINDOW
+    return startupinfo
+
+
+def parse_duration(text):
+    match = DURATION_PATTERN.search(text)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def run_ffmpeg(command, on_progress=None, duration=None, cancel_token=None, stdout_reader=None, stats=None,
+               on_line=None, threads=None):
+    """ffmpegを実行して終了コードと標準エラー出力を返す
+
+    標準エラー出力は逐次読み取り、先頭と末尾の一定行数だけを保持する。
+    on_progress を指定すると、-progress の出力を受け取るたびに
+    on_progress(割合, 処理済みの秒数) を呼び出す（長さが不明な場合の割合はNone）。
+    cancel_token でキャンセルされた場合はプロセスを終了させて JobCancelled を送出する。
+    stdout_reader を指定すると、入力ファイルの情報が出力された後に
+    stdout_reader(標準出力のバイナリストリーム, それまでの標準エラー出力) を呼び出す
+    （この場合、-progress は標準エラー出力に出力させる）。
+    stats に辞書を指定すると、処理時間の内訳・CPU時間・最大メモリ使用量・書き込んだバイト数・
+    終了コードを書き込む（項目名は METRIC_FIELDS）。
+    on_line を指定すると標準エラー出力の各行を on_line(行) に渡し、True が返された行は保持しない
+    （フィルタが大量に出力する測定値を、保持する行数の上限に含めずに読み取る場合に使用）。
+    threads を指定すると、デコーダーとフィルタグラフのスレッド数をその値に制限する
+    （並列に実行する場合に、各プロセスがCPU数分のスレッドを作成しないようにする）。
+    """
+    if cancel_token is not None:
+        cancel_token.check()
+
+    progress_pipe = "pipe:1" if stdout_reader is None else "pipe:2"
+    options = ["-progress", progress_pipe, "-nostats"]
+    if stats is not None:
+        options.append("-benchmark")
+    if threads:
+        options.extend(["-threads", str(threads), "-filter_threads", str(threads)])
+    command = [command[0]] + options + list(command[1:])
+    marks = {'start': time.perf_counter()}
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        startupinfo=create_startupinfo()
+    )
+    if cancel_token is not None:
+        cancel_token.register(process)
+
+    head = []
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    state = {'duration': duration, 'dropped': 0, 'position': 0.0}
+    header_ready = threading.Event()
+
+    def handle_progress(line):
+        """-progress の1行を処理する（進捗の行でない場合は False を返す）"""
+        key, separator, value = line.strip().partition('=')
+        if not separator or key not in PROGRESS_KEYS:
+            return False
+        if key == 'total_size' and stats is not None:
+            try:
+                stats['bytes_written'] = int(value)
+            except ValueError:
+                pass
+        elif key == 'out_time_us':
+            try:
+                state['position'] = max(0.0, int(value) / 1000000)
+            except ValueError:
+                pass
+        elif key == 'progress' and on_progress is not None:
+            fraction = None
+            if value == 'end':
+                fraction = 1.0
+            elif state['duration']:
+                fraction = min(1.0, state['position'] / state['duration'])
+            on_progress(fraction, state['position'])
+        return True
+
+    def drain_stderr():
+        for raw_line in process.stderr:
+            marks.setdefault('output', time.perf_counter())
+            line = decode_output_line(raw_line)
+            if stdout_reader is not None and handle_progress(line):
+                continue
+            if stats is not None and line.startswith("bench:"):
+                parse_benchmark_line(line, stats)
+                continue
+            if on_line is not None and on_line(line):
+                continue
+            if len(head) < OUTPUT_HEAD_LINES:
+                head.append(line)
+                if state['duration'] is None:
+                    state['duration'] = parse_duration(line)
+                # 出力側の情報が始まった時点で入力ファイルの情報はすべて出力済み
+                if line.startswith(("Stream mapping:", "Output #")):
+                    marks.setdefault('header', time.perf_counter())
+                    header_ready.set()
+            else:
+                if len(tail) == tail.maxlen:
+                    state['dropped'] += 1
+                tail.append(line)
+        header_ready.set()
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    try:
+        if stdout_reader is None:
+            for raw_line in process.stdout:
+                handle_progress(decode_output_line(raw_line))
+        else:
+            header_ready.wait()
+            stdout_reader(process.stdout, ''.join(head))
+            # 読み取りを途中でやめた場合もffmpegが書き込みで止まらないよう読み捨てる
+            while process.stdout.read(READ_CHUNK_SIZE):
+                pass
+    except BaseException:
+        kill_process(process)
+        raise
+    finally:
+        process.wait()
+        stderr_thread.join()
+        if cancel_token is not None:
+            cancel_token.unregister(process)
+        if stats is not None:
+            marks['end'] = time.perf_counter()
+            stats['exit_code'] = process.returncode
+            stats.update(split_timings(marks))
+    if cancel_token is not None:
+        cancel_token.check()
+
+    output = ''.join(head)
+    if state['dropped']:
+        output += f"... ({state['dropped']}行省略)\n"
+    return process.returncode, output + ''.join(tail)
+
+
+def parse_benchmark_line(line, stats):
+    """-benchmark の出力行からCPU時間（秒）と最大メモリ使用量（KiB）を取り出す"""
+    match = BENCH_TIME_PATTERN.match(line)
+    if match:
+        stats['cpu_user'] = float(match.group(1))
+        stats['cpu_system'] = float(match.group(2))
+        return
+    match = BENCH_RSS_PATTERN.match(line)
+    if match:
+        stats['max_rss_kb'] = int(match.group(1))
+
+
+def split_timings(marks):
+    """run_ffmpeg で記録した時刻から処理時間の内訳（秒）を求める
+
+    出力側の情報がない場合（入力の情報の取得のみ、または入力を開けなかった場合）は、
+    最初の出力から終了までを open とする。
+    """
+    output = marks.get('output')
+    header = marks.get('header')
+    if output is None:
+        return {'spawn': marks['end'] - marks['start'], 'open': None, 'process': None}
+    return {
+        'spawn': output - marks['start'],
+        'open': (header or marks['end']) - output,
+        'process': marks['end'] - header if header is not None else None,
+    }
+
+
+def decode_output_line(raw_line):
+    return raw_line.decode('utf-8', errors='replace').replace('\r\n', '\n')
+
+
+def find_ffmpeg():
+    """PATHからffmpegの実行ファイルを探す（見つからない場合は空文字列）"""
+    executable = "ffmpeg.exe" if os.name == 'nt' else "ffmpeg"
+    return shutil.which(executable) or ""
+
+
+def is_audio_file(file_path):
+    return os.path.splitext(file_path)[1].lower() in AUDIO_EXTENSIONS
+
+
+def iter_audio_files(directory):
+    """ディレクトリ以下のオーディオファイルを再帰的に列挙"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                subdirs = []
+                for entry in sorted(entries, key=lambda e: e.name):
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file() and is_audio_file(entry.name):
+                        yield entry.path
+        except OSError:
+            continue
+        # 名前順に処理されるよう逆順に積む
+        stack.extend(reversed(subdirs))
+
+
+class FileRecord:
+    """ファイル1件の情報と解析結果を保持するレコード（辞書と同じ操作で読み書きできる）
+
+    大量のファイルを扱えるよう __slots__ で属性を固定し、ディレクトリ名は同じフォルダの
+    ファイルで共有する。入力ファイルの情報とloudnormの測定値はタプルで保持し、
+    読み出すときに辞書に戻す（loudnormは2パス目で使用する値のみ保持する）。
+    ラウドネスのヒストグラムは圧縮したバイト列で保持する（pack_histogram）。
+    簡易スキャンの推定値（estimate）は解析結果とは別に保持し、キャッシュには保存しない。
+    """
+
+    __slots__ = ('directory', 'name', 'lufs', 'channels', '_loudnorm', '_probe', '_histogram', '_estimate')
+
+    KEYS = ('path',) + ANALYSIS_FIELDS + ('estimate',)
+
+    def __init__(self, file_path):
+        self.path = file_path
+        self.lufs = None
+        self.channels = None
+        self._loudnorm = None
+        self._probe = None
+        self._histogram = None
+        self._estimate = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, self.name) if self.directory else self.name
+
+    @path.setter
+    def path(self, file_path):
+        directory, self.name = os.path.split(file_path)
+        self.directory = sys.intern(directory)
+
+    @property
+    def loudnorm(self):
+        if self._loudnorm is None:
+            return None
+        return {key: value for key, value in zip(RECORD_LOUDNORM_KEYS, self._loudnorm) if value is not None}
+
+    @loudnorm.setter
+    def loudnorm(self, data):
+        if data is None:
+            self._loudnorm = None
+            return
+        values = []
+        for key in RECORD_LOUDNORM_KEYS:
+            value = data.get(key)
+            if isinstance(value, str):
+                # 数値は文字列より小さいfloatで保持する
+                try:
+                    value = float(value)
+                except ValueError:
+                    value = sys.intern(value)
+            values.append(value)
+        self._loudnorm = tuple(values)
+
+    @property
+    def probe(self):
+        if self._probe is None:
+            return None
+        return dict(zip(PROBE_KEYS, self._probe))
+
+    @probe.setter
+    def probe(self, probe):
+        if probe is None:
+            self._probe = None
+            return
+        codec = probe.get('codec')
+        album = probe.get('album')
+        self._probe = (
+            probe.get('channels'),
+            probe.get('sample_rate'),
+            sys.intern(codec) if codec else codec,
+            probe.get('duration'),
+            # 同じアルバムの曲で共有する
+            sys.intern(album) if album else album,
+        )
+
+    @property
+    def histogram(self):
+        if self._histogram is None:
+            return None
+        return unpack_histogram(self._histogram)
+
+    @histogram.setter
+    def histogram(self, histogram):
+        self._histogram = None if histogram is None else pack_histogram(histogram)
+
+    @property
+    def estimate(self):
+        if self._estimate is None:
+            return None
+        return dict(zip(ESTIMATE_KEYS, self._estimate))
+
+    @estimate.setter
+    def estimate(self, estimate):
+        self._estimate = None if estimate is None else tuple(estimate.get(key) for key in ESTIMATE_KEYS)
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def keys(self):
+        return self.KEYS
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.KEYS]
+
+    def __repr__(self):
+        return f"FileRecord({dict(self.items())!r})"
+
+
+def pack_histogram(histogram):
+    """ヒストグラム {ビン: 件数} を、最小のビンからの連続した件数を圧縮したバイト列にする
+
+    ビンはJSONから読み込んだ文字列でもよい。ファイル内の音量の範囲は狭く、
+    件数は曲の長さに応じて小さいため、型コード・最小のビン・件数の配列（zlib）で表す。
+    """
+    if not histogram:
+        return b''
+    counts = {int(key): int(count) for key, count in histogram.items()}
+    low = min(counts)
+    largest = max(counts.values())
+    typecode = 'B' if largest < 1 << 8 else 'H' if largest < 1 << 16 else 'I'
+    values = array.array(typecode, bytes(array.array(typecode).itemsize * (max(counts) - low + 1)))
+    for key, count in counts.items():
+        values[key - low] = count
+    return typecode.encode('ascii') + low.to_bytes(4, 'little', signed=True) + zlib.compress(values.tobytes())
+
+
+def unpack_histogram(packed):
+    if not packed:
+        return {}
+    values = array.array(packed[:1].decode('ascii'))
+    values.frombytes(zlib.decompress(packed[5:]))
+    low = int.from_bytes(packed[1:5], 'little', signed=True)
+    return {low + i: count for i, count in enumerate(values) if count}
+
+
+def new_file_info(file_path):
+    return FileRecord(file_path)
+
+
+def reset_analysis(file_info):
+    for key in ANALYSIS_FIELDS:
+        file_info[key] = None
+
+
+def parse_probe_output(output):
+    """ffmpegの標準エラー出力から入力ファイルの情報を抽出"""
+    # 出力側のストリーム情報と混同しないよう、入力の情報部分だけを対象にする
+    end = output.find("Output #0")
+    if end != -1:
+        output = output[:end]
+
+    probe = {'channels': None, 'sample_rate': None, 'codec': None, 'duration': None, 'album': None}
+
+    probe['duration'] = parse_duration(output)
+
+    # アルバム名のタグ（Oggのコメントはストリームのメタデータとして出力される）
+    album_match = re.search(r'^\s+album\s*:\s*(.*?)\s*$', output, re.IGNORECASE | re.MULTILINE)
+    if album_match and album_match.group(1):
+        probe['album'] = album_match.group(1)
+
+    # 最初のオーディオストリーム（正規化時に -map 0:a:0 で使用するもの）
+    stream_match = re.search(r'Stream #\d+:\d+\S*: Audio:\s*(\w+)([^\n]*)', output)
+    if stream_match:
+        probe['codec'] = stream_match.group(1)
+        details = stream_match.group(2)
+        sample_rate_match = re.search(r'(\d+)\s*Hz', details)
+        if sample_rate_match:
+            probe['sample_rate'] = int(sample_rate_match.group(1))
+        channels_match = re.search(r'(\d+) channels', details, re.IGNORECASE)
+        if channels_match:
+            probe['channels'] = int(channels_match.group(1))
+        else:
+            for field in details.split(','):
+                layout = field.strip().split('(')[0].lower()
+                if layout in CHANNEL_LAYOUTS:
+                    probe['channels'] = CHANNEL_LAYOUTS[layout]
+                    break
+
+    return probe
+
+
+def extract_json_from_output(output):
+    start = output.find('{')
+    if start == -1:
+        return None
+
+    count = 1
+    for i in range(start + 1, len(output)):
+        if output[i] == '{':
+            count += 1
+        elif output[i] == '}':
+            count -= 1
+            if count == 0:
+                return output[start:i+1]
+    return None
+
+
+def get_measured_values(data):
+    """loudnormの解析結果から2パス目に使用できる数値を取り出す（不完全な場合はNone）"""
+    if not data:
+        return None
+    measured = {}
+    for key in list(LOUDNORM_MEASURED_KEYS) + ['target_offset']:
+        try:
+            value = float(data.get(key))
+        except (TypeError, ValueError):
+            value = None
+        # 無音ファイルなどで -inf が返る場合は測定値として使用できない
+        if value is None or not math.isfinite(value):
+            if key == 'target_offset':
+                continue
+            return None
+        measured[key] = value
+    return measured
+
+
+def probe_file(ffmpeg_path, file_path, cancel_token=None, stats=None):
+    _, probe_output = run_ffmpeg([
+        ffmpeg_path,
+        "-i", file_path
+    ], cancel_token=cancel_token, stats=stats)
+    return parse_probe_output(probe_output)
+
+
+def analyze_file(ffmpeg_path, file_info, cache=None, on_progress=None, cancel_token=None,
+                 backend=DEFAULT_BACKEND, metrics=None, segment_threshold=DEFAULT_SEGMENT_THRESHOLD, threads=None,
+                 histogram=False):
+    """1ファイルを解析して file_info を更新する
+
+    on_progress・cancel_token は run_ffmpeg と同じ。
+    metrics（RunMetrics）を指定すると、キャッシュの参照と解析の処理時間などを記録する。
+    segment_threshold 秒以上のファイルは、NumPyがあれば区間に分けて並列に測定する（Noneの場合は分けない）。
+    threads はffmpegの1プロセスあたりのスレッド数（Noneの場合はffmpegの既定値）。
+    histogram が True の場合（アルバム単位）は loudnorm での解析でもラウドネスのヒストグラムを求める
+    （ネイティブ解析では常に求める）。
+    """
+    file_path = file_info['path']
+
+    # 解析済みで変更されていないファイルはffmpegを起動せずにキャッシュから反映
+    if cache is not None:
+        with measure_stage(metrics, file_path, 'cache') as stats:
+            cached = cache.apply(file_info, (backend, SEGMENTED_BACKEND))
+            # ヒストグラムが必要な場合、ヒストグラムなしで保存された結果は使わない
+            if cached and histogram and file_info.get('histogram') is None:
+                cached = False
+            if stats is not None:
+                stats['status'] = "hit" if cached else "miss"
+        if cached:
+            return file_info
+
+    # 長いファイルは先に長さを確認し、区間に分けて測定する
+    probe = None
+    if segment_threshold and r128_meter.is_available() and may_exceed_duration(file_path, segment_threshold):
+        with measure_stage(metrics, file_path, 'probe') as stats:
+            probe = probe_file(ffmpeg_path, file_path, cancel_token, stats)
+        if not probe['duration'] or probe['duration'] < segment_threshold:
+            probe = None
+
+    # LUFS解析（入力ファイルの情報も同じプロセスの出力から取得する）
+    used_backend = backend if probe is None else SEGMENTED_BACKEND
+    with measure_stage(metrics, file_path, 'analyze', reads_input=True) as stats:
+        if probe is not None:
+            probe, data, measured_histogram = measure_segmented(ffmpeg_path, file_path, probe, on_progress,
+                                                                cancel_token, stats)
+        elif backend == 'native':
+            probe, data, measured_histogram = measure_native(ffmpeg_path, file_path, on_progress, cancel_token,
+                                                             stats, threads)
+        else:
+            probe, data, measured_histogram = measure_loudnorm(ffmpeg_path, file_path, on_progress, cancel_token,
+                                                               stats, threads, histogram)
+        if stats is not None and not (data and data.get('input_i') is not None):
+            stats['status'] = "error"
+    file_info['probe'] = probe
+    file_info['channels'] = probe['channels']
+
+    # 測定に失敗した場合はNoneを設定
+    file_info['lufs'] = None
+    file_info['loudnorm'] = None
+    file_info['histogram'] = None
+    input_i = data.get('input_i') if data else None
+    if input_i is not None:
+        file_info['lufs'] = float(input_i)
+        # 正規化の2パス目で再利用するため測定値をすべて保持
+        file_info['loudnorm'] = data
+        # アルバム単位のラウドネスは、各ファイルのヒストグラムを合算して再デコードせずに求める
+        file_info['histogram'] = measured_histogram
+        if cache is not None:
+            cache.put(file_path, file_info, used_backend)
+    return file_info
+
+
+def measure_loudnorm(ffmpeg_path, file_path, on_progress=None, cancel_token=None, stats=None, threads=None,
+                     histogram=False):
+    """loudnormフィルタで測定し、入力ファイルの情報・loudnormの出力（JSON）・ラウドネスのヒストグラムを返す
+
+    histogram が True の場合、ヒストグラムは同じデコードで ebur128 フィルタが出力する
+    モーメンタリーラウドネス（0.1LU単位）から作成する（False の場合はNone）。
+    ebur128 は100msごとに出力するため、必要な場合のみ追加する。
+    """
+    audio_filter = f"loudnorm=I={ANALYZE_TARGET_I}:LRA={LOUDNORM_LRA}:TP={LOUDNORM_TP}:print_format=json"
+    if histogram:
+        audio_filter = "ebur128=framelog=info," + audio_filter
+    command = [
+        ffmpeg_path,
+        "-i", file_path,
+        "-af", audio_filter,
+        "-f", "null",
+        "-"
+    ]
+    momentary = []
+
+    def read_momentary(line):
+        match = MOMENTARY_PATTERN.match(line)
+        if match is None:
+            return False
+        momentary.append(float(match.group(1)))
+        return True
+
+    _, error = run_ffmpeg(command, on_progress, cancel_token=cancel_token, stats=stats,
+                          on_line=read_momentary if histogram else None, threads=threads)
+
+    json_str = extract_json_from_output(error)
+    data = json.loads(json_str) if json_str else None
+    return parse_probe_output(error), data, r128_meter.loudness_histogram(momentary) if histogram else None
+
+
+def measure_native(ffmpeg_path, file_path, on_progress=None, cancel_token=None, stats=None, threads=None):
+    """デコードしたPCMをr128_meterで測定し、入力ファイルの情報・loudnorm互換の測定値・ヒストグラムを返す"""
+    if not r128_meter.is_available():
+        raise RuntimeError("ネイティブ解析にはNumPyが必要です")
+
+    command = [
+        ffmpeg_path,
+        "-i", file_path,
+        "-map", "0:a:0",
+        "-ar", str(r128_meter.SAMPLE_RATE),
+        "-c:a", "pcm_f32le",
+        "-f", "f32le",
+        "-"
+    ]
+    meters = []
+
+    def read_pcm(stream, header):
+        # 出力はチャンネル数を変換しないので、入力の最初のオーディオストリームと同じ
+        channels = parse_probe_output(header)['channels']
+        if channels:
+            meters.append(r128_meter.measure_stream(stream, channels))
+
+    returncode, error = run_ffmpeg(command, on_progress, cancel_token=cancel_token, stdout_reader=read_pcm,
+                                   stats=stats, threads=threads)
+    probe = parse_probe_output(error)
+    if returncode != 0 or not meters:
+        return probe, None, None
+
+    result = meters[0].result()
+    data = {
+        'input_i': f"{result['integrated']:.2f}",
+        'input_tp': f"{result['true_peak']:.2f}",
+        'input_lra': f"{result['lra']:.2f}",
+        'input_thresh': f"{result['threshold']:.2f}",
+        'backend': 'native',
+    }
+    return probe, data, result['histogram']
+
+
+def may_exceed_duration(file_path, seconds):
+    """ファイルサイズから、長さが seconds 以上の可能性があるか判定する（長さを調べるffmpegの起動を減らす）"""
+    try:
+        return os.path.getsize(file_path) >= seconds * SEGMENT_MIN_BYTES_PER_SECOND
+    except OSError:
+        return False
+
+
+def plan_segments(duration, max_segments=None):
+    """長さ duration 秒のファイルを分ける区間 [(開始秒, 長さ秒またはNone)] を返す
+
+    区間の境界は100ms単位に揃え、各区間の100msごとのエネルギーをつなげると
+    ファイル全体の並びと一致するようにする（最後の区間は長さを指定せず末尾まで読む）。
+    """
+    hops_per_second = r128_meter.SAMPLE_RATE // r128_meter.HOP_SAMPLES
+    count = max(1, min(max_segments or default_workers(), int(duration // SEGMENT_MIN_SECONDS)))
+    total_hops = int(duration * hops_per_second)
+    hops = -(-total_hops // count)
+    segments = []
+    for i in range(count):
+        start = i * hops
+        if start >= total_hops:
+            break
+        length = hops if i < count - 1 else None
+        segments.append((start / hops_per_second, None if length is None else length / hops_per_second))
+    return segments
+
+
+def measure_segmented(ffmpeg_path, file_path, probe, on_progress=None, cancel_token=None, stats=None,
+                      max_segments=None):
+    """長いファイルを区間に分けて並列に測定し、入力ファイルの情報・loudnorm互換の測定値・ヒストグラムを返す
+
+    各区間は前の区間と SEGMENT_WARMUP_SECONDS 重ねてデコードし、重ねた部分はフィルタの準備だけに使う。
+    区間ごとの100msのエネルギーをつなげてゲーティングするため、統合ラウドネス・LRA・トゥルーピークは
+    ファイル全体を1回で測定した場合と同じになる。
+    """
+    duration = probe['duration']
+    segments = plan_segments(duration, max_segments)
+    positions = [0.0] * len(segments)
+    lock = threading.Lock()
+
+    def measure_segment(index):
+        start, length = segments[index]
+
+        def on_position(seconds):
+            if on_progress is None:
+                return
+            with lock:
+                positions[index] = seconds
+                done = sum(positions)
+            on_progress(min(1.0, done / duration), done)
+
+        segment_stats = {}
+        # 区間ごとのプロセスでCPUを分け合うため、各プロセスは1スレッドで実行する
+        measured = measure_range(ffmpeg_path, file_path, start, length, on_position, cancel_token,
+                                 segment_stats if stats is not None else None, threads=1)
+        return measured, segment_stats
+
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        results = list(executor.map(measure_segment, range(len(segments))))
+
+    if stats is not None:
+        merge_process_stats(stats, [result[1] for result in results])
+        stats['status'] = "segmented"
+
+    measured = [result[0] for result in results]
+    if any(segment is None for segment in measured):
+        return probe, None, None
+    result = r128_meter.merge_segments(measured)
+    data = {
+        'input_i': f"{result['integrated']:.2f}",
+        'input_tp': f"{result['true_peak']:.2f}",
+        'input_lra': f"{result['lra']:.2f}",
+        'input_thresh': f"{result['threshold']:.2f}",
+        'backend': 'native',
+    }
+    return probe, data, result['histogram']
+
+
+def measure_range(ffmpeg_path, file_path, start, length, on_position=None, cancel_token=None, stats=None,
+                  threads=None):
+    """start 秒から length 秒（Noneの場合は末尾まで）をデコードして測定する
+
+    (100msごとのエネルギー, トゥルーピーク（振幅）, サンプル数) を返す（失敗した場合はNone）。
+    start の前の SEGMENT_WARMUP_SECONDS も読み込み、フィルタの準備だけに使う。
+    on_position は区間の先頭からの位置（秒）で呼ばれる。
+    """
+    warmup = min(start, SEGMENT_WARMUP_SECONDS)
+    command = [ffmpeg_path]
+    if start > 0:
+        command.extend(["-ss", f"{start - warmup:.3f}"])
+    command.extend(["-i", file_path])
+    if length is not None:
+        command.extend(["-t", f"{length + warmup:.3f}"])
+    command.extend(["-map", "0:a:0", "-ar", str(r128_meter.SAMPLE_RATE), "-c:a", "pcm_f32le", "-f", "f32le", "-"])
+    meters = []
+
+    def read_pcm(stream, header):
+        channels = parse_probe_output(header)['channels']
+        if channels:
+            meters.append(r128_meter.measure_stream(stream, channels,
+                                                    warmup_samples=int(warmup * r128_meter.SAMPLE_RATE)))
+
+    def progress(fraction, media_seconds):
+        if on_position is not None:
+            on_position(max(0.0, media_seconds - warmup))
+
+    returncode, _ = run_ffmpeg(command, progress, cancel_token=cancel_token, stdout_reader=read_pcm, stats=stats,
+                               threads=threads)
+    if returncode != 0 or not meters:
+        return None
+    meter = meters[0]
+    hops = meter.hop_energies()
+    if length is not None:
+        hops = hops[:int(round(length * r128_meter.SAMPLE_RATE / r128_meter.HOP_SAMPLES))]
+    return hops, meter.true_peak, meter.sample_count
+
+
+def merge_process_stats(stats, process_stats):
+    """複数のffmpegプロセスの値を合算する（最大メモリ使用量はプロセスごとの最大値）"""
+    stats['cpu_user'] = sum(item.get('cpu_user') or 0.0 for item in process_stats)
+    stats['cpu_system'] = sum(item.get('cpu_system') or 0.0 for item in process_stats)
+    stats['max_rss_kb'] = max((item.get('max_rss_kb') or 0 for item in process_stats), default=0)
+    stats['exit_code'] = max((item.get('exit_code') or 0 for item in process_stats), key=abs, default=0)
+
+
+def plan_quick_scan(duration, windows=QUICK_SCAN_WINDOWS, window_seconds=QUICK_SCAN_WINDOW_SECONDS):
+    """長さ duration 秒のファイルで簡易スキャンに使う区間の開始位置（秒、100ms単位）のリスト
+
+    ファイルを windows 等分し、それぞれの中央から window_seconds 秒を読む。
+    """
+    hops_per_second = r128_meter.SAMPLE_RATE // r128_meter.HOP_SAMPLES
+    starts = []
+    for i in range(windows):
+        center = (i + 0.5) * duration / windows
+        start = min(max(0.0, center - window_seconds / 2), max(0.0, duration - window_seconds))
+        starts.append(int(start * hops_per_second) / hops_per_second)
+    return starts
+
+
+def quick_scan_file(ffmpeg_path, file_info, cache=None, on_progress=None, cancel_token=None,
+                    backend=DEFAULT_BACKEND, metrics=None, threads=None):
+    """ファイルの一部の区間だけを測定し、統合ラウドネスの推定値を file_info['estimate'] に設定する
+
+    推定値は {'lufs': 推定値, 'margin': 信頼区間の幅（LU）} で、測定できない場合は値をNoneとする。
+    file_info['lufs'] などの解析結果は変更しないため、推定したファイルは未解析のまま扱われる。
+    キャッシュにある、または区間の合計が長さの QUICK_SCAN_MAX_COVERAGE 以上になる短いファイルは
+    analyze_file と同じく全体を解析し、その値を幅0の推定値とする。推定にはNumPyが必要。
+    """
+    if not r128_meter.is_available():
+        raise RuntimeError("簡易スキャンにはNumPyが必要です")
+    file_path = file_info['path']
+    scan_seconds = QUICK_SCAN_WINDOWS * QUICK_SCAN_WINDOW_SECONDS
+    min_duration = scan_seconds / QUICK_SCAN_MAX_COVERAGE
+
+    cached = False
+    if cache is not None:
+        with measure_stage(metrics, file_path, 'cache') as stats:
+            cached = cache.apply(file_info, (backend, SEGMENTED_BACKEND))
+            if stats is not None:
+                stats['status'] = "hit" if cached else "miss"
+
+    # ファイルサイズから明らかに短いファイルは、長さを調べずに全体を解析する
+    probe = None
+    if not cached and may_exceed_duration(file_path, min_duration):
+        with measure_stage(metrics, file_path, 'probe') as stats:
+            probe = probe_file(ffmpeg_path, file_path, cancel_token, stats)
+
+    if cached or probe is None or not probe['duration'] or probe['duration'] < min_duration:
+        if not cached:
+            analyze_file(ffmpeg_path, file_info, None, on_progress, cancel_token, backend, metrics, None, threads)
+            if cache is not None and file_info['lufs'] is not None:
+                cache.put(file_path, file_info, backend)
+        lufs = file_info['lufs']
+        file_info['estimate'] = {'lufs': lufs, 'margin': None if lufs is None else 0.0}
+        return file_info
+
+    duration = probe['duration']
+    starts = plan_quick_scan(duration)
+    measured = []
+    with measure_stage(metrics, file_path, 'quick-scan', reads_input=True) as stats:
+        window_stats = []
+        for i, start in enumerate(starts):
+            def on_position(seconds, done=i * QUICK_SCAN_WINDOW_SECONDS):
+                if on_progress is not None:
+                    position = done + min(seconds, QUICK_SCAN_WINDOW_SECONDS)
+                    on_progress(position / scan_seconds, position)
+
+            window_stats.append({})
+            window = measure_range(ffmpeg_path, file_path, start, QUICK_SCAN_WINDOW_SECONDS, on_position,
+                                   cancel_token, window_stats[-1] if stats is not None else None, threads)
+            if window is not None:
+                measured.append(window[0])
+        if stats is not None:
+            merge_process_stats(stats, window_stats)
+            stats['status'] = "sampled" if measured else "error"
+
+    file_info['probe'] = probe
+    file_info['channels'] = probe['channels']
+    file_info['estimate'] = {'lufs': None, 'margin': None}
+    if measured:
+        lufs, margin = r128_meter.sampled_loudness(measured, len(measured) * QUICK_SCAN_WINDOW_SECONDS / duration,
+                                                   QUICK_SCAN_CONFIDENCE)
+        if math.isfinite(lufs):
+            file_info['estimate'] = {'lufs': lufs, 'margin': max(QUICK_SCAN_MIN_MARGIN, margin)}
+    return file_info
+
+
+def is_outlier(file_info, target_lufs, threshold=QUICK_SCAN_OUTLIER_LU):
+    """ラウドネスが信頼区間を含めてターゲットから threshold LU 以上離れている可能性があるか（要確認）
+
+    解析済みのファイルは測定値で、未解析のファイルは簡易スキャンの推定値で判定する。
+    簡易スキャンをしていないファイルは対象外とし、推定できなかったファイル（無音・デコードの失敗など）は要確認とする。
+    """
+    lufs = file_info.get('lufs')
+    margin = 0.0
+    if lufs is None:
+        estimate = file_info.get('estimate')
+        if estimate is None:
+            return False
+        if estimate['lufs'] is None:
+            return True
+        lufs, margin = estimate['lufs'], estimate['margin']
+    return abs(lufs - target_lufs) + margin > threshold
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class BatchProgress:
+    """バッチ全体の進捗（割合・処理速度・残り時間）を集計する
+
+    各ファイルは任意のキーで start / update / finish を呼び出す（複数スレッドから呼び出し可能）。
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self._active = {}  # キー -> [ファイル名, 割合, 処理済みの秒数]
+        self._finished_seconds = 0.0
+        self._current = None
+        self._start_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def start(self, key, name):
+        with self._lock:
+            self._active[key] = [name, 0.0, 0.0]
+            self._current = key
+
+    def update(self, key, fraction, media_seconds):
+        with self._lock:
+            entry = self._active.get(key)
+            if entry is not None:
+                if fraction is not None:
+                    entry[1] = fraction
+                entry[2] = media_seconds
+                self._current = key
+
+    def finish(self, key):
+        with self._lock:
+            entry = self._active.pop(key, None)
+            if entry is not None:
+                self._finished_seconds += entry[2]
+            self.completed += 1
+
+    def value(self):
+        """進捗値（1ファイルあたり PROGRESS_SCALE）"""
+        with self._lock:
+            done = self.completed + sum(entry[1] for entry in self._active.values())
+        return int(min(done, self.total) * PROGRESS_SCALE)
+
+    def status_text(self):
+        """処理中のファイルと全体の状況を表示用の文字列で返す"""
+        with self._lock:
+            current = self._active.get(self._current)
+        summary = self.summary_text()
+        if current is None:
+            return summary
+        return f"処理中: {current[0]}（{current[1]:.0%}）\n{summary}"
+
+    def summary_text(self):
+        """全体の割合・完了数・処理速度・残り時間を1行で返す"""
+        with self._lock:
+            done = self.completed + sum(entry[1] for entry in self._active.values())
+            media_seconds = self._finished_seconds + sum(entry[2] for entry in self._active.values())
+            completed = self.completed
+        elapsed = time.monotonic() - self._start_time
+        fraction = min(1.0, done / self.total) if self.total else 1.0
+
+        summary = f"全体: {fraction:.0%}（{completed}/{self.total}）"
+        if elapsed > 0 and media_seconds > 0:
+            # 並列に処理している分も含めた、実時間に対する処理速度
+            summary += f"  速度: {media_seconds / elapsed:.1f}x"
+        if 0 < fraction < 1:
+            summary += f"  残り: {format_seconds(elapsed / fraction * (1 - fraction))}"
+        return summary
+
+
+class RunMetrics:
+    """バッチ内の各ファイル・各処理段階の計測値を記録し、段階ごとに集計する
+
+    stage() で囲んだ処理ごとに1件記録する（複数スレッドから呼び出し可能）。
+    ffmpegを実行する段階では、stage() が返す辞書を run_ffmpeg の stats に渡す。
+    """
+
+    def __init__(self):
+        self.records = []
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.elapsed = None
+        self._start_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, file_path, stage, reads_input=False):
+        """処理段階の計測（reads_input の場合は入力ファイル全体を読み込むものとしてサイズを記録）"""
+        record = dict.fromkeys(METRIC_FIELDS)
+        record.update(path=file_path, stage=stage, status="ok")
+        if reads_input:
+            try:
+                record['bytes_read'] = os.path.getsize(file_path)
+            except OSError:
+                pass
+        start = time.perf_counter()
+        try:
+            yield record
+        except JobCancelled:
+            record['status'] = "cancelled"
+            raise
+        except Exception:
+            record['status'] = "error"
+            raise
+        finally:
+            record['wall'] = time.perf_counter() - start
+            with self._lock:
+                self.records.append(record)
+
+    def finish(self):
+        """バッチ全体の経過時間を確定する"""
+        self.elapsed = time.monotonic() - self._start_time
+
+    def stage_totals(self):
+        """処理段階ごとの件数・失敗数・合計時間・最大時間・CPU時間・入出力バイト数"""
+        totals = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            total = totals.setdefault(record['stage'], {
+                'count': 0, 'failed': 0, 'wall': 0.0, 'max_wall': 0.0, 'spawn': 0.0, 'open': 0.0,
+                'process': 0.0, 'cpu': 0.0, 'bytes_read': 0, 'bytes_written': 0,
+            })
+            total['count'] += 1
+            if record['status'] in ("error", "cancelled"):
+                total['failed'] += 1
+            total['max_wall'] = max(total['max_wall'], record['wall'])
+            for key in ('wall', 'spawn', 'open', 'process', 'bytes_read', 'bytes_written'):
+                total[key] += record[key] or 0
+            total['cpu'] += (record['cpu_user'] or 0.0) + (record['cpu_system'] or 0.0)
+        return totals
+
+    def slowest_files(self, count=SLOWEST_COUNT):
+        """合計時間の長い順に (パス, 合計秒数, {処理段階: 秒数}) を返す"""
+        files = {}
+        with self._lock:
+            for record in self.records:
+                stages = files.setdefault(record['path'], {})
+                stages[record['stage']] = stages.get(record['stage'], 0.0) + record['wall']
+        ranked = sorted(files.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        return [(path, sum(stages.values()), stages) for path, stages in ranked[:count]]
+
+    def summary_text(self, count=SLOWEST_COUNT):
+        """段階ごとの集計と時間のかかったファイルを表示用の文字列で返す"""
+        lines = []
+        if self.elapsed is not None:
+            lines.append(f"経過時間: {self.elapsed:.2f}s")
+        lines.append("処理段階ごとの合計:")
+        totals = self.stage_totals()
+        for stage, total in sorted(totals.items(), key=lambda item: item[1]['wall'], reverse=True):
+            line = f"  {stage}: {total['count']}件 {total['wall']:.2f}s（最大 {total['max_wall']:.2f}s"
+            if total['spawn'] or total['cpu']:
+                line += f"、起動 {total['spawn']:.2f}s、入力 {total['open']:.2f}s、処理 {total['process']:.2f}s"
+                line += f"、CPU {total['cpu']:.2f}s"
+            line += "）"
+            if total['failed']:
+                line += f" 失敗 {total['failed']}件"
+            lines.append(line)
+        slowest = self.slowest_files(count)
+        if slowest:
+            lines.append("時間のかかったファイル:")
+            for path, wall, stages in slowest:
+                detail = "、".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items())
+                lines.append(f"  {os.path.basename(path)} {wall:.2f}s（{detail}）")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        with self._lock:
+            records = [dict(record) for record in self.records]
+        return {
+            'started': self.started,
+            'elapsed': self.elapsed,
+            'stages': self.stage_totals(),
+            'slowest': [
+                {'path': path, 'wall': wall, 'stages': stages}
+                for path, wall, stages in self.slowest_files()
+            ],
+            'records': records,
+        }
+
+    def export(self, destination):
+        """計測結果を保存する（拡張子が .csv の場合は1段階1行のCSV、それ以外はJSON）"""
+        if destination.lower().endswith(".csv"):
+            with self._lock:
+                records = list(self.records)
+            with open(destination, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=METRIC_FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(destination, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+                f.write("\n")
+
+
+def measure_stage(metrics, file_path, stage, reads_input=False):
+    """metrics が指定されていれば RunMetrics.stage で計測する（計測しない場合、with の値はNone）"""
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.stage(file_path, stage, reads_input)
+
+
+def input_path(item):
+    """items の要素が読み込むファイルのパス（ファイルの情報でない場合はNone）"""
+    try:
+        return item['path']
+    except (TypeError, KeyError):
+        return None
+
+
+def input_weight(item):
+    """並列数の調整で処理量として数える値（ファイルの場合はサイズ、それ以外は1）"""
+    try:
+        return os.path.getsize(input_path(item))
+    except (TypeError, OSError):
+        return 1
+
+
+def run_parallel(func, items, max_workers=None, on_done=None, readers_per_device=None):
+    """items の各要素に func を並列に適用する
+
+    max_workers は並列数、または ConcurrencyLimiter（Noneの場合は処理量と負荷から自動で調整する）。
+    ファイルは IOScheduler が決める順序で処理し、HDD・ネットワーク共有から同時に読み込む数を
+    readers_per_device 個までにする（Noneの場合は自動、0の場合は制限しない）。
+    デバイスの枠は処理の前の読み込みの間だけ使い、func の並列数は max_workers で決まる。
+    完了するたびに on_done(index, item, result, error) を呼び出す（完了順は不定）。
+    戻り値は items と同じ順序の結果リスト（例外が発生した要素はNone）。
+    """
+    limiter = as_limiter(max_workers)
+    scheduler = IOScheduler([input_path(item) for item in items], readers_per_device)
+    results = [None] * len(items)
+
+    def work():
+        # 各タスクは、並列数の枠を確保してから読み込めるデバイスの次のファイルを1つ取り出して処理する
+        # （デバイスの枠を確保したまま並列数の枠を待たないよう、この順に確保する）
+        with limiter.slot(lambda: input_weight(items[i])):
+            i = scheduler.take()
+            try:
+                scheduler.load(i)
+            finally:
+                scheduler.release(i)
+            try:
+                return i, func(items[i]), None
+            except Exception as e:
+                return i, None, e
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(limiter.maximum, len(items)))) as executor:
+            futures = [executor.submit(work) for _ in items]
+            for future in as_completed(futures):
+                i, results[i], error = future.result()
+                if on_done is not None:
+                    on_done(i, items[i], results[i], error)
+    finally:
+        scheduler.close()
+    return results
+
+
+def run_pipeline(items, analyze, normalize, analyze_workers=None, normalize_workers=None,
+                 queue_size=None, on_analyzed=None, on_normalized=None, readers_per_device=None):
+    """解析と正規化をパイプラインで実行する
+
+    解析が終わったファイルから順に正規化を開始し、解析と正規化をそれぞれの並列数で同時に進める。
+    段の間のキューは queue_size 件までで、正規化が追いつかない場合は解析側が待機する。
+    解析に失敗したファイルも正規化に渡す（正規化側でffmpeg内部の測定にフォールバックする）。
+    analyze_workers / normalize_workers は run_parallel の max_workers と同じ（段ごとに調整する）。
+    解析は run_parallel と同じく IOScheduler の順序と readers_per_device の制限で読み込む
+    （正規化は解析の直後で入力がページキャッシュに残っているため制限しない）。
+    on_analyzed / on_normalized は run_parallel の on_done と同じ引数で、各ワーカースレッドから呼ばれる。
+    戻り値は items と同じ順序の正規化結果リスト（例外が発生した要素はNone）。
+    """
+    analyze_limiter = as_limiter(analyze_workers)
+    normalize_limiter = as_limiter(normalize_workers)
+    results = [None] * len(items)
+
+    scheduler = IOScheduler([input_path(item) for item in items], readers_per_device)
+    ready = queue.Queue(maxsize=queue_size or normalize_limiter.limit * 2)
+
+    def analyze_next():
+        # run_parallel と同じく、並列数の枠を確保してからファイルを取り出す（すべて取り出した場合はNone）
+        i = None
+        with analyze_limiter.slot(lambda: input_weight(items[i]) if i is not None else 0):
+            i = scheduler.take()
+            if i is None:
+                return None
+            try:
+                scheduler.load(i)
+            finally:
+                scheduler.release(i)
+            try:
+                return i, analyze(items[i]), None
+            except Exception as e:
+                return i, None, e
+
+    def analyze_stage():
+        while True:
+            analyzed = analyze_next()
+            if analyzed is None:
+                return
+            i, result, error = analyzed
+            if on_analyzed is not None:
+                try:
+                    on_analyzed(i, items[i], result, error)
+                except Exception:
+                    pass
+            # 空きができるまで待機する（正規化側からの背圧）
+            ready.put(i)
+
+    def normalize_stage():
+        while True:
+            i = ready.get()
+            if i is None:
+                return
+            error = None
+            try:
+                with normalize_limiter.slot(input_weight(items[i])):
+                    results[i] = normalize(items[i])
+            except Exception as e:
+                error = e
+            if on_normalized is not None:
+                try:
+                    on_normalized(i, items[i], results[i], error)
+                except Exception:
+                    pass
+
+    analyzers = [threading.Thread(target=analyze_stage, daemon=True)
+                 for _ in range(max(1, min(analyze_limiter.maximum, len(items))))]
+    normalizers = [threading.Thread(target=normalize_stage, daemon=True)
+                   for _ in range(max(1, min(normalize_limiter.maximum, len(items))))]
+    for thread in analyzers + normalizers:
+        thread.start()
+    for thread in analyzers:
+        thread.join()
+    scheduler.close()
+    for _ in normalizers:
+        ready.put(None)
+    for thread in normalizers:
+        thread.join()
+    return results
+
+
+def measured_true_peak(file_info):
+    """解析時のトゥルーピーク（dBTP、不明な場合はNone）"""
+    try:
+        true_peak = float((file_info.get('loudnorm') or {}).get('input_tp'))
+    except (TypeError, ValueError):
+        return None
+    return true_peak if math.isfinite(true_peak) else None
+
+
+def album_key(file_info, grouping):
+    """アルバム単位で扱うグループのキー（単独で扱うファイルはNone）"""
+    if grouping == 'directory':
+        return os.path.dirname(file_info['path'])
+    if grouping == 'album':
+        return (file_info.get('probe') or {}).get('album')
+    return None
+
+
+def album_loudness(file_list, grouping):
+    """グループごとの統合ラウドネスとトゥルーピークを求めて {パス: (LUFS, dBTP)} を返す
+
+    各ファイルのヒストグラムを合算するので再デコードは不要。ヒストグラムのないファイル
+    （未解析・解析失敗）を含むグループは、曲ごとの正規化になるよう結果に含めない。
+    """
+    groups = {}
+    for file_info in file_list:
+        key = album_key(file_info, grouping)
+        if key is not None:
+            groups.setdefault(key, []).append(file_info)
+
+    result = {}
+    for members in groups.values():
+        histograms = [file_info.get('histogram') for file_info in members]
+        if any(histogram is None for histogram in histograms):
+            continue
+        lufs = r128_meter.histogram_loudness(r128_meter.merge_histograms(histograms))
+        if not math.isfinite(lufs):
+            continue
+        peaks = [peak for peak in map(measured_true_peak, members) if peak is not None]
+        peak = max(peaks) if peaks else None
+        for file_info in members:
+            result[file_info['path']] = (lufs, peak)
+    return result
+
+
+class OutputProfile:
+    """1つのソースから作成する出力の設定（ターゲット・エンコード設定・出力先のサブフォルダ）
+
+    codec は CODEC_ENCODERS のキー（Noneの場合は入力と同じコーデック）。
+    """
+
+    KEYS = ('target_lufs', 'bitrate_mode', 'bitrate', 'sample_rate', 'codec', 'subdirectory')
+
+    def __init__(self, target_lufs, bitrate_mode, bitrate, sample_rate, codec=None, subdirectory=""):
+        self.target_lufs = target_lufs
+        self.bitrate_mode = bitrate_mode
+        self.bitrate = bitrate  # "160k" の形式
+        self.sample_rate = sample_rate  # "44100" の形式
+        self.codec = codec
+        self.subdirectory = subdirectory
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in cls.KEYS if key in data})
+
+    def __repr__(self):
+        return f"OutputProfile({self.to_dict()!r})"
+
+
+# 出力プロファイルの指定で使用できる項目（キー -> OutputProfile の引数名）
+PROFILE_KEYS = {
+    'target': 'target_lufs',
+    'codec': 'codec',
+    'mode': 'bitrate_mode',
+    'bitrate': 'bitrate',
+    'rate': 'sample_rate',
+    'dir': 'subdirectory',
+}
+
+
+def parse_profile(spec, defaults):
+    """出力プロファイルの指定（例: 'target=-14,codec=aac,bitrate=256,dir=streaming'）から OutputProfile を作成
+
+    省略した項目は defaults（OutputProfile）の値を使用する。不正な場合は ValueError を送出する。
+    """
+    values = defaults.to_dict()
+    for item in spec.split(","):
+        key, separator, value = item.partition("=")
+        key = key.strip()
+        value = value.strip()
+        if not separator or key not in PROFILE_KEYS:
+            raise ValueError(f"不明な項目です: {item}")
+        if key == 'target':
+            value = f"{float(value):g}"
+        elif key == 'codec' and value not in CODEC_ENCODERS:
+            raise ValueError(f"コーデックは {', '.join(CODEC_ENCODERS)} のいずれかを指定してください: {value}")
+        elif key == 'mode' and value not in ("VBR", "CBR"):
+            raise ValueError(f"ビットレートモードは VBR か CBR を指定してください: {value}")
+        elif key == 'bitrate':
+            value = f"{int(value)}k"
+        elif key == 'rate':
+            value = str(int(value))
+        values[PROFILE_KEYS[key]] = value
+    return OutputProfile(**values)
+
+
+def parse_profiles(text, defaults):
+    """";" で区切った複数の出力プロファイルの指定から OutputProfile のリストを作成（空の場合はNone）"""
+    specs = [spec.strip() for spec in text.split(";") if spec.strip()]
+    return [parse_profile(spec, defaults) for spec in specs] or None
+
+
+class Normalizer:
+    """正規化の設定を保持し、1ファイルずつ正規化を実行する
+
+    profiles（OutputProfile のリスト）を指定すると、1回のデコードからプロファイルごとの出力を作成する。
+    """
+
+    def __init__(self, ffmpeg_path, output_dir, target_lufs, bitrate_mode, bitrate, sample_rate,
+                 lossless_mp3=False, tag_mode=None, album_grouping=None, profiles=None, tolerance=None,
+                 staging_dir=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.output_dir = output_dir
+        self.target_lufs = target_lufs
+        self.bitrate_mode = bitrate_mode
+        self.bitrate = bitrate  # "160k" の形式
+        self.sample_rate = sample_rate  # "44100" の形式
+        # 解析済みのMP3は再エンコードせず global_gain を書き換える（ビットレート・サンプリング周波数は元のまま）
+        self.lossless_mp3 = lossless_mp3
+        # 再エンコードせずゲインタグのみを書き込む（TAG_MODES のいずれか、Noneの場合は再エンコード）
+        self.tag_mode = tag_mode
+        # アルバム単位で同じゲインを適用する場合のまとめ方（ALBUM_GROUPINGS のいずれか、Noneの場合は曲ごと）
+        self.album_grouping = album_grouping
+        # 複数の出力を作成する場合のプロファイル（Noneの場合は上の設定で1つだけ出力）
+        self.profiles = list(profiles) if profiles else None
+        # ターゲットとの差がこの値（LU）以内のファイルは再エンコードしない（Noneの場合は常にloudnormで正規化）
+        self.tolerance = tolerance
+        self.decisions = {}  # パス -> plan の結果（正規化したファイルごとの方法）
+        # エンコード中の出力を書き込むローカルのフォルダ（Noneの場合は出力先のフォルダ、出力には影響しない）
+        self.staging_dir = staging_dir
+        self.albums = {}  # パス -> (アルバムの統合ラウドネス, トゥルーピーク)（prepare_albums で設定）
+
+    def settings(self):
+        """出力に影響する設定（ジャーナルに記録し、from_settings で同じ設定の Normalizer を作成できる）"""
+        return {
+            'output_dir': self.output_dir,
+            'target_lufs': self.target_lufs,
+            'bitrate_mode': self.bitrate_mode,
+            'bitrate': self.bitrate,
+            'sample_rate': self.sample_rate,
+            'lossless_mp3': self.lossless_mp3,
+            'tag_mode': self.tag_mode,
+            'album_grouping': self.album_grouping,
+            'profiles': [profile.to_dict() for profile in self.profiles] if self.profiles else None,
+            'tolerance': self.tolerance,
+        }
+
+    @classmethod
+    def from_settings(cls, ffmpeg_path, settings, staging_dir=None):
+        settings = dict(settings, staging_dir=staging_dir)
+        if settings.get('profiles'):
+            settings['profiles'] = [OutputProfile.from_dict(profile) for profile in settings['profiles']]
+        return cls(ffmpeg_path, **settings)
+
+    def prepare_albums(self, file_list):
+        """アルバム単位のラウドネスを求める（解析がすべて終わってから、正規化の前に呼び出す）"""
+        self.albums = album_loudness(file_list, self.album_grouping) if self.album_grouping else {}
+        return self.albums
+
+    def target_for(self, file_info, target_lufs=None):
+        """ファイルに適用するターゲットLUFS（target_lufs を省略した場合は self.target_lufs）
+
+        アルバム単位の場合は、アルバム全体が target_lufs になるゲインを各曲に適用するよう、
+        曲とアルバムのラウドネスの差だけずらした値にする（loudnormの範囲に収まらない場合は制限される）。
+        """
+        target = float(self.target_lufs if target_lufs is None else target_lufs)
+        album = self.albums.get(file_info['path'])
+        if album is None or file_info.get('lufs') is None:
+            return target
+        return max(LOUDNORM_MIN_I, min(LOUDNORM_MAX_I, target + file_info['lufs'] - album[0]))
+
+    def output_path(self, file_info, profile=None):
+        """出力先のパス（プロファイルの場合はサブフォルダに、コーデックに応じた拡張子で出力）"""
+        name = os.path.basename(file_info['path'])
+        if profile is None:
+            return os.path.join(self.output_dir, name)
+        if profile.codec is not None:
+            name = os.path.splitext(name)[0] + CODEC_EXTENSIONS[profile.codec]
+        return os.path.join(self.output_dir, profile.subdirectory or "", name)
+
+    def normalize_file(self, file_info, on_progress=None, cancel_token=None, metrics=None, threads=None):
+        """1ファイルを正規化して出力先のパスを返す
+
+        失敗時は FFmpegError を送出する。
+        出力は一時ファイルに書き込み、完了してから出力先に置き換える。
+        キャンセル時は JobCancelled を送出し、途中まで書き込まれた一時ファイルは削除する。
+        metrics（RunMetrics）を指定すると、各処理段階の処理時間などを記録する。
+        threads はffmpegの1プロセスあたりのスレッド数（Noneの場合はffmpegの既定値）。
+        """
+        if self.tag_mode is not None:
+            return self.write_gain_tags(file_info, on_progress, cancel_token, metrics, threads)
+
+        file_path = file_info['path']
+        output_path = self.output_path(file_info)
+
+        # 入力ファイルの情報を取得（解析済みの場合は解析時の情報を再利用）
+        probe = file_info.get('probe')
+        if not probe:
+            with measure_stage(metrics, file_path, 'probe') as stats:
+                probe = probe_file(self.ffmpeg_path, file_path, cancel_token, stats)
+
+        if self.profiles is not None:
+            return self.normalize_profiles(file_info, probe, on_progress, cancel_token, metrics, threads)
+
+        if self.lossless_mp3 and probe.get('codec') == 'mp3' and file_info.get('lufs') is not None:
+            if self.apply_mp3_gain(file_info, probe, output_path, on_progress, cancel_token, metrics):
+                return output_path
+
+        plan = self.plan(file_info, probe)
+        self.decisions[file_path] = plan
+        if plan['action'] == 'copy':
+            with measure_stage(metrics, file_path, 'copy'):
+                self.copy_unchanged(file_path, output_path)
+            if on_progress is not None:
+                on_progress(1.0, probe.get('duration') or 0.0)
+            return output_path
+
+        temp_path = create_staged_output(output_path, self.staging_dir)
+        command = self.build_command(file_info, probe, temp_path, plan)
+        stage = 'gain' if plan['action'] == 'gain' else 'normalize'
+        with measure_stage(metrics, file_path, stage, reads_input=True) as stats:
+            try:
+                returncode, error = run_ffmpeg(command, on_progress, probe.get('duration'), cancel_token,
+                                               stats=stats, threads=threads)
+                if returncode != 0:
+                    raise FFmpegError(error)
+                commit_output(temp_path, output_path)
+            except BaseException:
+                remove_partial_output(temp_path, file_path)
+                raise
+        return output_path
+
+    def plan(self, file_info, probe):
+        """解析結果から、正しい結果になる最も軽い正規化の方法を選ぶ
+
+        戻り値は {'action': NORMALIZE_ACTIONS のいずれか, 'gain': 適用するゲイン（dB）,
+        'resample': サンプリング周波数を変換するか, 'reason': 選んだ理由}。
+        tolerance が None の場合、または未解析の場合は loudnorm（サンプリング周波数は常に指定）。
+        """
+        resample = str(probe.get('sample_rate')) != str(self.sample_rate)
+        if self.tolerance is None:
+            return {'action': 'loudnorm', 'gain': None, 'resample': True, 'reason': "常にloudnormで正規化"}
+        if file_info.get('lufs') is None or get_measured_values(file_info.get('loudnorm')) is None:
+            return {'action': 'loudnorm', 'gain': None, 'resample': True, 'reason': "未解析"}
+
+        gain = self.target_for(file_info) - file_info['lufs']
+        if abs(gain) <= self.tolerance and not resample:
+            return {'action': 'copy', 'gain': 0.0, 'resample': False,
+                    'reason': f"ターゲットとの差 {gain:+.2f} LU が許容差以内"}
+
+        # アルバム単位の場合は、同じゲインを適用するアルバム内の最大値で判定する
+        album = self.albums.get(file_info['path'])
+        true_peak = album[1] if album is not None else measured_true_peak(file_info)
+        if true_peak is not None and true_peak + gain <= LOUDNORM_TP:
+            reason = f"ゲイン {gain:+.2f} dB"
+            if resample:
+                reason += f"、{probe.get('sample_rate')} Hz -> {self.sample_rate} Hz"
+            return {'action': 'gain', 'gain': gain, 'resample': resample, 'reason': reason}
+        return {'action': 'loudnorm', 'gain': None, 'resample': True,
+                'reason': "ゲインのみではトゥルーピークが上限を超える"}
+
+    def copy_unchanged(self, file_path, output_path):
+        """入力ファイルをそのまま出力先に置く（同じファイルシステムならハードリンク）"""
+        if os.path.abspath(file_path) == os.path.abspath(output_path):
+            return output_path
+        temp_path = create_staged_output(output_path, self.staging_dir)
+        try:
+            os.remove(temp_path)
+            try:
+                os.link(file_path, temp_path)
+            except OSError:
+                shutil.copy2(file_path, temp_path)
+            commit_output(temp_path, output_path)
+        except BaseException:
+            remove_partial_output(temp_path, file_path)
+            raise
+        return output_path
+
+    def normalize_profiles(self, file_info, probe, on_progress=None, cancel_token=None, metrics=None, threads=None):
+        """プロファイルごとの出力を1回のffmpegの実行で作成し、出力先のパスのリストを返す
+
+        デコードと解析の測定値は共通で、フィルタグラフ内で分岐させて各プロファイルのターゲットに正規化する。
+        """
+        file_path = file_info['path']
+        outputs = [self.output_path(file_info, profile) for profile in self.profiles]
+        temp_paths = []
+        with measure_stage(metrics, file_path, 'normalize', reads_input=True) as stats:
+            try:
+                for output_path in outputs:
+                    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                    temp_paths.append(create_staged_output(output_path, self.staging_dir))
+                command = self.build_profiles_command(file_info, probe, temp_paths)
+                returncode, error = run_ffmpeg(command, on_progress, probe.get('duration'), cancel_token,
+                                               stats=stats, threads=threads)
+                if returncode != 0:
+                    raise FFmpegError(error)
+                for temp_path, output_path in zip(temp_paths, outputs):
+                    commit_output(temp_path, output_path)
+            except BaseException:
+                for temp_path in temp_paths:
+                    remove_partial_output(temp_path, file_path)
+                raise
+        return outputs
+
+    def build_profiles_command(self, file_info, probe, output_paths):
+        """asplit で分岐させたフィルタグラフから、プロファイルごとに出力するコマンドを作成"""
+        count = len(self.profiles)
+        branches = "".join(f"[s{i}]" for i in range(count))
+        graph = [f"[0:a:0]asplit={count}{branches}"]
+        for i, profile in enumerate(self.profiles):
+            graph.append(f"[s{i}]{self.build_loudnorm_filter(file_info, profile.target_lufs)}[o{i}]")
+
+        command = [
+            self.ffmpeg_path,
+            "-y",
+            "-i", file_info['path'],
+            "-filter_complex", ";".join(graph),
+        ]
+        for i, (profile, output_path) in enumerate(zip(self.profiles, output_paths)):
+            encoder = encoder_for(profile.codec or probe.get('codec') or "mp3")
+            command.extend(["-map", f"[o{i}]"])
+            # 入力と同じ形式、またはアートワークを埋め込める形式の場合はアートワークを保持
+            if profile.codec is None or os.path.splitext(output_path)[1] in ARTWORK_EXTENSIONS:
+                command.extend(["-map", "0:v?", "-c:v", "copy"])
+            command.extend([
+                "-map_metadata", "0",
+                "-ar", profile.sample_rate,
+                "-c:a", encoder,
+            ])
+            command.extend(self.encoder_options(encoder, profile.bitrate_mode, profile.bitrate))
+            command.append(output_path)
+        return command
+
+    def apply_mp3_gain(self, file_info, probe, output_path, on_progress=None, cancel_token=None, metrics=None):
+        """MP3を再エンコードせずに音量を変更する（書き換えられない形式の場合は False を返す）
+
+        音量は1.5dB単位で、解析時のトゥルーピークが LOUDNORM_TP を超えない範囲に抑える
+        （アルバム単位の場合は、同じアルバムの曲が同じ量になるようアルバム内の最大値で判定する）。
+        global_gain の範囲のために変更量を減らした場合は decisions の理由に記録する。
+        """
+        true_peak = measured_true_peak(file_info)
+        album = self.albums.get(file_info['path'])
+        if album is not None:
+            true_peak = album[1]
+        steps = mp3_gain.gain_steps(file_info['lufs'], self.target_for(file_info), true_peak, LOUDNORM_TP)
+
+        duration = probe.get('duration') or 0.0
+
+        def progress(fraction):
+            if on_progress is not None:
+                on_progress(fraction, duration * fraction)
+
+        file_path = file_info['path']
+        check = cancel_token.check if cancel_token is not None else None
+        with measure_stage(metrics, file_path, 'mp3gain', reads_input=True) as stats:
+            try:
+                # どのフレームの global_gain も範囲外にならないよう制限する（mp3gain と同じ）
+                applied = steps
+                if steps:
+                    gain_range = mp3_gain.gain_range(file_path, lambda fraction: progress(fraction / 2), check)
+                    applied = mp3_gain.limit_steps(steps, gain_range)
+                if applied == 0:
+                    self.copy_unchanged(file_path, output_path)
+                else:
+                    temp_path = create_staged_output(output_path, self.staging_dir, prefix=".mp3gain-")
+                    try:
+                        mp3_gain.write_gain(file_path, temp_path, applied,
+                                            lambda fraction: progress(0.5 + fraction / 2), check)
+                        commit_output(temp_path, output_path)
+                    except BaseException:
+                        remove_partial_output(temp_path, file_path)
+                        raise
+            except mp3_gain.MP3FormatError:
+                # フリーフォーマットなどは通常の正規化で処理する
+                if stats is not None:
+                    stats['status'] = "fallback"
+                return False
+            if stats is not None:
+                stats['bytes_written'] = os.path.getsize(output_path)
+        progress(1.0)
+
+        reason = f"global_gain を {applied:+d}（{applied * mp3_gain.GAIN_STEP_DB:+.1f}dB）変更"
+        if applied != steps:
+            reason += f"（global_gain の範囲のため {steps:+d} から制限）"
+        self.decisions[file_path] = {'action': 'copy' if applied == 0 else 'gain',
+                                     'gain': applied * mp3_gain.GAIN_STEP_DB, 'resample': False, 'reason': reason}
+        return True
+
+    def write_gain_tags(self, file_info, on_progress=None, cancel_token=None, metrics=None, threads=None):
+        """音声は変更せず、ReplayGain / R128 のゲインのタグのみを書き込んで出力先のパスを返す
+
+        未解析のファイルはここで解析する。inplace の場合は元のファイルに書き込む。
+        アルバム単位の場合はアルバムゲインのタグも書き込む。
+        """
+        file_path = file_info['path']
+        container = gain_tags.container_of(file_path)
+        if container is None:
+            raise gain_tags.TagError(f"この形式にはゲインタグを書き込めません: {os.path.basename(file_path)}")
+
+        if file_info.get('lufs') is None:
+            analyze_file(self.ffmpeg_path, file_info, cancel_token=cancel_token, metrics=metrics, threads=threads)
+            if file_info['lufs'] is None:
+                raise FFmpegError("ラウドネスを測定できませんでした")
+        probe = file_info.get('probe') or {}
+        tags = gain_tags.track_gain_tags(file_info['lufs'], measured_true_peak(file_info), probe.get('codec'))
+        album = self.albums.get(file_info['path'])
+        if album is not None:
+            tags.update(gain_tags.album_gain_tags(album[0], album[1], probe.get('codec')))
+
+        output_path = file_path if self.tag_mode == 'inplace' else self.output_path(file_info)
+        with measure_stage(metrics, file_path, 'tags', reads_input=output_path != file_path) as stats:
+            if container == 'mp4':
+                gain_tags.write_mp4_tags(file_path, output_path, tags)
+                return output_path
+
+            # 音声をストリームコピーした一時ファイルを作成して置き換える
+            temp_path = create_staged_output(output_path, self.staging_dir, prefix=".tags-")
+            try:
+                command = self.build_tag_command(file_path, temp_path, tags, container)
+                returncode, error = run_ffmpeg(command, on_progress, probe.get('duration'), cancel_token,
+                                               stats=stats)
+                if returncode != 0:
+                    raise FFmpegError(error)
+                if output_path == file_path:
+                    shutil.copymode(file_path, temp_path)
+                commit_output(temp_path, output_path)
+            except BaseException:
+                remove_partial_output(temp_path, file_path)
+                raise
+        return output_path
+
+    def build_tag_command(self, file_path, output_path, tags, container):
+        command = [
+            self.ffmpeg_path,
+            "-y",
+            "-i", file_path,
+            "-map", "0:a",
+            "-map", "0:v?",  # アートワークがあれば保持
+            "-c", "copy",
+            "-map_metadata", "0",
+        ]
+        for key, value in tags.items():
+            command.extend(["-metadata", f"{key}={value}"])
+            # Ogg（Vorbis・Opus）のコメントはストリームのメタデータから書き込まれる
+            if container == 'ogg':
+                command.extend(["-metadata:s:a:0", f"{key}={value}"])
+        command.append(output_path)
+        return command
+
+    def build_command(self, file_info, probe, output_path, plan=None):
+        # コーデックに応じたエンコーダーを選択
+        codec = probe.get('codec') or "mp3"
+        encoder = encoder_for(codec)
+
+        # ゲインのみの場合はvolumeフィルタを使用する（loudnormは内部で192kHzに変換するため重い）
+        if plan is not None and plan['action'] == 'gain':
+            audio_filter = f"volume={plan['gain']:.2f}dB"
+        else:
+            audio_filter = self.build_loudnorm_filter(file_info)
+
+        # 正規化コマンドを作成
+        normalize_command = [
+            self.ffmpeg_path,
+            "-y",
+            "-i", file_info['path'],
+            "-af", audio_filter,
+        ]
+        # loudnormの出力は192kHzのため常に指定し、それ以外は異なる場合のみ変換する
+        if plan is None or plan['resample']:
+            normalize_command.extend(["-ar", self.sample_rate])  # 指定されたサンプリング周波数を使用
+        normalize_command.extend([
+            "-c:a", encoder,
+            "-map_metadata", "0",
+            "-map", "0:a:0",  # オーディオストリームのマッピング
+            "-map", "0:v?",   # ビデオストリーム（アートワーク）があれば保持
+            "-c:v", "copy",   # ビデオ（アートワーク）はそのままコピー
+        ])
+
+        # エンコーダー固有のオプションを設定
+        normalize_command.extend(self.encoder_options(encoder, self.bitrate_mode, self.bitrate))
+        normalize_command.append(output_path)
+        return normalize_command
+
+    def encoder_options(self, encoder, bitrate_mode, bitrate):
+        """エンコーダーとビットレートモードに応じたオプション"""
+        if encoder == 'libmp3lame':
+            if bitrate_mode == "VBR":
+                # VBRの場合、品質値を設定（0が最高品質、9が最低品質）
+                quality = {
+                    "320k": "0",
+                    "256k": "1",
+                    "192k": "2",
+                    "128k": "4"
+                }.get(bitrate, "2")
+                return ["-q:a", quality]
+            # CBR
+            return [
+                "-b:a", bitrate,
+                "-cbr", "1"  # CBRモードを強制
+            ]
+        if encoder == 'aac':
+            return [
+                "-b:a", bitrate,
+                "-strict", "experimental"
+            ]
+        if encoder == 'libvorbis':
+            if bitrate_mode == "VBR":
+                quality = {
+                    "320k": "8",
+                    "256k": "7",
+                    "192k": "6",
+                    "128k": "4"
+                }.get(bitrate, "6")
+                return ["-q:a", quality]
+            return ["-b:a", bitrate]
+        # その他のエンコーダーはシンプルにビットレートを指定
+        return ["-b:a", bitrate]
+
+    def build_loudnorm_filter(self, file_info, target_lufs=None):
+        """loudnormフィルタ文字列を作成（解析済みなら測定値を渡して線形の2パス目にする）"""
+        target = self.target_for(file_info, target_lufs)
+        loudnorm = f"loudnorm=I={target:g}:LRA={LOUDNORM_LRA}:TP={LOUDNORM_TP}"
+
+        measured = get_measured_values(file_info.get('loudnorm'))
+        if measured is None:
+            # 未解析の場合はffmpeg内部で測定させる
+            return f"{loudnorm}:linear=true"
+
+        for key, option in LOUDNORM_MEASURED_KEYS.items():
+            loudnorm += f":{option}={measured[key]}"
+        # target_offsetは解析時のターゲットに対する値なので、同じターゲットの場合のみ使用
+        if measured.get('target_offset') is not None and target == ANALYZE_TARGET_I:
+            loudnorm += f":offset={measured['target_offset']}"
+        return f"{loudnorm}:linear=true"
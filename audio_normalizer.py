@@ -1,18 +1,30 @@
 import os
 import sys
-import re
-import subprocess
-import json
+import time
+import tempfile
+import threading
+from collections import Counter
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileDialog, QPushButton,
                             QLineEdit, QLabel, QVBoxLayout, QHBoxLayout, QWidget,
-                            QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView,
-                            QProgressDialog, QComboBox, QDesktopWidget)
-from PyQt5.QtCore import Qt, QSettings, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QFontDatabase, QIcon
-
-# Windowsの場合、STARTUPINFOをインポート
-if os.name == 'nt':
-    from subprocess import STARTUPINFO, STARTF_USESHOWWINDOW
+                            QMessageBox, QTableView, QHeaderView, QAbstractItemView,
+                            QProgressDialog, QComboBox, QDesktopWidget, QSpinBox, QCheckBox,
+                            QDoubleSpinBox)
+from PyQt5.QtCore import Qt, QSettings, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QFontDatabase, QIcon, QDoubleValidator
+from adaptive_concurrency import ConcurrencyLimiter
+from analysis_cache import AnalysisCache, DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES
+from audio_core import (DEFAULT_BACKEND, DEFAULT_SEGMENT_THRESHOLD, NORMALIZE_ACTIONS, PROGRESS_SCALE, BatchProgress,
+                        CancelToken, JobCancelled, Normalizer, OutputProfile, RunMetrics, analyze_file,
+                        find_ffmpeg, iter_audio_files, new_file_info, parse_profiles, quick_scan_file,
+                        reset_analysis, run_parallel, run_pipeline)
+from file_table_model import (CHANNEL_FILTERS, COLUMN_CHANNELS, COLUMN_DIRECTORY, COLUMN_LUFS, COLUMN_NAME,
+                              FileFilterProxyModel, FileTableModel)
+from job_journal import JobJournal
+import r128_meter
+
+# フォルダの検索結果をテーブルに追加する間隔（件数・秒）
+SCAN_BATCH_SIZE = 5000
+SCAN_BATCH_INTERVAL = 0.3
 
 def init_font():
     # システムのデフォルトフォントを使用
@@ -21,271 +33,358 @@ def init_font():
     return system_font
 
 class AnalyzeWorker(QThread):
-    progress = pyqtSignal(int, str)  # 進捗と現在のファイル名
-    finished = pyqtSignal(list)  # 処理結果
+    progress = pyqtSignal(int, str)  # 進捗値（1ファイルあたり PROGRESS_SCALE）と状況の表示
+    finished = pyqtSignal(int)  # 解析できたファイル数（結果は file_list のレコードに直接書き込まれる）
     error = pyqtSignal(str)  # エラーメッセージ
+    file_analyzed = pyqtSignal(int)  # 解析が終わったファイルの file_list 上の位置
 
-    def __init__(self, file_list, ffmpeg_path):
+    def __init__(self, file_list, ffmpeg_path, max_workers=None, cache=None, backend=DEFAULT_BACKEND,
+                 metrics=None, segment_threshold=DEFAULT_SEGMENT_THRESHOLD, ffmpeg_threads=None,
+                 readers_per_device=None, quick_scan=False, histogram=False):
         super().__init__()
         self.file_list = file_list  # 元のリストを参照として保持
+        # 簡易スキャン（一部の区間だけを測定して推定値を求める）
+        self.quick_scan = quick_scan
+        # アルバム単位のラウドネス用にヒストグラムも求める
+        self.histogram = histogram
         self.ffmpeg_path = ffmpeg_path
-        self.is_cancelled = False
+        self.cache = cache  # 解析結果キャッシュ（Noneの場合は使用しない）
+        self.backend = backend  # 解析方式（ANALYSIS_BACKENDS のいずれか）
+        # この秒数以上のファイルは区間に分けて並列に解析する（Noneの場合は分けない）
+        self.segment_threshold = segment_threshold
+        self.metrics = metrics  # 処理時間の計測（RunMetrics、Noneの場合は計測しない）
+        # 同時に実行するffmpegプロセス数とffmpegのスレッド数（未指定時は処理量と負荷から自動で調整）
+        self.limiter = ConcurrencyLimiter(max_workers, ffmpeg_threads)
+        # 同じデバイスから同時に読み込むファイル数（Noneの場合はHDD・ネットワーク共有のみ制限）
+        self.readers_per_device = readers_per_device
+        self.cancel_token = CancelToken()
+        self.batch = BatchProgress(len(file_list))
+
+    @property
+    def is_cancelled(self):
+        return self.cancel_token.is_cancelled
+
+    def cancel(self):
+        """実行中のffmpegプロセスを終了させて解析を中断する"""
+        self.cancel_token.cancel()
 
     def run(self):
-        results = []
-        for i, file_info in enumerate(self.file_list):
-            if self.is_cancelled:
-                break
-
-            file_path = file_info['path']
-            self.progress.emit(i, os.path.basename(file_path))
+        self.batch = BatchProgress(len(self.file_list))
 
-            try:
-                # Windowsの場合、STARTUPINFOを設定
-                startupinfo = None
-                if os.name == 'nt':
-                    startupinfo = STARTUPINFO()
-                    startupinfo.dwFlags |= STARTF_USESHOWWINDOW
-
-                # まずチャンネル数を取得
-                probe_command = [
-                    self.ffmpeg_path,
-                    "-i", file_path
-                ]
-                probe_process = subprocess.Popen(
-                    probe_command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    encoding='utf-8',
-                    errors='replace',
-                    startupinfo=startupinfo
-                )
-                _, probe_output = probe_process.communicate()
-
-                # チャンネル数を検出（より正確な方法）
-                channels_match = re.search(r'(\d+) channels', probe_output, re.IGNORECASE)
-                if channels_match:
-                    file_info['channels'] = int(channels_match.group(1))
-                else:
-                    # 従来のステレオ/モノラル検出をフォールバックとして使用
-                    stereo_match = re.search(r'stereo', probe_output, re.IGNORECASE)
-                    mono_match = re.search(r'mono', probe_output, re.IGNORECASE)
-                    file_info['channels'] = 2 if stereo_match else 1 if mono_match else None
-
-                # LUFS解析
-                command = [
-                    self.ffmpeg_path,
-                    "-i", file_path,
-                    "-af", "loudnorm=I=-16:LRA=11:TP=-1.5:print_format=json",
-                    "-f", "null",
-                    "-"
-                ]
-                process = subprocess.Popen(
-                    command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    encoding='utf-8',
-                    errors='replace',
-                    startupinfo=startupinfo
-                )
-                output, error = process.communicate()
-
-                json_str = self.extract_json_from_output(error)
-                if json_str:
-                    data = json.loads(json_str)
-                    input_i = data.get('input_i')
-                    if input_i is not None:
-                        file_info['lufs'] = float(input_i)
-                        results.append(file_info)
-                        self.progress.emit(i + 1, "")
-                        continue
-
-                # JSONの解析に失敗した場合のみNoneを設定
-                file_info['lufs'] = None
-                results.append(file_info)
-                self.progress.emit(i + 1, "")
-
-            except Exception as e:
-                file_info['lufs'] = None
-                file_info['channels'] = None
-                results.append(file_info)
-                self.error.emit(f"解析エラー: {file_path}\n{str(e)}")
-                self.progress.emit(i + 1, "")
+        # 各ファイルを並列に解析し、結果は各レコードに直接書き込む
+        results = run_parallel(self.analyze_file, self.file_list, self.limiter, self.file_done,
+                               self.readers_per_device)
+        if self.metrics is not None:
+            self.metrics.finish()
 
         if not self.is_cancelled:
-            self.finished.emit(results)
-
-    def extract_json_from_output(self, output):
-        start = output.find('{')
-        if start == -1:
+            self.finished.emit(sum(1 for result in results if result is not None))
+
+    def file_done(self, i, file_info, result, error):
+        if error is not None:
+            reset_analysis(file_info)
+            if not isinstance(error, JobCancelled):
+                if self.quick_scan:
+                    # 推定できなかったファイルとして要確認にする
+                    file_info['estimate'] = {'lufs': None, 'margin': None}
+                self.error.emit(f"解析エラー: {file_info['path']}\n{str(error)}")
+        self.file_analyzed.emit(i)
+        self.batch.finish(file_info['path'])
+        self.emit_progress()
+
+    def analyze_file(self, file_info):
+        """1ファイルを解析して file_info を返す（キャンセル時は None を返す）"""
+        if self.is_cancelled:
             return None
 
-        count = 1
-        for i in range(start + 1, len(output)):
-            if output[i] == '{':
-                count += 1
-            elif output[i] == '}':
-                count -= 1
-                if count == 0:
-                    return output[start:i+1]
-        return None
+        file_path = file_info['path']
+        self.batch.start(file_path, os.path.basename(file_path))
+        self.emit_progress()
+
+        def on_progress(fraction, media_seconds):
+            self.batch.update(file_path, fraction, media_seconds)
+            self.emit_progress()
+
+        if self.quick_scan:
+            return quick_scan_file(self.ffmpeg_path, file_info, self.cache, on_progress, self.cancel_token,
+                                   self.backend, self.metrics, self.limiter.ffmpeg_threads())
+        return analyze_file(self.ffmpeg_path, file_info, self.cache, on_progress, self.cancel_token,
+                            self.backend, self.metrics, self.segment_threshold, self.limiter.ffmpeg_threads(),
+                            self.histogram)
+
+    def emit_progress(self):
+        self.progress.emit(self.batch.value(), self.batch.status_text())
 
 
 class NormalizeWorker(QThread):
-    progress = pyqtSignal(int, str)  # 進捗と現在のファイル名
+    progress = pyqtSignal(int, str)  # 進捗値（1ファイルあたり PROGRESS_SCALE）と状況の表示
     finished = pyqtSignal(int, list)  # 成功数とエラーリスト
     error = pyqtSignal(str)  # エラーメッセージ
 
-    def __init__(self, file_list, ffmpeg_path, output_dir, target_lufs, bitrate_mode, bitrate, sample_rate):
+    def __init__(self, file_list, normalizer, max_workers=None, metrics=None, journal=None, ffmpeg_threads=None,
+                 readers_per_device=None):
         super().__init__()
         self.file_list = file_list
+        self.normalizer = normalizer
+        self.metrics = metrics
+        self.journal = journal  # 処理状態を記録するジャーナル（JobJournal、Noneの場合は記録しない）
+        self.limiter = ConcurrencyLimiter(max_workers, ffmpeg_threads)
+        self.readers_per_device = readers_per_device
+        self.cancel_token = CancelToken()
+        self.batch = BatchProgress(len(file_list))
+        self._success_files = 0
+        self._error_files = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_cancelled(self):
+        return self.cancel_token.is_cancelled
+
+    def cancel(self):
+        """実行中のffmpegプロセスを終了させて正規化を中断する（途中までの出力は削除される）"""
+        self.cancel_token.cancel()
+
+    def run(self):
+        self.batch = BatchProgress(len(self.file_list))
+        self._success_files = 0
+        self._error_files = []
+
+        # アルバム単位の場合は解析済みのファイルからアルバムのラウドネスを求める
+        self.normalizer.prepare_albums(self.file_list)
+        run_parallel(self.normalize_file, self.file_list, self.limiter, self.file_done, self.readers_per_device)
+        if self.metrics is not None:
+            self.metrics.finish()
+
+        self.finished.emit(self._success_files, self._error_files)
+
+    def file_done(self, i, file_info, result, error):
+        file_path = file_info['path']
+        if isinstance(error, JobCancelled):
+            error = None
+        with self._lock:
+            if error is not None:
+                self._error_files.append((file_path, str(error)))
+            elif result is not None:
+                self._success_files += 1
+        record_journal(self.journal, file_path, result, error)
+        if error is not None:
+            self.error.emit(f"正規化エラー: {file_path}\n{str(error)}")
+        self.batch.finish(file_path)
+        self.emit_progress()
+
+    def normalize_file(self, file_info):
+        """1ファイルを正規化して出力先のパスを返す（キャンセル時は None を返す）"""
+        if self.is_cancelled:
+            return None
+
+        file_path = file_info['path']
+        # 再開したバッチで完了済みのファイルは出力をそのまま使う
+        completed = self.journal.completed_output(file_path) if self.journal is not None else None
+        if completed is not None:
+            return completed
+        self.batch.start(file_path, os.path.basename(file_path))
+        self.emit_progress()
+
+        def on_progress(fraction, media_seconds):
+            self.batch.update(file_path, fraction, media_seconds)
+            self.emit_progress()
+
+        return self.normalizer.normalize_file(file_info, on_progress, self.cancel_token, self.metrics,
+                                              self.limiter.ffmpeg_threads())
+
+    def emit_progress(self):
+        self.progress.emit(self.batch.value(), self.batch.status_text())
+
+
+class PipelineWorker(QThread):
+    progress = pyqtSignal(int, str)  # 進捗値（解析と正規化の合計、1処理あたり PROGRESS_SCALE）と状況の表示
+    finished = pyqtSignal(int, list)  # 成功数とエラーリスト
+    error = pyqtSignal(str)  # エラーメッセージ
+    file_analyzed = pyqtSignal(int)  # 解析が終わったファイルの file_list 上の位置
+
+    def __init__(self, file_list, ffmpeg_path, normalizer, analyze_workers=None,
+                 normalize_workers=None, cache=None, backend=DEFAULT_BACKEND, metrics=None, journal=None,
+                 segment_threshold=DEFAULT_SEGMENT_THRESHOLD, ffmpeg_threads=None, readers_per_device=None):
+        super().__init__()
+        self.file_list = file_list  # 元のリストを参照として保持
         self.ffmpeg_path = ffmpeg_path
-        self.output_dir = output_dir
-        self.target_lufs = target_lufs
-        self.bitrate_mode = bitrate_mode
-        # "160 kbps" -> "160k" の形式に変換
-        self.bitrate = bitrate.split()[0] + "k"
-        self.sample_rate = sample_rate.split()[0]  # "44100 Hz" -> "44100"
-        self.is_cancelled = False
+        self.normalizer = normalizer
+        self.journal = journal  # 処理状態を記録するジャーナル（JobJournal、Noneの場合は記録しない）
+        # 段ごとの並列数とffmpegのスレッド数（未指定時は処理量と負荷から自動で調整）
+        self.analyze_limiter = ConcurrencyLimiter(analyze_workers, ffmpeg_threads)
+        self.normalize_limiter = ConcurrencyLimiter(normalize_workers, ffmpeg_threads)
+        self.readers_per_device = readers_per_device
+        self.cache = cache
+        self.backend = backend
+        self.metrics = metrics
+        self.segment_threshold = segment_threshold
+        self.cancel_token = CancelToken()
+        # 解析と正規化をそれぞれ1件として集計する
+        self.batch = BatchProgress(len(file_list) * 2)
+        self._analyzed = 0
+        self._normalized = 0
+        self._success_files = 0
+        self._error_files = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_cancelled(self):
+        return self.cancel_token.is_cancelled
+
+    def cancel(self):
+        """実行中のffmpegプロセスを終了させて処理を中断する（途中までの出力は削除される）"""
+        self.cancel_token.cancel()
 
     def run(self):
-        success_files = 0
-        error_files = []
-
-        # Windowsの場合、STARTUPINFOを設定
-        startupinfo = None
-        if os.name == 'nt':
-            startupinfo = STARTUPINFO()
-            startupinfo.dwFlags |= STARTF_USESHOWWINDOW
-
-        for i, file_info in enumerate(self.file_list):
-            if self.is_cancelled:
-                break
-
-            file_path = file_info['path']
-            output_path = os.path.join(
-                self.output_dir,
-                f"{os.path.basename(file_path)}"
+        self.batch = BatchProgress(len(self.file_list) * 2)
+        self._analyzed = 0
+        self._normalized = 0
+        self._success_files = 0
+        self._error_files = []
+
+        if self.normalizer.album_grouping:
+            # アルバム単位ではアルバム内のすべての曲の測定値が揃ってから正規化する
+            run_parallel(self.analyze_file, self.file_list, self.analyze_limiter, self.analyze_done,
+                         self.readers_per_device)
+            self.normalizer.prepare_albums(self.file_list)
+            run_parallel(self.normalize_file, self.file_list, self.normalize_limiter, self.normalize_done,
+                         self.readers_per_device)
+        else:
+            # 解析が終わったファイルから順に正規化する
+            run_pipeline(
+                self.file_list,
+                self.analyze_file,
+                self.normalize_file,
+                self.analyze_limiter,
+                self.normalize_limiter,
+                on_analyzed=self.analyze_done,
+                on_normalized=self.normalize_done,
+                readers_per_device=self.readers_per_device
             )
+        if self.metrics is not None:
+            self.metrics.finish()
 
-            self.progress.emit(i, os.path.basename(file_path))
+        self.finished.emit(self._success_files, self._error_files)
+
+    def analyze_file(self, file_info):
+        if self.is_cancelled:
+            return None
+        # 完了済みのファイルは解析も省く（アルバム単位ではアルバムのラウドネスに測定値が必要）
+        if not self.normalizer.album_grouping and self.completed_output(file_info) is not None:
+            return None
+        key = ('analyze', file_info['path'])
+        self.batch.start(key, f"{os.path.basename(file_info['path'])}（解析）")
+        self.emit_progress()
+        return analyze_file(self.ffmpeg_path, file_info, self.cache, self.progress_callback(key),
+                            self.cancel_token, self.backend, self.metrics, self.segment_threshold,
+                            self.analyze_limiter.ffmpeg_threads(), bool(self.normalizer.album_grouping))
+
+    def normalize_file(self, file_info):
+        if self.is_cancelled:
+            return None
+        completed = self.completed_output(file_info)
+        if completed is not None:
+            return completed
+        key = ('normalize', file_info['path'])
+        self.batch.start(key, f"{os.path.basename(file_info['path'])}（正規化）")
+        self.emit_progress()
+        return self.normalizer.normalize_file(file_info, self.progress_callback(key), self.cancel_token,
+                                              self.metrics, self.normalize_limiter.ffmpeg_threads())
+
+    def completed_output(self, file_info):
+        """再開したバッチで完了済みのファイルの出力先（ジャーナルを使用しない場合や未完了の場合はNone）"""
+        if self.journal is None:
+            return None
+        return self.journal.completed_output(file_info['path'])
+
+    def progress_callback(self, key):
+        def on_progress(fraction, media_seconds):
+            self.batch.update(key, fraction, media_seconds)
+            self.emit_progress()
+        return on_progress
+
+    def analyze_done(self, i, file_info, result, error):
+        if error is not None:
+            reset_analysis(file_info)
+            if not isinstance(error, JobCancelled):
+                self.error.emit(f"解析エラー: {file_info['path']}\n{str(error)}")
+        self.file_analyzed.emit(i)
+        with self._lock:
+            self._analyzed += 1
+        self.batch.finish(('analyze', file_info['path']))
+        self.emit_progress()
+
+    def normalize_done(self, i, file_info, result, error):
+        file_path = file_info['path']
+        if isinstance(error, JobCancelled):
+            error = None
+        with self._lock:
+            if error is not None:
+                self._error_files.append((file_path, str(error)))
+            elif result is not None:
+                self._success_files += 1
+            self._normalized += 1
+        record_journal(self.journal, file_path, result, error)
+        if error is not None:
+            self.error.emit(f"正規化エラー: {file_path}\n{str(error)}")
+        self.batch.finish(('normalize', file_path))
+        self.emit_progress()
+
+    def emit_progress(self):
+        with self._lock:
+            analyzed = self._analyzed
+            normalized = self._normalized
+        total = len(self.file_list)
+        text = f"解析 {analyzed}/{total}・正規化 {normalized}/{total}\n{self.batch.status_text()}"
+        self.progress.emit(self.batch.value(), text)
+
+
+def record_journal(journal, file_path, result, error):
+    """正規化の結果をジャーナルに記録する（キャンセルされたファイルは未処理のまま残す）"""
+    if journal is None:
+        return
+    if error is not None:
+        journal.mark_failed(file_path, str(error))
+    elif result is not None:
+        journal.mark_done(file_path, result)
+
+
+class DirectoryScanWorker(QThread):
+    files_found = pyqtSignal(list)  # 見つかったファイルの file_info（まとめて通知）
+    finished = pyqtSignal(int)  # 見つかったファイル数
+
+    def __init__(self, directories, cache=None):
+        super().__init__()
+        self.directories = directories
+        self.cache = cache
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def run(self):
+        found = 0
+        batch = []
+        last_emit = time.monotonic()
+        for directory in self.directories:
+            for file_path in iter_audio_files(directory):
+                if self.is_cancelled:
+                    return
+                file_info = new_file_info(os.path.normpath(file_path))
+                # 解析済みのファイルはキャッシュの値をすぐに表示
+                if self.cache is not None:
+                    self.cache.apply(file_info)
+                batch.append(file_info)
+                found += 1
+                # テーブルの更新回数を抑えるため、一定の件数・時間ごとにまとめて通知
+                if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_emit >= SCAN_BATCH_INTERVAL:
+                    self.files_found.emit(batch)
+                    batch = []
+                    last_emit = time.monotonic()
+        if batch:
+            self.files_found.emit(batch)
+        self.finished.emit(found)
 
-            try:
-                # Windowsの場合、STARTUPINFOを設定
-                startupinfo = None
-                if os.name == 'nt':
-                    startupinfo = STARTUPINFO()
-                    startupinfo.dwFlags |= STARTF_USESHOWWINDOW
-
-                # 入力ファイルの情報を取得
-                probe_command = [
-                    self.ffmpeg_path,
-                    "-i", file_path
-                ]
-
-                probe_process = subprocess.Popen(
-                    probe_command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    encoding='utf-8',
-                    errors='replace',
-                    startupinfo=startupinfo
-                )
-                _, probe_output = probe_process.communicate()
-
-                # 各種パラメータを抽出
-                sample_rate_match = re.search(r'(\d+)\s*Hz', probe_output)
-                codec_match = re.search(r'Audio:\s*(\w+)', probe_output)
-
-                sample_rate = sample_rate_match.group(1) if sample_rate_match else "44100"
-                codec = codec_match.group(1) if codec_match else "mp3"
-
-                # コーデックに応じたエンコーダーを選択
-                codec_map = {
-                    'mp3': 'libmp3lame',
-                    'aac': 'aac',
-                    'vorbis': 'libvorbis',
-                    'opus': 'libopus',
-                    'flac': 'flac'
-                }
-                encoder = codec_map.get(codec, 'copy')
-
-                # 正規化コマンドを作成
-                normalize_command = [
-                    self.ffmpeg_path,
-                    "-y",
-                    "-i", file_path,
-                    "-af", f"loudnorm=I={self.target_lufs}:LRA=11:TP=-1.5:linear=true",
-                    "-ar", self.sample_rate,  # 指定されたサンプリング周波数を使用
-                    "-c:a", encoder,
-                    "-map_metadata", "0",
-                    "-map", "0:a:0",  # オーディオストリームのマッピング
-                    "-map", "0:v?",   # ビデオストリーム（アートワーク）があれば保持
-                    "-c:v", "copy",   # ビデオ（アートワーク）はそのままコピー
-                ]
-
-                # エンコーダー固有のオプションを設定
-                if encoder == 'libmp3lame':
-                    if self.bitrate_mode == "VBR":
-                        # VBRの場合、品質値を設定（0が最高品質、9が最低品質）
-                        quality = {
-                            "320k": "0",
-                            "256k": "1",
-                            "192k": "2",
-                            "128k": "4"
-                        }.get(self.bitrate, "2")
-                        normalize_command.extend(["-q:a", quality])
-                    else:  # CBR
-                        normalize_command.extend([
-                            "-b:a", self.bitrate,
-                            "-cbr", "1"  # CBRモードを強制
-                        ])
-                elif encoder == 'aac':
-                    normalize_command.extend([
-                        "-b:a", self.bitrate,
-                        "-strict", "experimental"
-                    ])
-                elif encoder == 'libvorbis':
-                    if self.bitrate_mode == "VBR":
-                        quality = {
-                            "320k": "8",
-                            "256k": "7",
-                            "192k": "6",
-                            "128k": "4"
-                        }.get(self.bitrate, "6")
-                        normalize_command.extend(["-q:a", quality])
-                    else:
-                        normalize_command.extend(["-b:a", self.bitrate])
-                else:
-                    # その他のエンコーダーはシンプルにビットレートを指定
-                    normalize_command.extend(["-b:a", self.bitrate])
-
-                normalize_command.append(output_path)
-
-                process = subprocess.Popen(
-                    normalize_command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    encoding='utf-8',
-                    errors='replace',
-                    startupinfo=startupinfo
-                )
-                _, error = process.communicate()
-
-                if process.returncode == 0:
-                    success_files += 1
-                    self.progress.emit(i + 1, "")
-                else:
-                    error_files.append((file_path, error))
-                    self.error.emit(f"正規化エラー: {file_path}\n{error}")
-                    self.progress.emit(i + 1, "")
-
-            except Exception as e:
-                error_files.append((file_path, str(e)))
-                self.error.emit(f"正規化エラー: {file_path}\n{str(e)}")
-                self.progress.emit(i + 1, "")
-
-        self.finished.emit(success_files, error_files)
 
 class AudioNormalizer(QMainWindow):
     def __init__(self):
@@ -307,13 +406,18 @@ class AudioNormalizer(QMainWindow):
         # システムフォントを設定
         self.setFont(init_font())
 
-        self.file_list = []  # [{'path': file_path, 'lufs': None}, ...]
+        self.file_list = []  # FileRecord のリスト（解析結果はワーカーが直接書き込む）
+        self.stopping_workers = []  # キャンセル後、スレッドの終了を待っているワーカー
+        self.scan_workers = []  # フォルダを検索中のワーカー
+        self.last_metrics = None  # 直前の処理の計測結果（RunMetrics）
         self.output_dir = ""
         self.ffmpeg_path = ""
         self.default_lufs = "-13"
 
         self.settings = QSettings("audio_normalizer.ini", QSettings.IniFormat)
         self.load_settings()
+        self.analysis_cache = self.open_analysis_cache()
+        self.job_journal = self.open_job_journal()
 
         central_widget = QWidget(self)
         self.setCentralWidget(central_widget)
@@ -323,23 +427,60 @@ class AudioNormalizer(QMainWindow):
         file_button_layout = QHBoxLayout()
         self.add_file_button = QPushButton("ファイルを追加")
         self.add_file_button.clicked.connect(self.select_files)
+        self.add_directory_button = QPushButton("フォルダを追加")
+        self.add_directory_button.clicked.connect(self.select_directory)
         self.clear_file_button = QPushButton("ファイル一覧をクリア")
         self.clear_file_button.clicked.connect(self.clear_files)
         file_button_layout.addWidget(self.add_file_button)
+        file_button_layout.addWidget(self.add_directory_button)
         file_button_layout.addWidget(self.clear_file_button)
         layout.addLayout(file_button_layout)
 
-        # ファイル一覧テーブル
-        self.file_table = QTableWidget()
-        self.file_table.setColumnCount(4)  # チャンネル列を追加
-        self.file_table.setHorizontalHeaderLabels(["ファイル名", "ディレクトリ", "チャンネル", "LUFS"])
+        # 絞り込み条件
+        filter_layout = QHBoxLayout()
+        channel_filter_label = QLabel("チャンネル:")
+        self.channel_filter_combo = QComboBox()
+        for label, channel_filter in CHANNEL_FILTERS:
+            self.channel_filter_combo.addItem(label, channel_filter)
+        self.channel_filter_combo.currentIndexChanged.connect(self.apply_filter)
+        lufs_filter_label = QLabel("LUFS:")
+        self.lufs_min_edit = QLineEdit()
+        self.lufs_min_edit.setPlaceholderText("下限")
+        self.lufs_max_edit = QLineEdit()
+        self.lufs_max_edit.setPlaceholderText("上限")
+        for edit in (self.lufs_min_edit, self.lufs_max_edit):
+            edit.setValidator(QDoubleValidator())
+            edit.setMaximumWidth(80)
+            edit.textChanged.connect(self.apply_filter)
+        filter_layout.addWidget(channel_filter_label)
+        filter_layout.addWidget(self.channel_filter_combo)
+        filter_layout.addWidget(lufs_filter_label)
+        filter_layout.addWidget(self.lufs_min_edit)
+        filter_layout.addWidget(QLabel("〜"))
+        filter_layout.addWidget(self.lufs_max_edit)
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
+        # ファイル一覧テーブル（file_list を直接参照するモデルを、並べ替え・絞り込み用のプロキシ経由で表示）
+        self.file_model = FileTableModel(self.file_list, self)
+        self.file_proxy = FileFilterProxyModel(self)
+        self.file_proxy.setSourceModel(self.file_model)
+        self.file_table = QTableView()
+        self.file_table.setModel(self.file_proxy)
+        self.file_table.setSortingEnabled(True)
+        self.file_table.sortByColumn(-1, Qt.AscendingOrder)  # 追加した順に表示
         header = self.file_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
-        header.setSectionResizeMode(1, QHeaderView.Stretch)
-        header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
-        header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COLUMN_NAME, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COLUMN_DIRECTORY, QHeaderView.Stretch)
+        header.setSectionResizeMode(COLUMN_CHANNELS, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COLUMN_LUFS, QHeaderView.ResizeToContents)
+        # 列幅は表示中の行だけから計算する（行の追加のたびに全行の内容を調べない）
+        header.setResizeContentsPrecision(0)
+        # 行の高さを固定して、大量の行でも高さの計算を省く
+        self.file_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.file_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         # テーブルを編集不可に設定
-        self.file_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.file_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.file_table)
 
         # 解析・正規化ボタンのレイアウト
@@ -348,8 +489,23 @@ class AudioNormalizer(QMainWindow):
         self.analyze_button.clicked.connect(self.analyze_files)
         self.normalize_button = QPushButton("正規化")
         self.normalize_button.clicked.connect(self.normalize_files)
+        self.pipeline_button = QPushButton("解析して正規化")
+        self.pipeline_button.clicked.connect(self.analyze_and_normalize_files)
+        # 大量のファイルを一部の区間だけで測定し、ターゲットから離れていそうなファイルだけを解析する
+        self.quick_scan_button = QPushButton("簡易スキャン")
+        self.quick_scan_button.clicked.connect(self.quick_scan_files)
+        self.analyze_outliers_button = QPushButton("要確認のファイルを解析")
+        self.analyze_outliers_button.clicked.connect(self.analyze_outlier_files)
         analyze_normalize_layout.addWidget(self.analyze_button)
+        analyze_normalize_layout.addWidget(self.quick_scan_button)
+        analyze_normalize_layout.addWidget(self.analyze_outliers_button)
         analyze_normalize_layout.addWidget(self.normalize_button)
+        analyze_normalize_layout.addWidget(self.pipeline_button)
+        # 異常終了や中断で途中になったバッチを、完了済みのファイルを除いて再開する
+        self.resume_button = QPushButton("中断したバッチを再開")
+        self.resume_button.clicked.connect(self.resume_batch)
+        self.update_resume_button()
+        analyze_normalize_layout.addWidget(self.resume_button)
         layout.addLayout(analyze_normalize_layout)
 
         # 出力先ディレクトリ
@@ -361,6 +517,26 @@ class AudioNormalizer(QMainWindow):
         output_layout.addWidget(output_label)
         output_layout.addWidget(self.output_edit)
         output_layout.addWidget(output_button)
+        # 出力方式（ゲインタグのみの場合は再エンコードせず、プレーヤーが音量を調整する）
+        output_mode_label = QLabel("出力方式:")
+        self.output_mode_combo = QComboBox()
+        self.output_mode_combo.addItem("再エンコード", "")
+        self.output_mode_combo.addItem("ゲインタグのみ（出力先にコピー）", "copy")
+        self.output_mode_combo.addItem("ゲインタグのみ（元のファイルに書き込む）", "inplace")
+        output_mode_index = self.output_mode_combo.findData(self.settings.value("tag_mode", ""))
+        self.output_mode_combo.setCurrentIndex(max(output_mode_index, 0))
+        output_layout.addWidget(output_mode_label)
+        output_layout.addWidget(self.output_mode_combo)
+        # アルバム単位（同じグループの曲に同じゲインを適用し、曲の間の音量差を保つ）
+        album_label = QLabel("アルバム単位:")
+        self.album_combo = QComboBox()
+        self.album_combo.addItem("しない", "")
+        self.album_combo.addItem("フォルダごと", "directory")
+        self.album_combo.addItem("アルバム名のタグごと", "album")
+        album_index = self.album_combo.findData(self.settings.value("album_grouping", ""))
+        self.album_combo.setCurrentIndex(max(album_index, 0))
+        output_layout.addWidget(album_label)
+        output_layout.addWidget(self.album_combo)
         layout.addLayout(output_layout)
 
         # LUFS設定とエンコード設定のレイアウト
@@ -371,6 +547,9 @@ class AudioNormalizer(QMainWindow):
         self.lufs_edit = QLineEdit(self.settings.value("target_lufs", self.default_lufs))
         encode_layout.addWidget(lufs_label)
         encode_layout.addWidget(self.lufs_edit)
+        # 簡易スキャンの後にターゲットを変えた場合は要確認の判定をやり直す
+        self.lufs_edit.editingFinished.connect(
+            lambda: self.file_model.outlier_target is not None and self.update_outlier_target())
 
         # サンプリング周波数設定
         sample_rate_label = QLabel("サンプリング周波数:")
@@ -409,8 +588,116 @@ class AudioNormalizer(QMainWindow):
         encode_layout.addWidget(bitrate_label)
         encode_layout.addWidget(self.bitrate_combo)
 
+        # MP3のロスレス音量調整（解析済みのMP3は再エンコードせずに音量を変更）
+        self.lossless_mp3_check = QCheckBox("MP3は再エンコードしない")
+        self.lossless_mp3_check.setToolTip("解析済みのMP3は1.5dB単位で音量だけを変更します（元に戻す情報をタグに保存）")
+        self.lossless_mp3_check.setChecked(str(self.settings.value("lossless_mp3", "false")).lower() == "true")
+        encode_layout.addWidget(self.lossless_mp3_check)
+
+        # ターゲットとの差が許容差以内のファイルはコピーし、トゥルーピークに余裕があれば音量の変更のみ行う
+        self.tolerance_check = QCheckBox("許容差:")
+        self.tolerance_check.setToolTip("ターゲットとの差がこの値以内のファイルは再エンコードせずにコピーします\n"
+                                        "トゥルーピークに余裕がある場合はloudnormの代わりに音量の変更のみ行います")
+        self.tolerance_check.setChecked(str(self.settings.value("use_tolerance", "false")).lower() == "true")
+        self.tolerance_spin = QDoubleSpinBox()
+        self.tolerance_spin.setRange(0.0, 3.0)
+        self.tolerance_spin.setSingleStep(0.1)
+        self.tolerance_spin.setDecimals(1)
+        self.tolerance_spin.setSuffix(" LU")
+        self.tolerance_spin.setValue(float(self.settings.value("tolerance", 0.5)))
+        self.tolerance_spin.setEnabled(self.tolerance_check.isChecked())
+        self.tolerance_check.toggled.connect(self.tolerance_spin.setEnabled)
+        encode_layout.addWidget(self.tolerance_check)
+        encode_layout.addWidget(self.tolerance_spin)
+
+        # エンコード中の出力はローカルの一時フォルダに書き込み、完了後に出力先に移す
+        self.staging_check = QCheckBox("一時フォルダで出力を作成")
+        self.staging_check.setToolTip("出力先がネットワーク共有などの場合に、エンコード中の書き込みを"
+                                      "ローカルの一時フォルダで行い、完了後に出力先へ移します")
+        self.staging_check.setChecked(str(self.settings.value("use_staging", "false")).lower() == "true")
+        encode_layout.addWidget(self.staging_check)
+
         layout.addLayout(encode_layout)
 
+        # 出力プロファイル（1回のデコードから、ターゲットやエンコード設定の異なる複数の出力を作成する）
+        profiles_layout = QHBoxLayout()
+        profiles_label = QLabel("出力プロファイル:")
+        self.profiles_edit = QLineEdit(self.settings.value("output_profiles", ""))
+        self.profiles_edit.setPlaceholderText(
+            "例: target=-14,codec=aac,bitrate=256,dir=streaming; target=-16,codec=mp3,bitrate=128,dir=podcast")
+        self.profiles_edit.setToolTip("出力ごとに ; で区切って指定します（空の場合は上の設定で1つ出力）\n"
+                                      "項目: target, codec, mode, bitrate, rate, dir（省略した項目は上の設定の値）")
+        profiles_layout.addWidget(profiles_label)
+        profiles_layout.addWidget(self.profiles_edit)
+        layout.addLayout(profiles_layout)
+
+        # 並列数設定
+        workers_layout = QHBoxLayout()
+        workers_label = QLabel("解析の並列数:")
+        # 0は自動（CPU数から始めて処理量と負荷で調整）
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(0, 64)
+        self.workers_spin.setSpecialValueText("自動")
+        self.workers_spin.setValue(int(self.settings.value("max_workers", 0)))
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.workers_spin)
+        normalize_workers_label = QLabel("正規化の並列数:")
+        self.normalize_workers_spin = QSpinBox()
+        self.normalize_workers_spin.setRange(0, 64)
+        self.normalize_workers_spin.setSpecialValueText("自動")
+        self.normalize_workers_spin.setValue(int(self.settings.value("normalize_workers", 0)))
+        workers_layout.addWidget(normalize_workers_label)
+        workers_layout.addWidget(self.normalize_workers_spin)
+        threads_label = QLabel("ffmpegのスレッド数:")
+        self.threads_spin = QSpinBox()
+        self.threads_spin.setRange(0, 64)
+        self.threads_spin.setSpecialValueText("自動")
+        self.threads_spin.setToolTip("ffmpegの1プロセスあたりのスレッド数（自動ではCPU数を並列数で分けます）")
+        self.threads_spin.setValue(int(self.settings.value("ffmpeg_threads", 0)))
+        workers_layout.addWidget(threads_label)
+        workers_layout.addWidget(self.threads_spin)
+        # 同じデバイスから同時に読み込むファイル数（自動ではHDD・ネットワーク共有のみ制限）
+        readers_label = QLabel("デバイスごとの読み込み数:")
+        self.readers_spin = QSpinBox()
+        self.readers_spin.setRange(0, 64)
+        self.readers_spin.setSpecialValueText("自動")
+        self.readers_spin.setToolTip("同じディスク・ネットワーク共有から同時に読み込むファイル数"
+                                     "（自動ではHDDとネットワーク共有は2つまで）")
+        self.readers_spin.setValue(int(self.settings.value("readers_per_device", 0)))
+        workers_layout.addWidget(readers_label)
+        workers_layout.addWidget(self.readers_spin)
+        backend_label = QLabel("解析方式:")
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItem("loudnorm（ffmpeg）", "loudnorm")
+        # NumPyがない環境ではネイティブ解析を選択できない
+        if r128_meter.is_available():
+            self.backend_combo.addItem("ネイティブ（NumPy）", "native")
+        backend_index = self.backend_combo.findData(self.settings.value("analysis_backend", DEFAULT_BACKEND))
+        self.backend_combo.setCurrentIndex(max(backend_index, 0))
+        workers_layout.addWidget(backend_label)
+        workers_layout.addWidget(self.backend_combo)
+        # 長いファイルの分割解析（NumPyがある場合のみ、指定した分数以上のファイルを区間に分けて並列に解析）
+        segment_label = QLabel("分割解析:")
+        self.segment_spin = QSpinBox()
+        self.segment_spin.setRange(0, 1440)
+        self.segment_spin.setSuffix(" 分以上")
+        self.segment_spin.setSpecialValueText("しない")
+        self.segment_spin.setValue(int(self.settings.value("segment_threshold_minutes",
+                                                           int(DEFAULT_SEGMENT_THRESHOLD // 60))))
+        self.segment_spin.setEnabled(r128_meter.is_available())
+        workers_layout.addWidget(segment_label)
+        workers_layout.addWidget(self.segment_spin)
+        # 処理時間の計測（有効な場合のみ各処理段階の時間などを記録し、処理後に内訳を表示）
+        self.metrics_check = QCheckBox("処理時間を計測")
+        self.metrics_check.setChecked(str(self.settings.value("collect_metrics", "false")).lower() == "true")
+        self.export_metrics_button = QPushButton("計測結果を保存")
+        self.export_metrics_button.setEnabled(False)
+        self.export_metrics_button.clicked.connect(self.export_metrics)
+        workers_layout.addWidget(self.metrics_check)
+        workers_layout.addWidget(self.export_metrics_button)
+        workers_layout.addStretch()
+        layout.addLayout(workers_layout)
+
         # FFmpegパス設定
         ffmpeg_layout = QHBoxLayout()
         ffmpeg_label = QLabel("ffmpegの実行ファイルパス:")
@@ -423,15 +710,73 @@ class AudioNormalizer(QMainWindow):
         layout.addLayout(ffmpeg_layout)
 
         self.setAcceptDrops(True)
-        self.update_file_table()
 
     def closeEvent(self, event):
         self.save_settings()
+        self.cancel_scans()
+        # キャンセル済みのワーカーはffmpegを終了させているので、すぐに終了する
+        for worker in self.stopping_workers:
+            worker.wait()
+        if self.analysis_cache is not None:
+            self.analysis_cache.close()
+        if self.job_journal is not None:
+            self.job_journal.close()
         event.accept()
 
+    def open_analysis_cache(self):
+        """設定ファイルと同じ場所に解析結果キャッシュを開く"""
+        cache_path = os.path.join(
+            os.path.dirname(os.path.abspath(self.settings.fileName())),
+            "audio_normalizer_cache.db"
+        )
+        try:
+            return AnalysisCache(
+                cache_path,
+                max_entries=int(self.settings.value("cache_max_entries", DEFAULT_MAX_ENTRIES)),
+                use_content_hash=str(self.settings.value("cache_use_hash", "false")).lower() == "true",
+                max_bytes=int(self.settings.value("cache_max_bytes", DEFAULT_MAX_BYTES))
+            )
+        except Exception as e:
+            self.report_init_error(
+                "キャッシュ初期化エラー",
+                f"解析結果キャッシュを開けませんでした（キャッシュを使わずに続行します）:\n{str(e)}"
+            )
+            return None
+
+    def open_job_journal(self):
+        """設定ファイルと同じ場所に正規化のジャーナルを開く"""
+        journal_path = os.path.join(
+            os.path.dirname(os.path.abspath(self.settings.fileName())),
+            "audio_normalizer_job.db"
+        )
+        try:
+            return JobJournal(journal_path)
+        except Exception as e:
+            self.report_init_error(
+                "ジャーナル初期化エラー",
+                f"ジャーナルを開けませんでした（中断したバッチは再開できません）:\n{str(e)}"
+            )
+            return None
+
+    def report_init_error(self, title, message):
+        """起動時の初期化エラーをステータスバーに表示し、ウィンドウの表示後に警告する"""
+        self.statusBar().showMessage(title)
+        QTimer.singleShot(0, lambda: QMessageBox.warning(self, title, message))
+
+    def update_resume_button(self):
+        self.resume_button.setEnabled(self.job_journal is not None and self.job_journal.has_unfinished())
+
+    def begin_journal(self, normalizer, file_list, analyze):
+        """新しいバッチとして設定とファイル一覧をジャーナルに記録する（使用できない場合はNoneを返す）"""
+        if self.job_journal is None:
+            return None
+        settings = {'analyze': analyze, 'normalizer': normalizer.settings()}
+        self.job_journal.begin(settings, [file_info['path'] for file_info in file_list])
+        return self.job_journal
+
     def load_settings(self):
         self.output_dir = self.settings.value("output_dir", "")
-        self.ffmpeg_path = self.settings.value("ffmpeg_path", self.find_ffmpeg())
+        self.ffmpeg_path = self.settings.value("ffmpeg_path", find_ffmpeg())
 
     def save_settings(self):
         self.settings.setValue("output_dir", self.output_dir)
@@ -440,15 +785,20 @@ class AudioNormalizer(QMainWindow):
         self.settings.setValue("sample_rate", self.sample_rate_combo.currentText().split()[0])
         self.settings.setValue("bitrate_mode", self.mode_combo.currentText())
         self.settings.setValue("bitrate", self.bitrate_combo.currentText().split()[0])
-
-    def find_ffmpeg(self):
-        ffmpeg_path = ""
-        for path in os.environ["PATH"].split(os.pathsep):
-            ffmpeg = os.path.join(path, "ffmpeg.exe")
-            if os.path.isfile(ffmpeg):
-                ffmpeg_path = ffmpeg
-                break
-        return ffmpeg_path
+        self.settings.setValue("max_workers", self.workers_spin.value())
+        self.settings.setValue("normalize_workers", self.normalize_workers_spin.value())
+        self.settings.setValue("ffmpeg_threads", self.threads_spin.value())
+        self.settings.setValue("readers_per_device", self.readers_spin.value())
+        self.settings.setValue("use_staging", self.staging_check.isChecked())
+        self.settings.setValue("analysis_backend", self.backend_combo.currentData())
+        self.settings.setValue("segment_threshold_minutes", self.segment_spin.value())
+        self.settings.setValue("collect_metrics", self.metrics_check.isChecked())
+        self.settings.setValue("lossless_mp3", self.lossless_mp3_check.isChecked())
+        self.settings.setValue("use_tolerance", self.tolerance_check.isChecked())
+        self.settings.setValue("tolerance", self.tolerance_spin.value())
+        self.settings.setValue("tag_mode", self.output_mode_combo.currentData())
+        self.settings.setValue("album_grouping", self.album_combo.currentData())
+        self.settings.setValue("output_profiles", self.profiles_edit.text())
 
     def select_output_dir(self):
         options = QFileDialog.Options()
@@ -475,20 +825,70 @@ class AudioNormalizer(QMainWindow):
             event.acceptProposedAction()
 
     def dropEvent(self, event):
+        file_paths = []
+        directories = []
         for url in event.mimeData().urls():
             file_path = url.toLocalFile()
-            if os.path.isfile(file_path):
-                self.add_file(file_path)
-        self.update_file_table()
+            if os.path.isdir(file_path):
+                directories.append(file_path)
+            elif os.path.isfile(file_path):
+                file_paths.append(file_path)
+        self.add_files(file_paths)
+        if directories:
+            self.scan_directories(directories)
 
     def add_file(self, file_path):
-        # 重複チェック
-        if not any(f['path'] == file_path for f in self.file_list):
-            self.file_list.append({'path': file_path, 'lufs': None, 'channels': None})
+        self.add_files([file_path])
+
+    def add_files(self, file_paths):
+        """ファイルをまとめて追加（登録済みのファイルは除外）"""
+        file_infos = []
+        for file_path in file_paths:
+            file_path = os.path.normpath(file_path)
+            if self.file_model.contains(file_path):
+                continue
+            file_info = new_file_info(file_path)
+            # 解析済みのファイルはキャッシュの値をすぐに表示
+            if self.analysis_cache is not None:
+                self.analysis_cache.apply(file_info)
+            file_infos.append(file_info)
+        self.file_model.append_files(file_infos)
+
+    def scan_directories(self, directories):
+        """フォルダ以下のオーディオファイルをバックグラウンドで検索して追加"""
+        worker = DirectoryScanWorker(directories, self.analysis_cache)
+        worker.files_found.connect(self.handle_files_found)
+        worker.finished.connect(lambda found: self.handle_scan_finished(worker, found))
+        self.scan_workers.append(worker)
+        self.statusBar().showMessage("フォルダを検索中...")
+        worker.start()
+
+    def handle_files_found(self, file_infos):
+        self.file_model.append_files(file_infos)
+        if self.scan_workers:
+            self.statusBar().showMessage(f"フォルダを検索中... {len(self.file_list)}件")
+
+    def handle_scan_finished(self, worker, found):
+        if worker in self.scan_workers:
+            self.scan_workers.remove(worker)
+        if not self.scan_workers:
+            self.statusBar().showMessage(f"ファイル数: {len(self.file_list)}件", 5000)
+
+    def cancel_scans(self):
+        for worker in self.scan_workers:
+            worker.cancel()
+            for signal in (worker.files_found, worker.finished):
+                try:
+                    signal.disconnect()
+                except TypeError:
+                    pass
+            self.stopping_workers.append(worker)
+        self.scan_workers = []
+        self.statusBar().clearMessage()
 
     def clear_files(self):
-        self.file_list.clear()
-        self.update_file_table()
+        self.cancel_scans()
+        self.file_model.clear()
 
     def select_files(self):
         options = QFileDialog.Options()
@@ -500,58 +900,27 @@ class AudioNormalizer(QMainWindow):
             options=options
         )
         if files:
-            for file_path in files:
-                self.add_file(file_path)
-            self.update_file_table()
+            self.add_files(files)
 
-    def update_file_table(self):
-        try:
-            self.file_table.setRowCount(len(self.file_list))
-            for row, file_info in enumerate(self.file_list):
-                file_path = file_info['path']
-                # ファイル名
-                name_item = QTableWidgetItem(os.path.basename(file_path))
-                name_item.setFlags(name_item.flags() & ~Qt.ItemIsEditable)
-                self.file_table.setItem(row, 0, name_item)
-
-                # ディレクトリパス
-                dir_item = QTableWidgetItem(os.path.dirname(file_path))
-                dir_item.setFlags(dir_item.flags() & ~Qt.ItemIsEditable)
-                self.file_table.setItem(row, 1, dir_item)
-
-                # チャンネル
-                channels = file_info.get('channels')
-                if channels is not None:
-                    if channels == 1:
-                        channel_text = "モノラル"
-                    elif channels == 2:
-                        channel_text = "ステレオ"
-                    else:
-                        channel_text = f"{channels}ch"
-                else:
-                    channel_text = ""
-                channel_item = QTableWidgetItem(channel_text)
-                channel_item.setFlags(channel_item.flags() & ~Qt.ItemIsEditable)
-                channel_item.setTextAlignment(Qt.AlignCenter)
-                self.file_table.setItem(row, 2, channel_item)
-
-                # LUFS
-                lufs = file_info.get('lufs')
-                if lufs is not None:
-                    lufs_text = f"{lufs:.1f}"
-                    lufs_item = QTableWidgetItem(lufs_text)
-                    lufs_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                else:
-                    lufs_item = QTableWidgetItem("")
-                lufs_item.setFlags(lufs_item.flags() & ~Qt.ItemIsEditable)
-                self.file_table.setItem(row, 3, lufs_item)
-
-            # テーブルの更新を強制
-            self.file_table.viewport().update()
-            self.file_table.repaint()
+    def select_directory(self):
+        options = QFileDialog.Options()
+        directory = QFileDialog.getExistingDirectory(self, "フォルダを選択", options=options)
+        if directory:
+            self.scan_directories([directory])
+
+    def apply_filter(self):
+        """絞り込み条件をプロキシモデルに反映"""
+        self.file_proxy.set_filter(
+            self.channel_filter_combo.currentData(),
+            self.parse_lufs_bound(self.lufs_min_edit.text()),
+            self.parse_lufs_bound(self.lufs_max_edit.text())
+        )
 
-        except Exception as e:
-            print(f"テーブル更新エラー: {str(e)}")
+    def parse_lufs_bound(self, text):
+        try:
+            return float(text)
+        except ValueError:
+            return None
 
     def analyze_files(self):
         if not self.file_list:
@@ -562,22 +931,90 @@ class AudioNormalizer(QMainWindow):
             QMessageBox.warning(self, "警告", "ffmpegの実行ファイルパスが指定されていません")
             return
 
+        # フォルダの検索中に追加されるファイルの影響を受けないよう、開始時点の一覧を渡す
+        self.start_analyze(list(range(len(self.file_list))))
+
+    def quick_scan_files(self):
+        if not self.file_list:
+            QMessageBox.warning(self, "警告", "スキャンするファイルが選択されていません")
+            return
+
+        if not self.ffmpeg_path:
+            QMessageBox.warning(self, "警告", "ffmpegの実行ファイルパスが指定されていません")
+            return
+
+        if not r128_meter.is_available():
+            QMessageBox.warning(self, "警告", "簡易スキャンにはNumPyが必要です")
+            return
+
+        if not self.update_outlier_target():
+            QMessageBox.warning(self, "警告", "要確認の判定に使うターゲットLUFS値が正しくありません")
+            return
+
+        # 解析済みのファイルは推定の必要がないため除く
+        rows = [row for row, file_info in enumerate(self.file_list) if file_info['lufs'] is None]
+        if not rows:
+            QMessageBox.information(self, "簡易スキャン", "未解析のファイルはありません")
+            return
+        self.start_analyze(rows, quick_scan=True)
+
+    def analyze_outlier_files(self):
+        """簡易スキャンで要確認となったファイルだけを通常の方法で解析する"""
+        if not self.ffmpeg_path:
+            QMessageBox.warning(self, "警告", "ffmpegの実行ファイルパスが指定されていません")
+            return
+
+        if not self.update_outlier_target():
+            QMessageBox.warning(self, "警告", "要確認の判定に使うターゲットLUFS値が正しくありません")
+            return
+
+        rows = [row for row, _ in self.file_model.outlier_estimates()]
+        if not rows:
+            QMessageBox.information(self, "解析", "解析が必要な要確認のファイルはありません（先に簡易スキャンを実行してください）")
+            return
+        self.start_analyze(rows)
+
+    def update_outlier_target(self):
+        """要確認の判定に使うターゲットを現在のターゲットLUFSにする（値が正しくない場合は False を返す）"""
+        target_lufs = self.parse_lufs_bound(self.lufs_edit.text())
+        if target_lufs is None:
+            return False
+        if target_lufs != self.file_model.outlier_target:
+            self.file_model.set_outlier_target(target_lufs)
+        return True
+
+    def start_analyze(self, rows, quick_scan=False):
+        """file_list の rows 行目のファイルを解析（quick_scan の場合は簡易スキャン）する"""
         # メインウィンドウを無効化
         self.setEnabled(False)
 
         try:
             # プログレスダイアログを作成
-            self.progress_dialog = QProgressDialog("オーディオファイルを解析中...", "キャンセル", 0, len(self.file_list), self)
-            self.progress_dialog.setWindowTitle("解析中")
+            label = "オーディオファイルを簡易スキャン中..." if quick_scan else "オーディオファイルを解析中..."
+            self.progress_dialog = QProgressDialog(label, "キャンセル", 0, len(rows) * PROGRESS_SCALE, self)
+            self.progress_dialog.setWindowTitle("簡易スキャン中" if quick_scan else "解析中")
             self.progress_dialog.setWindowModality(Qt.ApplicationModal)
             self.progress_dialog.setMinimumDuration(0)
 
             # ワーカーを作成
-            self.analyze_worker = AnalyzeWorker(self.file_list, self.ffmpeg_path)
+            self.analyze_worker = AnalyzeWorker(
+                [self.file_list[row] for row in rows],
+                self.ffmpeg_path,
+                self.workers_spin.value(),
+                self.analysis_cache,
+                self.backend_combo.currentData(),
+                self.new_metrics(),
+                self.segment_threshold(),
+                self.threads_spin.value() or None,
+                self.readers_spin.value() or None,
+                quick_scan,
+                bool(self.album_combo.currentData())
+            )
 
-            # シグナル接続
+            # シグナル接続（ワーカーの一覧上の位置をテーブルの行に戻す）
             self.progress_dialog.canceled.connect(self.cancel_analyze)
             self.analyze_worker.progress.connect(self.update_analyze_progress)
+            self.analyze_worker.file_analyzed.connect(lambda i: self.file_model.file_changed(rows[i]))
             self.analyze_worker.error.connect(lambda msg: QMessageBox.warning(self, "解析エラー", msg))
             self.analyze_worker.finished.connect(self.handle_analyze_finished)
 
@@ -588,11 +1025,14 @@ class AudioNormalizer(QMainWindow):
             self.setEnabled(True)
             QMessageBox.critical(self, "エラー", f"解析処理の初期化中にエラーが発生しました:\n{str(e)}")
 
-    def update_analyze_progress(self, value, filename):
+    def update_analyze_progress(self, value, text):
+        self.update_progress_dialog(value, text)
+
+    def update_progress_dialog(self, value, text):
         if hasattr(self, 'progress_dialog'):
+            # setValueはイベントを処理するため、ラベルを先に更新する
+            self.progress_dialog.setLabelText(text)
             self.progress_dialog.setValue(value)
-            if filename:
-                self.progress_dialog.setLabelText(f"解析中: {filename}")
 
     def cleanup_progress_dialog(self):
         """プログレスダイアログを安全に削除"""
@@ -603,20 +1043,21 @@ class AudioNormalizer(QMainWindow):
         except:
             pass
 
-    def handle_analyze_finished(self, results):
+    def handle_analyze_finished(self, analyzed_count):
         try:
             # プログレスダイアログを閉じる
             self.cleanup_progress_dialog()
 
-            # 結果をメインのファイルリストに反映
-            path_to_info = {result['path']: {'lufs': result['lufs'], 'channels': result['channels']} for result in results}
-            for file_info in self.file_list:
-                if file_info['path'] in path_to_info:
-                    file_info['lufs'] = path_to_info[file_info['path']]['lufs']
-                    file_info['channels'] = path_to_info[file_info['path']]['channels']
+            # 解析結果はワーカーが file_list のレコードに直接書き込んでいるのでテーブルを更新
+            self.file_model.analysis_changed()
 
-            # テーブルを更新
-            self.update_file_table()
+            summary = self.take_metrics_summary(self.analyze_worker)
+            if self.analyze_worker.quick_scan:
+                outliers = len(self.file_model.outlier_files())
+                message = f"{analyzed_count}個のファイルを簡易スキャンしました（要確認: {outliers}個）"
+                QMessageBox.information(self, "簡易スキャン完了", f"{message}\n\n{summary}" if summary else message)
+            elif summary:
+                QMessageBox.information(self, "解析完了", f"{analyzed_count}個のファイルを解析しました\n\n{summary}")
 
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"解析結果の処理中にエラーが発生しました:\n{str(e)}")
@@ -624,42 +1065,83 @@ class AudioNormalizer(QMainWindow):
         finally:
             self.setEnabled(True)
 
-    def normalize_files(self):
+    def validate_normalize_settings(self):
+        """正規化の設定を確認し、問題がなければ Normalizer を返す"""
         if not self.file_list:
             QMessageBox.warning(self, "警告", "正規化するファイルが選択されていません")
-            return
+            return None
 
-        if not self.output_dir:
+        # 元のファイルにタグを書き込む場合は出力先を使用しない
+        tag_mode = self.output_mode_combo.currentData() or None
+        if not self.output_dir and tag_mode != 'inplace':
             QMessageBox.warning(self, "警告", "出力先ディレクトリが指定されていません")
-            return
+            return None
 
         if not self.ffmpeg_path:
             QMessageBox.warning(self, "警告", "ffmpegの実行ファイルパスが指定されていません")
-            return
+            return None
 
         target_lufs = self.lufs_edit.text()
         if not target_lufs:
             QMessageBox.warning(self, "警告", "ターゲットLUFS値が指定されていません")
+            return None
+
+        bitrate = self.bitrate_combo.currentText().split()[0] + "k"  # "160 kbps" -> "160k" の形式に変換
+        sample_rate = self.sample_rate_combo.currentText().split()[0]  # "44100 Hz" -> "44100"
+        try:
+            profiles = parse_profiles(self.profiles_edit.text(), OutputProfile(
+                target_lufs, self.mode_combo.currentText(), bitrate, sample_rate))
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"出力プロファイルが正しくありません: {e}")
+            return None
+        if profiles and (tag_mode or self.lossless_mp3_check.isChecked()):
+            QMessageBox.warning(self, "警告", "出力プロファイルはゲインタグのみの出力・MP3の音量調整と同時に使用できません")
+            return None
+
+        return Normalizer(
+            self.ffmpeg_path,
+            self.output_dir,
+            target_lufs,
+            self.mode_combo.currentText(),
+            bitrate,
+            sample_rate,
+            self.lossless_mp3_check.isChecked(),
+            tag_mode,
+            self.album_combo.currentData() or None,
+            profiles=profiles,
+            tolerance=self.tolerance_spin.value() if self.tolerance_check.isChecked() else None,
+            staging_dir=self.staging_dir()
+        )
+
+    def normalize_files(self):
+        normalizer = self.validate_normalize_settings()
+        if normalizer is None:
+            return
+
+        # アルバム単位でヒストグラムのないファイルがある場合は、解析しながら正規化する
+        if normalizer.album_grouping and any(file_info.get('histogram') is None for file_info in self.file_list):
+            self.analyze_and_normalize_files()
             return
 
         # メインウィンドウを無効化
         self.setEnabled(False)
 
         # プログレスダイアログを作成
-        self.progress_dialog = QProgressDialog("オーディオファイルを正規化中...", "キャンセル", 0, len(self.file_list), self)
+        self.progress_dialog = QProgressDialog("オーディオファイルを正規化中...", "キャンセル", 0, len(self.file_list) * PROGRESS_SCALE, self)
         self.progress_dialog.setWindowTitle("処理中")
         self.progress_dialog.setWindowModality(Qt.ApplicationModal)
         self.progress_dialog.setMinimumDuration(0)
 
-        # ワーカーを作成
+        # ワーカーを作成（開始時点の一覧を渡す）
+        file_list = list(self.file_list)
         self.normalize_worker = NormalizeWorker(
-            self.file_list,
-            self.ffmpeg_path,
-            self.output_dir,
-            target_lufs,
-            self.mode_combo.currentText(),
-            self.bitrate_combo.currentText(),
-            self.sample_rate_combo.currentText()
+            file_list,
+            normalizer,
+            self.normalize_workers_spin.value(),
+            self.new_metrics(),
+            self.begin_journal(normalizer, file_list, analyze=False),
+            self.threads_spin.value() or None,
+            self.readers_spin.value() or None
         )
         self.progress_dialog.canceled.connect(self.cancel_normalize)
         self.normalize_worker.progress.connect(self.update_normalize_progress)
@@ -667,16 +1149,138 @@ class AudioNormalizer(QMainWindow):
         self.normalize_worker.error.connect(lambda msg: QMessageBox.warning(self, "正規化エラー", msg))
         self.normalize_worker.start()
 
-    def update_normalize_progress(self, value, filename):
-        if hasattr(self, 'progress_dialog'):
-            self.progress_dialog.setValue(value)
-            if filename:
-                self.progress_dialog.setLabelText(f"処理中: {filename}")
+    def update_normalize_progress(self, value, text):
+        self.update_progress_dialog(value, text)
+
+    def analyze_and_normalize_files(self):
+        normalizer = self.validate_normalize_settings()
+        if normalizer is None:
+            return
+
+        # メインウィンドウを無効化
+        self.setEnabled(False)
+
+        # プログレスダイアログを作成（解析と正規化の合計で進捗を表示）
+        self.progress_dialog = QProgressDialog("オーディオファイルを解析・正規化中...", "キャンセル", 0, len(self.file_list) * 2 * PROGRESS_SCALE, self)
+        self.progress_dialog.setWindowTitle("処理中")
+        self.progress_dialog.setWindowModality(Qt.ApplicationModal)
+        self.progress_dialog.setMinimumDuration(0)
+
+        # ワーカーを作成（開始時点の一覧を渡す）
+        file_list = list(self.file_list)
+        self.pipeline_worker = PipelineWorker(
+            file_list,
+            self.ffmpeg_path,
+            normalizer,
+            self.workers_spin.value(),
+            self.normalize_workers_spin.value(),
+            self.analysis_cache,
+            self.backend_combo.currentData(),
+            self.new_metrics(),
+            self.begin_journal(normalizer, file_list, analyze=True),
+            self.segment_threshold(),
+            self.threads_spin.value() or None,
+            self.readers_spin.value() or None
+        )
+        self.progress_dialog.canceled.connect(self.cancel_pipeline)
+        self.pipeline_worker.progress.connect(self.update_pipeline_progress)
+        self.pipeline_worker.file_analyzed.connect(self.file_model.file_changed)
+        self.pipeline_worker.finished.connect(self.handle_pipeline_finished)
+        self.pipeline_worker.error.connect(lambda msg: QMessageBox.warning(self, "エラー", msg))
+        self.pipeline_worker.start()
+
+    def update_pipeline_progress(self, value, text):
+        self.update_progress_dialog(value, text)
+
+    def resume_batch(self):
+        """ジャーナルに記録されたバッチを記録時の設定で再開する（出力が変わっていない完了済みのファイルは省く）"""
+        if not self.ffmpeg_path:
+            QMessageBox.warning(self, "警告", "ffmpegの実行ファイルパスが指定されていません")
+            return
+        loaded = self.job_journal.load() if self.job_journal is not None else None
+        if loaded is None:
+            self.update_resume_button()
+            return
+        settings, paths = loaded
+        normalizer = Normalizer.from_settings(self.ffmpeg_path, settings['normalizer'], self.staging_dir())
+        paths = [path for path in paths if os.path.isfile(path)]
+        if not paths:
+            QMessageBox.warning(self, "警告", "再開するバッチの入力ファイルが見つかりません")
+            return
+
+        # バッチのファイルをテーブルに戻し、テーブルのレコード（解析結果を含む）で処理する
+        self.add_files(paths)
+        file_list = [self.file_list[self.file_model.row_of(path)] for path in paths]
+
+        self.setEnabled(False)
+        steps = 2 if settings.get('analyze') else 1
+        self.progress_dialog = QProgressDialog("中断したバッチを再開しています...", "キャンセル", 0, len(file_list) * steps * PROGRESS_SCALE, self)
+        self.progress_dialog.setWindowTitle("処理中")
+        self.progress_dialog.setWindowModality(Qt.ApplicationModal)
+        self.progress_dialog.setMinimumDuration(0)
+
+        if settings.get('analyze'):
+            self.pipeline_worker = PipelineWorker(
+                file_list,
+                self.ffmpeg_path,
+                normalizer,
+                self.workers_spin.value(),
+                self.normalize_workers_spin.value(),
+                self.analysis_cache,
+                self.backend_combo.currentData(),
+                self.new_metrics(),
+                self.job_journal,
+                self.segment_threshold(),
+                self.threads_spin.value() or None,
+                self.readers_spin.value() or None
+            )
+            self.progress_dialog.canceled.connect(self.cancel_pipeline)
+            self.pipeline_worker.progress.connect(self.update_pipeline_progress)
+            # ワーカーの一覧とテーブルの並びが異なるため、パスからテーブルの行を求める
+            self.pipeline_worker.file_analyzed.connect(
+                lambda i: self.file_model.file_changed(self.file_model.row_of(file_list[i]['path'])))
+            self.pipeline_worker.finished.connect(self.handle_pipeline_finished)
+            self.pipeline_worker.error.connect(lambda msg: QMessageBox.warning(self, "エラー", msg))
+            self.pipeline_worker.start()
+        else:
+            self.normalize_worker = NormalizeWorker(
+                file_list,
+                normalizer,
+                self.normalize_workers_spin.value(),
+                self.new_metrics(),
+                self.job_journal,
+                self.threads_spin.value() or None,
+                self.readers_spin.value() or None
+            )
+            self.progress_dialog.canceled.connect(self.cancel_normalize)
+            self.normalize_worker.progress.connect(self.update_normalize_progress)
+            self.normalize_worker.finished.connect(self.handle_normalize_finished)
+            self.normalize_worker.error.connect(lambda msg: QMessageBox.warning(self, "正規化エラー", msg))
+            self.normalize_worker.start()
+
+    def handle_pipeline_finished(self, success_files, error_files):
+        # 解析結果は file_list に直接反映されているのでテーブルを更新
+        self.file_model.analysis_changed()
+        self.show_normalize_result(success_files, error_files, self.take_metrics_summary(self.pipeline_worker),
+                                   self.pipeline_worker.normalizer)
 
     def handle_normalize_finished(self, success_files, error_files):
+        self.show_normalize_result(success_files, error_files, self.take_metrics_summary(self.normalize_worker),
+                                   self.normalize_worker.normalizer)
+
+    def show_normalize_result(self, success_files, error_files, summary=None, normalizer=None):
         # プログレスダイアログを閉じる
         self.cleanup_progress_dialog()
-
+        self.update_resume_button()
+
+        # 処理時間を計測した場合は内訳を結果に添える
+        summary = f"\n\n{summary}" if summary else ""
+        # 許容差を指定した場合は、正規化の方法ごとのファイル数を添える
+        if normalizer is not None and normalizer.tolerance is not None and normalizer.decisions:
+            counts = Counter(plan['action'] for plan in normalizer.decisions.values())
+            labels = {'copy': "コピー", 'gain': "音量の変更のみ", 'loudnorm': "loudnorm"}
+            summary = "\n\n" + "\n".join(f"{labels[action]}: {counts[action]}個"
+                                          for action in NORMALIZE_ACTIONS if counts[action]) + summary
         if error_files:
             error_msg = "以下のファイルで問題が発生しました:\n\n"
             for file_path, error in error_files:
@@ -684,29 +1288,89 @@ class AudioNormalizer(QMainWindow):
             QMessageBox.warning(
                 self,
                 "完了（エラーあり）",
-                f"処理が完了しました。\n成功: {success_files}個\n失敗: {len(error_files)}個\n\n{error_msg}"
+                f"処理が完了しました。\n成功: {success_files}個\n失敗: {len(error_files)}個\n\n{error_msg}{summary}"
             )
         else:
             QMessageBox.information(
                 self,
                 "完了",
-                f"すべてのファイル({success_files}個)の正規化が完了しました"
+                f"すべてのファイル({success_files}個)の正規化が完了しました{summary}"
             )
         self.setEnabled(True)
 
+    def staging_dir(self):
+        """エンコード中の出力を書き込むフォルダ（出力先に直接書き込む場合はNone）"""
+        if not self.staging_check.isChecked():
+            return None
+        return os.path.join(tempfile.gettempdir(), "AudioNormalizer")
+
+    def segment_threshold(self):
+        """分割解析のしきい値（秒、分割しない場合はNone）"""
+        return self.segment_spin.value() * 60 or None
+
+    def new_metrics(self):
+        """処理時間の計測が有効な場合は新しい RunMetrics を返す"""
+        return RunMetrics() if self.metrics_check.isChecked() else None
+
+    def take_metrics_summary(self, worker):
+        """ワーカーの計測結果を保存用に保持し、表示用の集計を返す（計測していない場合はNone）"""
+        if worker.metrics is None:
+            return None
+        self.last_metrics = worker.metrics
+        self.export_metrics_button.setEnabled(True)
+        return worker.metrics.summary_text()
+
+    def export_metrics(self):
+        if self.last_metrics is None:
+            return
+        options = QFileDialog.Options()
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "計測結果を保存",
+            "metrics.json",
+            "JSON (*.json);;CSV (*.csv)",
+            options=options
+        )
+        if not file_path:
+            return
+        try:
+            self.last_metrics.export(file_path)
+        except OSError as e:
+            QMessageBox.critical(self, "エラー", f"計測結果を保存できませんでした:\n{str(e)}")
+
     def cancel_analyze(self):
         if hasattr(self, 'analyze_worker'):
-            self.analyze_worker.is_cancelled = True
-            self.analyze_worker.wait()
-            self.cleanup_progress_dialog()
-            self.setEnabled(True)
+            self.stop_worker(self.analyze_worker)
+            # 中断されたファイルの解析結果はクリアされているため表示を更新
+            self.file_model.analysis_changed()
 
     def cancel_normalize(self):
         if hasattr(self, 'normalize_worker'):
-            self.normalize_worker.is_cancelled = True
-            self.normalize_worker.wait()
-            self.cleanup_progress_dialog()
-            self.setEnabled(True)
+            self.stop_worker(self.normalize_worker)
+
+    def cancel_pipeline(self):
+        if hasattr(self, 'pipeline_worker'):
+            self.stop_worker(self.pipeline_worker)
+            self.file_model.analysis_changed()
+
+    def stop_worker(self, worker):
+        """ワーカーのffmpegプロセスを終了させ、スレッドの終了を待たずに操作可能な状態に戻す"""
+        worker.cancel()
+        # 終了処理中のワーカーから届くシグナルは無視する
+        signals = [worker.progress, worker.error, worker.finished]
+        if hasattr(worker, 'file_analyzed'):
+            signals.append(worker.file_analyzed)
+        for signal in signals:
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass
+        # スレッドが終了するまでワーカーの参照を保持する
+        self.stopping_workers = [w for w in self.stopping_workers if w.isRunning()]
+        self.stopping_workers.append(worker)
+        self.cleanup_progress_dialog()
+        self.update_resume_button()
+        self.setEnabled(True)
 
     def update_bitrate_options(self, mode):
         """ビットレートモードに応じてビットレートの選択肢を更新"""
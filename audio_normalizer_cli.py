@@ -0,0 +1,614 @@
+import os
+import sys
+import glob
+import json
+import signal
+import argparse
+import threading
+from adaptive_concurrency import ConcurrencyLimiter, auto_threads
+from analysis_cache import AnalysisCache
+from audio_core import (ALBUM_GROUPINGS, ANALYSIS_BACKENDS, DEFAULT_BACKEND, DEFAULT_SEGMENT_THRESHOLD, TAG_MODES,
+                        BatchProgress, CancelToken, JobCancelled, Normalizer, OutputProfile, RunMetrics,
+                        album_loudness, analyze_file, default_workers, find_ffmpeg, is_audio_file, is_outlier,
+                        iter_audio_files, new_file_info, parse_profile, quick_scan_file, run_parallel,
+                        run_pipeline)
+from job_journal import JobJournal
+from watch_folder import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_SECONDS, WatchFolderService
+import mp3_gain
+import r128_meter
+
+# JSONに含めるffmpegのエラー出力の最大行数
+ERROR_TAIL_LINES = 20
+
+
+def collect_input_files(inputs):
+    """入力パターン（ファイル・ディレクトリ・グロブ）からファイル一覧を作成（重複は除外）"""
+    file_paths = []
+    seen = set()
+    for pattern in inputs:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                candidates = iter_audio_files(match)
+            elif os.path.isfile(match) and (match == pattern or is_audio_file(match)):
+                candidates = [match]
+            else:
+                continue
+            for file_path in candidates:
+                file_path = os.path.abspath(file_path)
+                if file_path not in seen:
+                    seen.add(file_path)
+                    file_paths.append(file_path)
+    return file_paths
+
+
+def error_tail(error):
+    lines = str(error).strip().splitlines()
+    return "\n".join(lines[-ERROR_TAIL_LINES:])
+
+
+class ProgressPrinter:
+    """進捗を標準エラー出力に表示"""
+
+    def __init__(self, label, quiet=False):
+        self.label = label
+        self.quiet = quiet
+        self.batch = None
+        self._lock = threading.Lock()
+
+    def begin(self, total):
+        self.batch = BatchProgress(total)
+
+    def track(self, file_path):
+        """ファイルの処理開始を記録し、ffmpegの進捗を受け取るコールバックを返す"""
+        self.batch.start(file_path, os.path.basename(file_path))
+
+        def on_progress(fraction, media_seconds):
+            self.batch.update(file_path, fraction, media_seconds)
+        return on_progress
+
+    def done(self, file_path, status):
+        self.batch.finish(file_path)
+        if not self.quiet:
+            with self._lock:
+                print(f"[{self.label}] {status}: {file_path}  {self.batch.summary_text()}",
+                      file=sys.stderr, flush=True)
+
+
+def default_profile(args):
+    """--profile で省略した項目に使用する --target-lufs などの値"""
+    return OutputProfile(f"{args.target_lufs:g}", args.bitrate_mode, f"{args.bitrate}k", str(args.sample_rate))
+
+
+def parse_workers(value):
+    """--jobs などの値（'auto' は0、処理量と負荷から自動で調整する）"""
+    if value == "auto":
+        return 0
+    try:
+        workers = int(value)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        raise argparse.ArgumentTypeError("1以上の整数か auto を指定してください")
+    return workers
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="オーディオファイルのラウドネスを解析・正規化します（GUIを使用しません）"
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="入力ファイル、ディレクトリ、またはグロブパターン（例: 'music/**/*.mp3'）")
+    parser.add_argument("-o", "--output-dir", help="出力先ディレクトリ（--analyze-only 以外では必須）")
+    parser.add_argument("--ffmpeg", default=find_ffmpeg(), help="ffmpegの実行ファイルパス")
+    parser.add_argument("--target-lufs", type=float, default=-13.0, help="ターゲットLUFS値（既定: -13）")
+    parser.add_argument("--bitrate-mode", choices=["VBR", "CBR"], default="CBR", help="ビットレートモード")
+    parser.add_argument("--bitrate", type=int, default=160, help="ビットレート（kbps）")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="サンプリング周波数（Hz）")
+    parser.add_argument("-j", "--jobs", type=parse_workers, default=0,
+                        help="解析で同時に実行するffmpegプロセス数（既定: auto、CPU数から始めて処理量と負荷で調整）")
+    parser.add_argument("--encode-jobs", type=parse_workers, default=None,
+                        help="正規化で同時に実行するffmpegプロセス数（既定: --jobs と同じ）")
+    parser.add_argument("--ffmpeg-threads", type=parse_workers, default=0,
+                        help="ffmpegの1プロセスあたりのスレッド数（既定: auto、CPU数を並列数で分ける）")
+    parser.add_argument("--readers-per-device", type=int, default=None,
+                        help="同じデバイスから同時に読み込むファイル数（既定: HDD・ネットワーク共有は2、"
+                             "それ以外は制限しない、0で制限しない）")
+    parser.add_argument("--staging-dir",
+                        help="エンコード中の出力を書き込むローカルのフォルダ（完了後に出力先に移す）")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="解析済みで正規化待ちにできるファイル数の上限（既定: 正規化の並列数の2倍）")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="出力プロファイル（複数指定可、1回のデコードからすべての出力を作成）。"
+                             "例: 'target=-14,codec=aac,mode=CBR,bitrate=256,rate=48000,dir=streaming'"
+                             "（省略した項目は --target-lufs などの値）")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="ターゲットとの差がこのLU以内のファイルは再エンコードせずにコピーし、"
+                             "トゥルーピークに余裕があれば loudnorm の代わりに音量の変更のみ行う（既定: 無効）")
+    parser.add_argument("--analyze-only", action="store_true", help="解析のみ行い正規化は行わない")
+    parser.add_argument("--quick-scan", action="store_true",
+                        help="各ファイルの一部の区間だけでラウドネスを推定し、ターゲットから離れている可能性がある"
+                             "ファイルだけを解析・正規化する（NumPyが必要）")
+    parser.add_argument("--lossless-mp3", action="store_true",
+                        help="解析できたMP3は再エンコードせず、1.5dB単位で音量だけを変更する")
+    parser.add_argument("--tags-only", choices=TAG_MODES,
+                        help="再エンコードせずReplayGain / R128のゲインタグのみを書き込む"
+                             "（copy: 出力先にコピー, inplace: 入力ファイルに書き込む）")
+    parser.add_argument("--album", choices=ALBUM_GROUPINGS,
+                        help="アルバム単位で同じゲインを適用する（directory: 同じフォルダ, album: アルバム名のタグが同じファイル）")
+    parser.add_argument("--undo-mp3-gain", action="store_true",
+                        help="--lossless-mp3 で変更したMP3の音量を元に戻す（入力ファイルを上書き）")
+    parser.add_argument("--analysis-backend", choices=ANALYSIS_BACKENDS, default=DEFAULT_BACKEND,
+                        help="解析方式（loudnorm: ffmpegのloudnormフィルタ, native: NumPyによる測定）")
+    parser.add_argument("--segment-threshold", type=float, default=DEFAULT_SEGMENT_THRESHOLD,
+                        help="この秒数以上のファイルは区間に分けて並列に解析する（NumPyが必要、0で無効、"
+                             f"既定: {DEFAULT_SEGMENT_THRESHOLD:g}）")
+    parser.add_argument("--cache", help="解析結果キャッシュのデータベースファイル")
+    parser.add_argument("--journal",
+                        help="設定とファイルごとの処理状態を記録するジャーナルのデータベースファイル")
+    parser.add_argument("--resume", action="store_true",
+                        help="--journal に記録された同じ設定のバッチを再開し、出力が残っている完了済みのファイルを省く")
+    parser.add_argument("--watch", action="store_true",
+                        help="入力のディレクトリを監視し続け、追加されたファイルを順に解析・正規化する（結果は1ファイル1行のJSON）")
+    parser.add_argument("--settle-seconds", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help=f"--watch で、サイズが変わらなくなってから処理を始めるまでの秒数（既定: {DEFAULT_SETTLE_SECONDS:g}）")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f"--watch で、ファイルの状態を確認する間隔（秒、既定: {DEFAULT_POLL_INTERVAL:g}）")
+    parser.add_argument("--polling", action="store_true",
+                        help="--watch でinotifyを使用せず、定期的な検索で監視する（ネットワーク共有など）")
+    parser.add_argument("--json", default="-", help="結果のJSONの出力先（既定: 標準出力）")
+    parser.add_argument("--metrics",
+                        help="各処理段階の処理時間などの計測結果の出力先（拡張子が .csv の場合はCSV、それ以外はJSON）")
+    parser.add_argument("-q", "--quiet", action="store_true", help="進捗を表示しない")
+    args = parser.parse_args(argv)
+
+    if args.undo_mp3_gain:
+        # ffmpegを使用せず、出力先も不要
+        return args
+    if not args.ffmpeg:
+        parser.error("ffmpegの実行ファイルが見つかりません。--ffmpeg で指定してください")
+    if not args.analyze_only and not args.output_dir and args.tags_only != 'inplace':
+        parser.error("出力先ディレクトリ（--output-dir）が指定されていません")
+    if args.analysis_backend == 'native' and not r128_meter.is_available():
+        parser.error("--analysis-backend native にはNumPyが必要です")
+    if args.quick_scan:
+        if not r128_meter.is_available():
+            parser.error("--quick-scan にはNumPyが必要です")
+        if args.album or args.watch:
+            parser.error("--quick-scan は --album・--watch と同時に使用できません")
+    if args.encode_jobs is None:
+        args.encode_jobs = args.jobs
+    if args.readers_per_device is not None and args.readers_per_device < 0:
+        parser.error("--readers-per-device には0以上の値を指定してください")
+    if args.tolerance is not None and args.tolerance < 0:
+        parser.error("--tolerance には0以上の値を指定してください")
+    if args.resume and not args.journal:
+        parser.error("--resume には --journal の指定が必要です")
+    if args.profile:
+        if args.tags_only or args.lossless_mp3:
+            parser.error("--profile は --tags-only・--lossless-mp3 と同時に使用できません")
+        try:
+            args.profiles = [parse_profile(spec, default_profile(args)) for spec in args.profile]
+        except ValueError as e:
+            parser.error(f"--profile: {e}")
+    else:
+        args.profiles = None
+    if args.watch:
+        if args.album:
+            parser.error("--watch では --album を使用できません")
+        for directory in args.inputs:
+            if not os.path.isdir(directory):
+                parser.error(f"--watch の入力にはディレクトリを指定してください: {directory}")
+    return args
+
+
+def error_status(error):
+    return "cancelled" if isinstance(error, JobCancelled) else "error"
+
+
+def open_journal(args, normalizer, file_list):
+    """ジャーナルを開いてバッチを記録する（--resume で設定が同じ場合は記録を引き継ぐ）"""
+    journal = JobJournal(args.journal)
+    settings = {'analyze': True, 'normalizer': normalizer.settings()}
+    paths = [file_info['path'] for file_info in file_list]
+    loaded = journal.load() if args.resume else None
+    if loaded is not None and loaded[0] == settings:
+        journal.add(paths)
+    else:
+        if loaded is not None and not args.quiet:
+            print("ジャーナルの設定が異なるため、最初から処理します", file=sys.stderr, flush=True)
+        journal.begin(settings, paths)
+    return journal
+
+
+def decision_fields(normalizer, file_path):
+    """正規化の方法（copy / gain / loudnorm）とその理由を結果に加える項目を返す"""
+    plan = normalizer.decisions.get(file_path)
+    if plan is None:
+        return {}
+    return {'action': plan['action'], 'reason': plan['reason']}
+
+
+def create_normalizer(args):
+    """引数から Normalizer を作成する（--analyze-only の場合はNone）"""
+    if args.analyze_only:
+        return None
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    return Normalizer(
+        args.ffmpeg,
+        args.output_dir,
+        f"{args.target_lufs:g}",
+        args.bitrate_mode,
+        f"{args.bitrate}k",
+        str(args.sample_rate),
+        args.lossless_mp3,
+        args.tags_only,
+        args.album,
+        args.profiles,
+        args.tolerance,
+        args.staging_dir
+    )
+
+
+def quick_scan(args, file_list, records, cache, cancel_token, metrics, limiter):
+    """file_list を簡易スキャンして推定値を結果に加え、要確認のファイルのリストを返す"""
+    progress = ProgressPrinter("簡易スキャン", args.quiet)
+    progress.begin(len(file_list))
+
+    def scan(file_info):
+        on_progress = progress.track(file_info['path'])
+        return quick_scan_file(args.ffmpeg, file_info, cache, on_progress, cancel_token, args.analysis_backend,
+                               metrics, limiter.ffmpeg_threads())
+
+    def scan_done(i, file_info, result, error):
+        record = records[file_info['path']]
+        if error is not None:
+            record['status'] = error_status(error)
+            record['error'] = error_tail(error)
+            if not isinstance(error, JobCancelled):
+                # 推定できなかったファイルとして要確認にする（全体の解析の結果で上書きする）
+                file_info['estimate'] = {'lufs': None, 'margin': None}
+        estimate = file_info['estimate'] or {}
+        record.update({
+            'lufs': file_info['lufs'],
+            'channels': file_info['channels'],
+            'probe': file_info['probe'],
+            'estimate': estimate.get('lufs'),
+            'margin': estimate.get('margin'),
+            'outlier': is_outlier(file_info, args.target_lufs),
+        })
+        progress.done(file_info['path'], record['status'])
+
+    run_parallel(scan, file_list, limiter, scan_done, args.readers_per_device)
+    return [file_info for file_info in file_list if records[file_info['path']]['outlier']]
+
+
+def run(args, cancel_token=None, metrics=None):
+    """解析・正規化を実行して結果の辞書を返す（metrics を指定すると各処理段階を計測する）"""
+    file_list = [new_file_info(file_path) for file_path in collect_input_files(args.inputs)]
+    records = {file_info['path']: {'path': file_info['path'], 'status': "ok"} for file_info in file_list}
+
+    normalizer = create_normalizer(args)
+
+    analyze_progress = ProgressPrinter("解析", args.quiet)
+    normalize_progress = ProgressPrinter("正規化", args.quiet)
+    analyze_progress.begin(len(file_list))
+    normalize_progress.begin(len(file_list))
+
+    def analyze_done(i, file_info, result, error):
+        record = records[file_info['path']]
+        if error is not None:
+            record['status'] = error_status(error)
+            record['error'] = error_tail(error)
+        elif file_info['lufs'] is None and not record.get('resumed'):
+            record['status'] = "error"
+            record['error'] = "ラウドネスを測定できませんでした"
+        else:
+            # 簡易スキャンに失敗したファイルも、全体を解析できた場合は成功とする
+            record['status'] = "ok"
+            record.pop('error', None)
+        record.update({
+            'lufs': file_info['lufs'],
+            'channels': file_info['channels'],
+            'probe': file_info['probe'],
+        })
+        analyze_progress.done(file_info['path'], record['status'])
+
+    def normalize_done(i, file_info, result, error):
+        # 解析に失敗したファイルもffmpeg内部の測定で正規化を試みるため、正規化の結果で上書きする
+        record = records[file_info['path']]
+        if error is not None:
+            record['status'] = error_status(error)
+            record['error'] = error_tail(error)
+        else:
+            record['status'] = "ok"
+            record.pop('error', None)
+            record['output'] = result
+            record.update(decision_fields(normalizer, file_info['path']))
+        if journal is not None:
+            if error is None:
+                journal.mark_done(file_info['path'], result)
+            elif not isinstance(error, JobCancelled):
+                journal.mark_failed(file_info['path'], record['error'])
+        normalize_progress.done(file_info['path'], record['status'])
+
+    cache = AnalysisCache(args.cache) if args.cache else None
+    journal = open_journal(args, normalizer, file_list) if args.journal and normalizer is not None else None
+
+    def completed_output(file_info):
+        return journal.completed_output(file_info['path']) if journal is not None else None
+
+    # 段ごとの並列数（auto の場合は処理量と負荷から調整）とffmpegのスレッド数
+    analyze_limiter = ConcurrencyLimiter(args.jobs, args.ffmpeg_threads or None)
+    normalize_limiter = ConcurrencyLimiter(args.encode_jobs, args.ffmpeg_threads or None)
+
+    try:
+        if args.quick_scan:
+            # 要確認のファイルだけを解析・正規化する
+            file_list = quick_scan(args, file_list, records, cache, cancel_token, metrics, analyze_limiter)
+            analyze_progress.begin(len(file_list))
+            normalize_progress.begin(len(file_list))
+
+        def analyze(file_info):
+            on_progress = analyze_progress.track(file_info['path'])
+            # 再開したバッチで完了済みのファイルは解析も省く（アルバム単位ではアルバムのラウドネスに測定値が必要）
+            if not args.album and completed_output(file_info) is not None:
+                records[file_info['path']]['resumed'] = True
+                return file_info
+            # 簡易スキャンで全体を解析したファイル（短いファイル・キャッシュにあるファイル）
+            if file_info['lufs'] is not None:
+                return file_info
+            return analyze_file(args.ffmpeg, file_info, cache, on_progress, cancel_token, args.analysis_backend,
+                                metrics, args.segment_threshold, analyze_limiter.ffmpeg_threads(),
+                                histogram=bool(args.album))
+
+        def normalize(file_info):
+            on_progress = normalize_progress.track(file_info['path'])
+            completed = completed_output(file_info)
+            if completed is not None:
+                records[file_info['path']]['resumed'] = True
+                return completed
+            return normalizer.normalize_file(file_info, on_progress, cancel_token, metrics,
+                                             normalize_limiter.ffmpeg_threads())
+
+        if normalizer is None or args.album:
+            # アルバム単位ではアルバム内のすべての曲の測定値が揃ってから正規化する
+            run_parallel(analyze, file_list, analyze_limiter, analyze_done, args.readers_per_device)
+            if args.album:
+                if normalizer is not None:
+                    albums = normalizer.prepare_albums(file_list)
+                else:
+                    albums = album_loudness(file_list, args.album)
+                for path, (lufs, _) in albums.items():
+                    records[path]['album_lufs'] = lufs
+            if normalizer is not None:
+                run_parallel(normalize, file_list, normalize_limiter, normalize_done, args.readers_per_device)
+        else:
+            # 解析が終わったファイルから順に正規化する
+            run_pipeline(
+                file_list,
+                analyze,
+                normalize,
+                analyze_limiter,
+                normalize_limiter,
+                args.queue_size,
+                on_analyzed=analyze_done,
+                on_normalized=normalize_done,
+                readers_per_device=args.readers_per_device
+            )
+    finally:
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if metrics is not None:
+            metrics.finish()
+
+    files = list(records.values())
+    failed = sum(1 for record in files if record['status'] != "ok")
+    cancelled = sum(1 for record in files if record['status'] == "cancelled")
+    return {
+        'settings': {
+            'target_lufs': args.target_lufs,
+            'bitrate_mode': args.bitrate_mode,
+            'bitrate': args.bitrate,
+            'sample_rate': args.sample_rate,
+            'jobs': args.jobs or "auto",
+            'encode_jobs': args.encode_jobs or "auto",
+            'ffmpeg_threads': args.ffmpeg_threads or "auto",
+            'analyze_only': args.analyze_only,
+            'quick_scan': args.quick_scan,
+            'lossless_mp3': args.lossless_mp3,
+            'tags_only': args.tags_only,
+            'album': args.album,
+            'profiles': [profile.to_dict() for profile in args.profiles] if args.profiles else None,
+            'analysis_backend': args.analysis_backend,
+            'segment_threshold': args.segment_threshold,
+            'tolerance': args.tolerance,
+            'readers_per_device': args.readers_per_device,
+            'staging_dir': args.staging_dir,
+            'output_dir': args.output_dir,
+        },
+        'files': files,
+        # 自動で調整した並列数の変更の記録
+        'concurrency': {
+            'analyze': analyze_limiter.history,
+            'normalize': normalize_limiter.history,
+        },
+        'summary': {
+            'total': len(files),
+            'succeeded': len(files) - failed,
+            'failed': failed,
+            'cancelled': cancelled,
+        },
+    }
+
+
+def watch(args, stop_event, cancel_token=None, metrics=None):
+    """stop_event が設定されるまで入力のディレクトリを監視し、追加されたファイルを解析・正規化する
+
+    各ファイルの結果は処理が終わるたびに1行のJSONとして出力する。
+    """
+    normalizer = create_normalizer(args)
+    journal = open_journal(args, normalizer, []) if args.journal and normalizer is not None else None
+    cache = AnalysisCache(args.cache) if args.cache else None
+    # 監視中はワーカー数を固定する（auto の場合はCPU数）
+    workers = args.encode_jobs or default_workers()
+    threads = args.ffmpeg_threads or auto_threads(workers)
+    output = sys.stdout if args.json == "-" else open(args.json, 'a', encoding='utf-8')
+    output_lock = threading.Lock()
+
+    def write_record(record):
+        with output_lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            if not args.quiet:
+                print(f"[監視] {record['status']}: {record['path']}", file=sys.stderr, flush=True)
+
+    def process(file_path):
+        """1ファイルを処理して結果を出力し、成功したかを返す（失敗したファイルは監視側で再試行する）"""
+        file_info = new_file_info(file_path)
+        record = {'path': file_path, 'status': "ok"}
+        if journal is not None:
+            journal.add([file_path])
+        try:
+            analyze_file(args.ffmpeg, file_info, cache, None, cancel_token, args.analysis_backend, metrics,
+                         args.segment_threshold, threads)
+            record.update({'lufs': file_info['lufs'], 'channels': file_info['channels']})
+            if normalizer is not None:
+                record['output'] = normalizer.normalize_file(file_info, None, cancel_token, metrics, threads)
+                record.update(decision_fields(normalizer, file_path))
+                if journal is not None:
+                    journal.mark_done(file_path, record['output'])
+            elif file_info['lufs'] is None:
+                record['status'] = "error"
+                record['error'] = "ラウドネスを測定できませんでした"
+        except Exception as e:
+            record['status'] = error_status(e)
+            record['error'] = error_tail(e)
+            if journal is not None and not isinstance(e, JobCancelled):
+                journal.mark_failed(file_path, record['error'])
+        write_record(record)
+        return record['status'] == "ok"
+
+    def on_error(file_path, error):
+        # 処理済みの確認（ジャーナルの読み込み）などで発生したエラー
+        write_record({'path': file_path, 'status': error_status(error), 'error': error_tail(error)})
+
+    def skip(file_path):
+        # 再起動前に処理済みで、出力が変わっていないファイル
+        return journal is not None and journal.completed_output(file_path) is not None
+
+    def on_backpressure(throttled, backlog):
+        if not args.quiet:
+            state = "待機中のため取り込みを止めています" if throttled else "取り込みを再開しました"
+            print(f"[監視] 処理{state}（待ち {backlog}件）", file=sys.stderr, flush=True)
+
+    service = WatchFolderService(
+        args.inputs,
+        process,
+        workers=workers,
+        queue_size=args.queue_size,
+        settle_seconds=args.settle_seconds,
+        poll_interval=args.poll_interval,
+        exclude=[args.output_dir],
+        force_polling=args.polling,
+        skip=skip,
+        on_backpressure=on_backpressure,
+        on_error=on_error
+    )
+    try:
+        if not args.quiet:
+            print(f"[監視] 開始しました: {', '.join(args.inputs)}", file=sys.stderr, flush=True)
+        service.run(stop_event)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if metrics is not None:
+            metrics.finish()
+
+
+def undo_mp3_gain(args):
+    """--lossless-mp3 で変更したMP3の音量を、タグに記録された取り消し情報から元に戻す"""
+    files = []
+    for file_path in collect_input_files(args.inputs):
+        if not file_path.lower().endswith(".mp3"):
+            continue
+        record = {'path': file_path, 'status': "ok"}
+        try:
+            record['undone_steps'] = -mp3_gain.undo_gain(file_path)['steps']
+        except (OSError, mp3_gain.MP3FormatError) as e:
+            record['status'] = "error"
+            record['error'] = str(e)
+        if not args.quiet:
+            print(f"[元に戻す] {record['status']}: {file_path}", file=sys.stderr, flush=True)
+        files.append(record)
+    failed = sum(1 for record in files if record['status'] != "ok")
+    return {
+        'files': files,
+        'summary': {
+            'total': len(files),
+            'succeeded': len(files) - failed,
+            'failed': failed,
+            'cancelled': 0,
+        },
+    }
+
+
+def write_json(result, destination):
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if destination == "-":
+        print(text)
+    else:
+        with open(destination, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.undo_mp3_gain:
+        result = undo_mp3_gain(args)
+        write_json(result, args.json)
+        return 1 if result['summary']['failed'] or not result['files'] else 0
+
+    # 中断要求を受けたら実行中のffmpegを終了させ、途中までの出力を削除してから結果を出力する
+    cancel_token = CancelToken()
+    stop_event = threading.Event()  # --watch の監視を終了させる
+
+    def request_cancel(signum, frame):
+        print("中断しています...", file=sys.stderr, flush=True)
+        cancel_token.cancel()
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_cancel)
+    signal.signal(signal.SIGTERM, request_cancel)
+
+    metrics = RunMetrics() if args.metrics else None
+    if args.watch:
+        # 中断要求を受けるまで監視を続ける
+        watch(args, stop_event, cancel_token, metrics)
+        if metrics is not None:
+            metrics.export(args.metrics)
+        return 0
+    result = run(args, cancel_token, metrics)
+    write_json(result, args.json)
+    if metrics is not None:
+        metrics.export(args.metrics)
+        if not args.quiet:
+            print(metrics.summary_text(), file=sys.stderr)
+    if cancel_token.is_cancelled:
+        return 130
+    # 1ファイルでも失敗した場合、または対象ファイルがない場合は0以外を返す
+    if result['summary']['total'] == 0:
+        print("対象のオーディオファイルが見つかりません", file=sys.stderr)
+        return 2
+    return 1 if result['summary']['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
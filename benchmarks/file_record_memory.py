@@ -0,0 +1,93 @@
+"""ファイル一覧のメモリ使用量を、辞書による表現と FileRecord で比較する
+
+    python benchmarks/file_record_memory.py [--count 件数]
+
+解析前（パスのみ）と解析後（LUFS・入力ファイルの情報・loudnormの測定値・ヒストグラム）の
+1件あたりのメモリ使用量と作成時間を表示する。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_core import ANALYSIS_FIELDS, FileRecord  # noqa: E402
+
+# loudnormが出力するJSONの例（解析結果として保持していた内容）
+LOUDNORM_OUTPUT = """{
+    "input_i" : "-22.25",
+    "input_tp" : "-21.48",
+    "input_lra" : "0.00",
+    "input_thresh" : "-32.25",
+    "output_i" : "-16.05",
+    "output_tp" : "-15.28",
+    "output_lra" : "0.00",
+    "output_thresh" : "-26.05",
+    "normalization_type" : "linear",
+    "target_offset" : "0.05"
+}"""
+
+
+def new_dict_info(file_path):
+    # 以前の new_file_info と同じ辞書による表現
+    file_info = {'path': file_path}
+    for key in ANALYSIS_FIELDS:
+        file_info[key] = None
+    return file_info
+
+
+def sample_path(i):
+    # 1フォルダ12曲、1アーティスト40アルバム程度のライブラリを想定
+    return f"/music/Artist {i // 480:05d}/Album {i // 12:06d}/{i % 12 + 1:02d} Track Title {i}.flac"
+
+
+def analyze(file_info, i):
+    file_info['lufs'] = -20.0 - (i % 70) / 10
+    file_info['channels'] = 2
+    file_info['probe'] = {'channels': 2, 'sample_rate': 44100, 'codec': 'flac', 'duration': 180.0 + i % 300}
+    file_info['loudnorm'] = json.loads(LOUDNORM_OUTPUT)
+    # 3分程度の曲のモーメンタリーラウドネスのヒストグラム（0.1LU単位で12LUの範囲）
+    file_info['histogram'] = {-250 + i % 50 + j: 5 + (j * 7) % 31 for j in range(120)}
+
+
+def measure(factory, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = [factory(sample_path(i)) for i in range(count)]
+    created_time = time.perf_counter() - start
+    created = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    for i, file_info in enumerate(records):
+        analyze(file_info, i)
+    analyzed_time = time.perf_counter() - start
+    analyzed = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return created / count, created_time, analyzed / count, analyzed_time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ファイル一覧の表現ごとのメモリ使用量を比較します")
+    parser.add_argument("--count", type=int, default=200000, help="作成するレコード数")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    results = {}
+    for label, factory in (("dict", new_dict_info), ("FileRecord", FileRecord)):
+        results[label] = measure(factory, args.count)
+
+    print(f"{args.count}件")
+    print(f"{'表現':<12}{'解析前(B/件)':>14}{'作成(s)':>10}{'解析後(B/件)':>14}{'更新(s)':>10}")
+    for label, (created, created_time, analyzed, analyzed_time) in results.items():
+        print(f"{label:<12}{created:>14.0f}{created_time:>10.2f}{analyzed:>14.0f}{analyzed_time:>10.2f}")
+    base = results["dict"]
+    compact = results["FileRecord"]
+    print(f"削減率: 解析前 {1 - compact[0] / base[0]:.0%} / 解析後 {1 - compact[2] / base[2]:.0%}")
+    print(f"100万件の推定: dict {base[2] * 1e6 / 2**20:.0f} MiB / FileRecord {compact[2] * 1e6 / 2**20:.0f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""並べ替え・絞り込み中のファイル一覧（FileFilterProxyModel）の更新にかかる時間を測定する
+
+    python benchmarks/proxy_updates.py [--count 件数] [--updates 件数]
+
+フォルダの検索結果の追加、1ファイルずつの解析結果の更新、全体の解析結果の更新（analysis_changed）を
+LUFSの列で並べ替えた状態で行い、それぞれの処理時間とモデルのリセットの有無を表示する。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import Qt  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from audio_core import new_file_info  # noqa: E402
+from file_table_model import COLUMN_LUFS, FileFilterProxyModel, FileTableModel  # noqa: E402
+
+
+def timed(label, proxy, func):
+    resets = []
+    proxy.modelReset.connect(lambda: resets.append(True))
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    proxy.modelReset.disconnect()
+    print(f"{label:<40}{elapsed:>8.2f}s{'  (リセット)' if resets else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ファイル一覧のプロキシモデルの更新時間を測定します")
+    parser.add_argument("--count", type=int, default=200000, help="一覧のファイル数")
+    parser.add_argument("--updates", type=int, default=2000, help="1ファイルずつ更新する件数")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+    rng = random.Random(0)
+    files = [new_file_info(f"/music/{i // 12:06d}/{i:07d}.flac") for i in range(args.count)]
+    model = FileTableModel(files)
+    proxy = FileFilterProxyModel()
+    proxy.setSourceModel(model)
+    proxy.sort(COLUMN_LUFS, Qt.AscendingOrder)
+
+    batch = [new_file_info(f"/added/{i:07d}.flac") for i in range(5000)]
+    timed("検索結果の追加（5000件）", proxy, lambda: model.append_files(batch))
+
+    def analyze_one_by_one():
+        for _ in range(args.updates):
+            row = rng.randrange(len(files))
+            files[row]['lufs'] = rng.uniform(-30, -5)
+            model.file_changed(row)
+
+    timed(f"1ファイルずつの解析結果の更新（{args.updates}件）", proxy, analyze_one_by_one)
+    timed("全体の更新（値の変更なし）", proxy, model.analysis_changed)
+
+    def analyze_all():
+        for file_info in files:
+            file_info['lufs'] = rng.uniform(-30, -5)
+        model.analysis_changed()
+
+    timed("全体の更新（すべての値を変更）", proxy, analyze_all)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
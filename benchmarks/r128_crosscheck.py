@@ -0,0 +1,113 @@
+"""loudnorm と ネイティブ解析（r128_meter）の測定値・処理時間を比較する
+
+    python benchmarks/r128_crosscheck.py [ファイル ...] [--ffmpeg PATH] [--duration 秒]
+
+ファイルを指定しない場合は、ffmpegのlavfiで生成したテスト信号を使用する。
+測定値の差が許容範囲を超えた場合は終了コード1を返す。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_core import analyze_file, find_ffmpeg, new_file_info  # noqa: E402
+import r128_meter  # noqa: E402
+
+# 比較する値と許容誤差（loudnormは内部で192kHzにアップサンプリングするため完全には一致しない）
+TOLERANCES = {
+    'input_i': 0.3,
+    'input_tp': 0.5,
+    'input_lra': 1.0,
+    'input_thresh': 0.6,
+}
+
+# 生成するテスト信号（ファイル名, lavfiのフィルタ, チャンネル数）
+TEST_SIGNALS = (
+    ('sine_stereo.wav', "sine=frequency=997:sample_rate=48000", 2),
+    ('pink_noise_mono.flac', "anoisesrc=color=pink:amplitude=0.3:sample_rate=44100", 1),
+    ('dynamic_stereo.wav',
+     "anoisesrc=color=pink:amplitude=0.3:sample_rate=48000,volume='if(lt(mod(t,20),10),1,0.1)':eval=frame", 2),
+    ('music_like_51.flac',
+     "sine=frequency=220:sample_rate=48000,tremolo=f=2:d=0.8", 6),
+    ('low_rate_mono.wav', "sine=frequency=440:sample_rate=22050,volume=-20dB", 1),
+)
+
+
+def generate_signals(ffmpeg_path, directory, duration):
+    paths = []
+    for name, source, channels in TEST_SIGNALS:
+        path = os.path.join(directory, name)
+        subprocess.run(
+            [ffmpeg_path, "-v", "error", "-y", "-f", "lavfi", "-t", str(duration), "-i", source,
+             "-ac", str(channels), path],
+            check=True
+        )
+        paths.append(path)
+    return paths
+
+
+def measure(ffmpeg_path, file_path, backend):
+    start = time.perf_counter()
+    file_info = analyze_file(ffmpeg_path, new_file_info(file_path), backend=backend)
+    return file_info['loudnorm'] or {}, time.perf_counter() - start
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="loudnormとネイティブ解析の測定値・処理時間を比較します")
+    parser.add_argument("files", nargs="*", help="比較するファイル（省略時はテスト信号を生成）")
+    parser.add_argument("--ffmpeg", default=find_ffmpeg(), help="ffmpegの実行ファイルパス")
+    parser.add_argument("--duration", type=float, default=60.0, help="生成するテスト信号の長さ（秒）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.ffmpeg:
+        print("ffmpegの実行ファイルが見つかりません", file=sys.stderr)
+        return 2
+    if not r128_meter.is_available():
+        print("ネイティブ解析にはNumPyが必要です", file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = args.files or generate_signals(args.ffmpeg, directory, args.duration)
+
+        failures = 0
+        totals = {'loudnorm': 0.0, 'native': 0.0}
+        header = f"{'ファイル':<24}" + "".join(f"{key:>24}" for key in TOLERANCES) + f"{'loudnorm':>10}{'native':>10}"
+        print(header)
+        for file_path in files:
+            reference, reference_time = measure(args.ffmpeg, file_path, 'loudnorm')
+            native, native_time = measure(args.ffmpeg, file_path, 'native')
+            totals['loudnorm'] += reference_time
+            totals['native'] += native_time
+
+            cells = []
+            for key, tolerance in TOLERANCES.items():
+                try:
+                    expected = float(reference[key])
+                    actual = float(native[key])
+                    difference = abs(actual - expected) if expected != actual else 0.0
+                except (KeyError, TypeError, ValueError):
+                    expected = actual = difference = None
+                mark = "" if difference is not None and difference <= tolerance else " !"
+                if mark:
+                    failures += 1
+                cells.append(f"{expected} / {actual}{mark}".rjust(24))
+            print(f"{os.path.basename(file_path):<24}" + "".join(cells)
+                  + f"{reference_time:>9.2f}s{native_time:>9.2f}s")
+
+    speedup = totals['loudnorm'] / totals['native'] if totals['native'] else 0.0
+    print(f"合計: loudnorm {totals['loudnorm']:.2f}s / native {totals['native']:.2f}s（{speedup:.2f}倍）")
+    if failures:
+        print(f"許容誤差を超えた値: {failures}件", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""解析・正規化の処理性能を測定するベンチマーク
+
+    python benchmarks/run_benchmarks.py [--profile quick|full] [--corpus-dir DIR] [--output results.json]
+
+ffmpegのlavfi（sine・anoisesrc・anullsrc）で決まった内容のテスト用コーパスを生成し、
+AnalyzeWorker / NormalizeWorker と同じ audio_core の処理について
+ファイル数/秒・実時間比・最大メモリ使用量（RSS）・プロセス起動のオーバーヘッドを測定して
+JSONで出力する。各段階は別プロセスで実行し、メモリ使用量が前の段階の影響を受けないようにする。
+生成したコーパスは --corpus-dir に保存し、同じ設定であれば次回は再利用する。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_core import (ANALYSIS_BACKENDS, Normalizer, analyze_file, default_workers,  # noqa: E402
+                        find_ffmpeg, new_file_info, run_parallel)
+import r128_meter  # noqa: E402
+
+# resource はUnix系のみ（Windowsではメモリ使用量を記録しない）
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# コーパスの規模（短いファイルの数、長いファイルの数と長さ）
+PROFILES = {
+    'quick': {'clips': 30, 'long_files': 1, 'long_duration': 600},
+    'full': {'clips': 300, 'long_files': 3, 'long_duration': 3 * 3600},
+}
+
+# 出力形式（拡張子, エンコーダーのオプション, 最大チャンネル数, 固定のサンプリング周波数）
+FORMATS = (
+    ('mp3', ['-c:a', 'libmp3lame', '-b:a', '160k'], 2, None),
+    ('m4a', ['-c:a', 'aac', '-b:a', '160k'], 6, None),
+    ('flac', ['-c:a', 'flac'], 6, None),
+    ('ogg', ['-c:a', 'libvorbis', '-q:a', '4'], 6, None),
+    ('opus', ['-c:a', 'libopus', '-b:a', '128k'], 6, 48000),
+)
+
+CHANNEL_COUNTS = (1, 2, 6)
+SAMPLE_RATES = (22050, 44100, 48000)
+
+# 信号源（seed を固定して毎回同じ内容にする）
+SOURCES = (
+    ('sine', "sine=frequency={frequency}:sample_rate={rate}"),
+    ('noise', "anoisesrc=color=pink:seed={seed}:amplitude=0.2:sample_rate={rate}"),
+    ('silence', "anullsrc=sample_rate={rate}"),
+)
+
+SPAWN_REPEAT = 20
+
+
+def corpus_spec(profile):
+    """生成するファイルの一覧（名前, 信号源, 形式, チャンネル数, サンプリング周波数, 長さ）"""
+    settings = PROFILES[profile]
+    spec = []
+    for i in range(settings['clips']):
+        extension, _, max_channels, fixed_rate = FORMATS[i % len(FORMATS)]
+        channels = min(CHANNEL_COUNTS[i // len(FORMATS) % len(CHANNEL_COUNTS)], max_channels)
+        rate = fixed_rate or SAMPLE_RATES[i // (len(FORMATS) * len(CHANNEL_COUNTS)) % len(SAMPLE_RATES)]
+        source_name, _ = SOURCES[i % len(SOURCES)]
+        duration = 5 + (i * 7) % 26
+        spec.append({
+            'name': f"clip{i:04d}_{source_name}_{channels}ch_{rate}.{extension}",
+            'source': source_name, 'extension': extension, 'channels': channels,
+            'rate': rate, 'duration': duration, 'seed': i + 1,
+        })
+    for i in range(settings['long_files']):
+        extension, _, _, fixed_rate = FORMATS[(i * 2) % len(FORMATS)]
+        spec.append({
+            'name': f"long{i:02d}_noise_2ch.{extension}",
+            'source': 'noise', 'extension': extension, 'channels': 2,
+            'rate': fixed_rate or 44100, 'duration': settings['long_duration'], 'seed': 1000 + i,
+        })
+    return spec
+
+
+def generate_corpus(ffmpeg_path, corpus_dir, profile, quiet=False):
+    """コーパスを生成してファイルパスの一覧を返す（設定が同じ既存のコーパスは再利用）"""
+    spec = corpus_spec(profile)
+    manifest_path = os.path.join(corpus_dir, "manifest.json")
+    paths = [os.path.join(corpus_dir, entry['name']) for entry in spec]
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            if json.load(f) == spec and all(os.path.exists(path) for path in paths):
+                return spec, paths
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    encoders = {extension: options for extension, options, _, _ in FORMATS}
+    sources = dict(SOURCES)
+    for entry, path in zip(spec, paths):
+        if not quiet:
+            print(f"生成中: {entry['name']}", file=sys.stderr, flush=True)
+        source = sources[entry['source']].format(
+            frequency=220 * (1 + entry['seed'] % 4), seed=entry['seed'], rate=entry['rate'])
+        subprocess.run(
+            [ffmpeg_path, "-v", "error", "-y", "-f", "lavfi", "-t", str(entry['duration']), "-i", source,
+             "-ac", str(entry['channels']), "-ar", str(entry['rate'])] + encoders[entry['extension']] + [path],
+            check=True
+        )
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=2)
+    return spec, paths
+
+
+def max_rss_kb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # macOSはバイト単位、Linuxはキロバイト単位
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def child_cpu_seconds():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_stage(stage, params, results):
+    """1段階を実行して測定結果を results（Queue）に入れる（別プロセスで実行される）"""
+    file_list = [new_file_info(path) for path in params['files']]
+    if stage == 'normalize':
+        # 正規化の前提となる解析は測定に含めない
+        run_parallel(lambda file_info: analyze_file(params['ffmpeg'], file_info), file_list, params['jobs'])
+        normalizer = Normalizer(params['ffmpeg'], params['output_dir'], "-16", "VBR", "160k", "44100")
+        func = normalizer.normalize_file
+    else:
+        backend = params['backend']
+        func = lambda file_info: analyze_file(params['ffmpeg'], file_info, backend=backend)  # noqa: E731
+
+    cpu_before = child_cpu_seconds()
+    start = time.perf_counter()
+    outcomes = run_parallel(func, file_list, params['jobs'])
+    elapsed = time.perf_counter() - start
+    cpu_after = child_cpu_seconds()
+
+    if stage == 'normalize':
+        succeeded = sum(1 for outcome in outcomes if outcome is not None)
+    else:
+        succeeded = sum(1 for file_info in file_list if file_info['lufs'] is not None)
+    results.put({
+        'elapsed': elapsed,
+        'succeeded': succeeded,
+        'ffmpeg_cpu_seconds': None if cpu_before is None else cpu_after - cpu_before,
+        'peak_rss_kb': max_rss_kb(resource.RUSAGE_SELF) if resource else None,
+        # 子プロセスの最大値（fork直後の値を含むため、ffmpegが小さい場合は自プロセスと同じ値になる）
+        'peak_ffmpeg_rss_kb': max_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+    })
+
+
+def measure_stage(stage, params, media_seconds):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, params, results))
+    process.start()
+    measured = results.get()
+    process.join()
+
+    files = len(params['files'])
+    elapsed = measured.pop('elapsed')
+    result = {
+        'stage': stage,
+        'backend': params.get('backend'),
+        'jobs': params['jobs'],
+        'files': files,
+        'failed': files - measured.pop('succeeded'),
+        'elapsed': elapsed,
+        'files_per_second': files / elapsed if elapsed else None,
+        'realtime_factor': media_seconds / elapsed if elapsed else None,
+    }
+    result.update(measured)
+    return result
+
+
+def measure_spawn_overhead(ffmpeg_path, clip_path):
+    """ffmpegの起動のみ、および極短いファイルの解析にかかる1プロセスあたりの時間（ミリ秒）"""
+    start = time.perf_counter()
+    for _ in range(SPAWN_REPEAT):
+        subprocess.run([ffmpeg_path, "-hide_banner", "-version"], stdout=subprocess.DEVNULL, check=True)
+    version_ms = (time.perf_counter() - start) / SPAWN_REPEAT * 1000
+
+    start = time.perf_counter()
+    for _ in range(SPAWN_REPEAT):
+        analyze_file(ffmpeg_path, new_file_info(clip_path))
+    analyze_ms = (time.perf_counter() - start) / SPAWN_REPEAT * 1000
+    return {'ffmpeg_version_ms': version_ms, 'minimal_analysis_ms': analyze_ms}
+
+
+def ffmpeg_version(ffmpeg_path):
+    output = subprocess.run([ffmpeg_path, "-version"], capture_output=True, text=True).stdout
+    return output.splitlines()[0] if output else None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="解析・正規化の処理性能を測定します")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick",
+                        help="コーパスの規模（quick: 短時間, full: 数時間のファイルを含む）")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "audio_normalizer_bench"),
+                        help="コーパスの保存先")
+    parser.add_argument("--ffmpeg", default=find_ffmpeg(), help="ffmpegの実行ファイルパス")
+    parser.add_argument("-j", "--jobs", type=int, default=default_workers(), help="並列数（既定: CPU数）")
+    parser.add_argument("--backends", default=",".join(ANALYSIS_BACKENDS),
+                        help="測定する解析方式（カンマ区切り）")
+    parser.add_argument("--skip-normalize", action="store_true", help="正規化の測定を行わない")
+    parser.add_argument("--output", default="-", help="結果のJSONの出力先（既定: 標準出力）")
+    parser.add_argument("-q", "--quiet", action="store_true", help="進捗を表示しない")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.ffmpeg:
+        print("ffmpegの実行ファイルが見つかりません", file=sys.stderr)
+        return 2
+
+    corpus_dir = os.path.join(args.corpus_dir, args.profile)
+    spec, paths = generate_corpus(args.ffmpeg, corpus_dir, args.profile, args.quiet)
+    media_seconds = float(sum(entry['duration'] for entry in spec))
+
+    report = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version(args.ffmpeg),
+        'profile': args.profile,
+        'corpus': {'files': len(paths), 'media_seconds': media_seconds},
+        'spawn': measure_spawn_overhead(args.ffmpeg, paths[0]),
+        'stages': [],
+    }
+
+    params = {'ffmpeg': args.ffmpeg, 'files': paths, 'jobs': args.jobs}
+    for backend in filter(None, args.backends.split(",")):
+        if backend == 'native' and not r128_meter.is_available():
+            continue
+        if not args.quiet:
+            print(f"解析を測定中（{backend}）", file=sys.stderr, flush=True)
+        report['stages'].append(measure_stage('analyze', dict(params, backend=backend), media_seconds))
+
+    if not args.skip_normalize:
+        output_dir = tempfile.mkdtemp(prefix="audio_normalizer_bench_out_")
+        try:
+            if not args.quiet:
+                print("正規化を測定中", file=sys.stderr, flush=True)
+            report['stages'].append(measure_stage('normalize', dict(params, output_dir=output_dir), media_seconds))
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
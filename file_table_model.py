@@ -0,0 +1,465 @@
+import os
+from PyQt5.QtCore import Qt, QAbstractProxyModel, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QBrush, QColor
+from audio_core import is_outlier
+
+# 列の定義
+COLUMN_NAME = 0
+COLUMN_DIRECTORY = 1
+COLUMN_CHANNELS = 2
+COLUMN_LUFS = 3
+COLUMN_HEADERS = ["ファイル名", "ディレクトリ", "チャンネル", "LUFS"]
+
+# 解析によって値が変わる列
+ANALYSIS_COLUMNS = (COLUMN_CHANNELS, COLUMN_LUFS)
+
+# チャンネルによる絞り込みの選択肢（表示名, 条件）
+CHANNEL_FILTERS = [
+    ("すべて", None),
+    ("モノラル", 1),
+    ("ステレオ", 2),
+    ("3ch以上", 'multi'),
+    ("未解析", 'unanalyzed'),
+    ("要確認", 'outlier'),
+]
+
+# 複数行の変更で、表示位置・表示の有無が変わる行がこの数までは1行ずつ移動・挿入・削除する
+# （それ以上はまとめて並べ替え直す）
+INCREMENTAL_CHANGE_LIMIT = 1000
+
+# 簡易スキャンで要確認となったファイルの文字色
+OUTLIER_COLOR = QColor(200, 40, 40)
+
+
+def lufs_sort_key(file_info):
+    # 未解析のファイルは簡易スキャンの推定値で比べ、推定値もない場合は昇順で先頭にまとまるよう最小値として扱う
+    lufs = file_info.get('lufs')
+    if lufs is None:
+        estimate = file_info.get('estimate')
+        lufs = estimate['lufs'] if estimate is not None else None
+    return lufs if lufs is not None else float('-inf')
+
+
+# 列ごとの並べ替えのキー（表示用の文字列ではなく数値で比較する）
+SORT_KEYS = {
+    COLUMN_NAME: lambda file_info: os.path.basename(file_info['path']).lower(),
+    COLUMN_DIRECTORY: lambda file_info: os.path.dirname(file_info['path']).lower(),
+    COLUMN_CHANNELS: lambda file_info: file_info.get('channels') or 0,
+    COLUMN_LUFS: lufs_sort_key,
+}
+
+
+def channel_text(channels):
+    if channels is None:
+        return ""
+    if channels == 1:
+        return "モノラル"
+    if channels == 2:
+        return "ステレオ"
+    return f"{channels}ch"
+
+
+def lufs_text(file_info):
+    """LUFS列の表示（未解析のファイルは簡易スキャンの推定値と信頼区間の幅）"""
+    lufs = file_info.get('lufs')
+    if lufs is not None:
+        return f"{lufs:.1f}"
+    estimate = file_info.get('estimate')
+    if estimate is None:
+        return ""
+    if estimate['lufs'] is None:
+        return "推定不可"
+    return f"≈{estimate['lufs']:.1f} ±{estimate['margin']:.1f}"
+
+
+class FileTableModel(QAbstractTableModel):
+    """file_list（FileRecord のリスト）をそのまま表示するモデル
+
+    リストは参照として保持し、行の追加・解析結果の更新はメソッドを通して通知する。
+    表示する値は描画時に file_info から読み取るため、データの複製は持たない。
+    重複の確認にはパスから行番号への索引を使用する。
+    outlier_target を設定すると、簡易スキャンの推定値がそのターゲットから離れているファイルを要確認として表示する。
+    """
+
+    def __init__(self, file_list, parent=None):
+        super().__init__(parent)
+        self.file_list = file_list
+        self._rows_by_path = {file_info['path']: row for row, file_info in enumerate(file_list)}
+        self.outlier_target = None  # 要確認の判定に使うターゲットLUFS（Noneの場合は判定しない）
+
+    def is_outlier(self, file_info):
+        return self.outlier_target is not None and is_outlier(file_info, self.outlier_target)
+
+    def outlier_files(self):
+        """要確認のファイル（file_list 上の位置, file_info）のリスト"""
+        return [(row, file_info) for row, file_info in enumerate(self.file_list) if self.is_outlier(file_info)]
+
+    def outlier_estimates(self):
+        """要確認のうち、全体を解析していないファイル（file_list 上の位置, file_info）のリスト"""
+        return [(row, file_info) for row, file_info in self.outlier_files() if file_info.get('lufs') is None]
+
+    def set_outlier_target(self, target_lufs):
+        self.outlier_target = target_lufs
+        self.analysis_changed()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.file_list)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMN_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMN_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        file_info = self.file_list[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == COLUMN_NAME:
+                return os.path.basename(file_info['path'])
+            if column == COLUMN_DIRECTORY:
+                return os.path.dirname(file_info['path'])
+            if column == COLUMN_CHANNELS:
+                return channel_text(file_info.get('channels'))
+            if column == COLUMN_LUFS:
+                return lufs_text(file_info)
+        elif role == Qt.ForegroundRole:
+            if column == COLUMN_LUFS and self.is_outlier(file_info):
+                return QBrush(OUTLIER_COLOR)
+        elif role == Qt.ToolTipRole:
+            if column == COLUMN_LUFS:
+                outlier = self.is_outlier(file_info)
+                if file_info.get('lufs') is not None:
+                    return "要確認: ターゲットから離れています" if outlier else None
+                if file_info.get('estimate') is not None:
+                    if outlier:
+                        return "簡易スキャンの推定値（要確認: ターゲットから離れている可能性があります）"
+                    return "簡易スキャンの推定値"
+        elif role == Qt.TextAlignmentRole:
+            if column == COLUMN_CHANNELS:
+                return Qt.AlignCenter
+            if column == COLUMN_LUFS:
+                return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def contains(self, file_path):
+        return file_path in self._rows_by_path
+
+    def row_of(self, file_path):
+        """パスに対応する行番号（未登録の場合はNone）"""
+        return self._rows_by_path.get(file_path)
+
+    def append_files(self, file_infos):
+        """ファイル情報をまとめて末尾に追加する（登録済みのパスは除外し、追加した件数を返す）"""
+        first = len(self.file_list)
+        new_infos = []
+        for file_info in file_infos:
+            file_path = file_info['path']
+            if file_path not in self._rows_by_path:
+                self._rows_by_path[file_path] = first + len(new_infos)
+                new_infos.append(file_info)
+        if not new_infos:
+            return 0
+        self.beginInsertRows(QModelIndex(), first, first + len(new_infos) - 1)
+        self.file_list.extend(new_infos)
+        self.endInsertRows()
+        return len(new_infos)
+
+    def clear(self):
+        self.beginResetModel()
+        self.file_list.clear()
+        self._rows_by_path.clear()
+        self.endResetModel()
+
+    def file_changed(self, row):
+        """1ファイルの解析結果が変わったことを通知する"""
+        self.dataChanged.emit(
+            self.index(row, ANALYSIS_COLUMNS[0]),
+            self.index(row, ANALYSIS_COLUMNS[-1])
+        )
+
+    def analysis_changed(self):
+        """すべてのファイルの解析結果が変わったことを通知する"""
+        if self.file_list:
+            self.dataChanged.emit(
+                self.index(0, ANALYSIS_COLUMNS[0]),
+                self.index(len(self.file_list) - 1, ANALYSIS_COLUMNS[-1])
+            )
+
+
+class FileFilterProxyModel(QAbstractProxyModel):
+    """FileTableModel の並べ替えと、チャンネル・LUFSによる絞り込みを行うプロキシ
+
+    表示順の元の行番号だけを保持し、並べ替えはPythonのソートでまとめて行う
+    （QSortFilterProxyModel は比較のたびにPythonの data() を呼ぶため、大量の行では遅い）。
+    表示中の行には並べ替えのキー（値と元の行番号の組で、すべての行で異なる）を記録しておき、
+    行の表示位置は二分探索で求める。行の追加・値の変更では、その行だけを挿入・移動・削除する
+    （複数行の変更で多くの行が動く場合は、選択を保つよう並べ替えとしてまとめて通知する）。
+    元のモデルは行の追加とリセットのみを行う前提。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.channel_filter = None
+        self.lufs_min = None
+        self.lufs_max = None
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self._rows = []  # 表示順に並べた元の行番号
+        self._keys = []  # 元の行番号 -> 表示順を決めたときの並べ替えのキー（非表示は None）
+
+    def setSourceModel(self, model):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.dataChanged.connect(self._source_data_changed)
+        self._build()
+        self.endResetModel()
+
+    def set_filter(self, channel_filter, lufs_min, lufs_max):
+        """絞り込み条件を設定（None の条件は使用しない）"""
+        self.channel_filter = channel_filter
+        self.lufs_min = lufs_min
+        self.lufs_max = lufs_max
+        self.beginResetModel()
+        self._build()
+        self.endResetModel()
+
+    def is_filtered(self):
+        return self.channel_filter is not None or self.lufs_min is not None or self.lufs_max is not None
+
+    def accepts(self, file_info):
+        channels = file_info.get('channels')
+        if self.channel_filter == 'unanalyzed':
+            if file_info.get('lufs') is not None:
+                return False
+        elif self.channel_filter == 'outlier':
+            if not self.sourceModel().is_outlier(file_info):
+                return False
+        elif self.channel_filter == 'multi':
+            if channels is None or channels < 3:
+                return False
+        elif self.channel_filter is not None and channels != self.channel_filter:
+            return False
+
+        if self.lufs_min is not None or self.lufs_max is not None:
+            lufs = file_info.get('lufs')
+            if lufs is None:
+                return False
+            if self.lufs_min is not None and lufs < self.lufs_min:
+                return False
+            if self.lufs_max is not None and lufs > self.lufs_max:
+                return False
+        return True
+
+    # QAbstractProxyModel の実装
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self._rows)) or not (0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return self.sourceModel().columnCount()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid() or proxy_index.row() >= len(self._rows):
+            return QModelIndex()
+        return self.sourceModel().index(self._rows[proxy_index.row()], proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        position = self._position_of(source_index.row())
+        if position < 0:
+            return QModelIndex()
+        return self.index(position, source_index.column())
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self._relayout(*self._compute())
+
+    # 内部処理
+
+    def _file_list(self):
+        return self.sourceModel().file_list
+
+    def _descending(self):
+        return self.sort_column in SORT_KEYS and self.sort_order == Qt.DescendingOrder
+
+    def _row_key(self):
+        """元の行番号から並べ替えのキーを求める関数（並べ替えなしの場合は行番号そのもの）
+
+        同じ値の行は元の行番号の順に並ぶよう、キーには行番号を含める。
+        """
+        if self.sort_column not in SORT_KEYS:
+            return lambda row: row
+        key = SORT_KEYS[self.sort_column]
+        file_list = self._file_list()
+        return lambda row: (key(file_list[row]), row)
+
+    def _build(self):
+        self._rows, self._keys = self._compute()
+
+    def _compute(self):
+        """絞り込み・並べ替えの結果を (表示順の元の行番号, 元の行番号ごとのキー) で返す"""
+        file_list = self._file_list()
+        if self.is_filtered():
+            rows = [row for row, file_info in enumerate(file_list) if self.accepts(file_info)]
+        else:
+            rows = list(range(len(file_list)))
+        key = self._row_key()
+        keys = [None] * len(file_list)
+        for row in rows:
+            keys[row] = key(row)
+        if self.sort_column in SORT_KEYS:
+            rows.sort(key=keys.__getitem__, reverse=self._descending())
+        return rows, keys
+
+    def _relayout(self, rows, keys):
+        """表示順を入れ替え、選択などの永続インデックスを新しい位置に移す"""
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        sources = [self.mapToSource(index) for index in persistent]
+        self._rows = rows
+        self._keys = keys
+        self.changePersistentIndexList(persistent, [self.mapFromSource(index) for index in sources])
+        self.layoutChanged.emit()
+
+    def _bisect(self, key):
+        """並べ替えのキーが key の行の表示上の位置（表示していない場合は挿入する位置）"""
+        keys = self._keys
+        rows = self._rows
+        descending = self._descending()
+        low, high = 0, len(rows)
+        while low < high:
+            middle = (low + high) // 2
+            value = keys[rows[middle]]
+            if (value > key) if descending else (value < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _position_of(self, source_row):
+        """元の行番号の表示上の行番号（非表示は -1）"""
+        key = self._keys[source_row] if source_row < len(self._keys) else None
+        return -1 if key is None else self._bisect(key)
+
+    def _source_reset(self):
+        self._build()
+        self.endResetModel()
+
+    def _source_rows_inserted(self, parent, first, last):
+        file_list = self._file_list()
+        self._keys.extend([None] * (last - first + 1))
+        accepted = [row for row in range(first, last + 1)
+                    if not self.is_filtered() or self.accepts(file_list[row])]
+        if not accepted:
+            return
+        key = self._row_key()
+        new_keys = {row: key(row) for row in accepted}
+        if self.sort_column in SORT_KEYS:
+            accepted.sort(key=new_keys.__getitem__, reverse=self._descending())
+
+        # 既存の行の間の挿入位置ごとにまとめ、後ろの位置から挿入する（前の位置がずれないように）
+        groups = []
+        for row in accepted:
+            position = self._bisect(new_keys[row])
+            if groups and groups[-1][0] == position:
+                groups[-1][1].append(row)
+            else:
+                groups.append((position, [row]))
+        for position, rows in reversed(groups):
+            self.beginInsertRows(QModelIndex(), position, position + len(rows) - 1)
+            self._rows[position:position] = rows
+            for row in rows:
+                self._keys[row] = new_keys[row]
+            self.endInsertRows()
+
+    def _source_data_changed(self, top_left, bottom_right, roles=()):
+        first, last = top_left.row(), bottom_right.row()
+        first_column, last_column = top_left.column(), bottom_right.column()
+        if first == last:
+            self._source_row_changed(first, first_column, last_column)
+            return
+        if not self.is_filtered() and self.sort_column not in SORT_KEYS:
+            self.dataChanged.emit(self.index(first, first_column), self.index(last, last_column))
+            return
+
+        # 表示位置・表示の有無が変わる行だけを移動・挿入・削除し、残りは値の変更のみを通知する
+        file_list = self._file_list()
+        key = self._row_key()
+        filtered = self.is_filtered()
+        moved = [row for row in range(first, last + 1)
+                 if self._keys[row] != (key(row) if not filtered or self.accepts(file_list[row]) else None)]
+        if len(moved) > INCREMENTAL_CHANGE_LIMIT:
+            rows, keys = self._compute()
+            if len(rows) == len(self._rows) and set(rows) == set(self._rows):
+                self._relayout(rows, keys)
+            else:
+                # 表示する行が大きく入れ替わる場合はやり直す
+                self.beginResetModel()
+                self._rows, self._keys = rows, keys
+                self.endResetModel()
+                return
+        else:
+            for row in moved:
+                self._source_row_changed(row, first_column, last_column)
+        if self._rows:
+            self.dataChanged.emit(self.index(0, first_column), self.index(len(self._rows) - 1, last_column))
+
+    def _source_row_changed(self, source_row, first_column, last_column):
+        position = self._position_of(source_row)
+        accepted = not self.is_filtered() or self.accepts(self._file_list()[source_row])
+
+        if position >= 0 and not accepted:
+            # 条件に合わなくなった行を取り除く
+            self.beginRemoveRows(QModelIndex(), position, position)
+            del self._rows[position]
+            self._keys[source_row] = None
+            self.endRemoveRows()
+            return
+
+        key = self._row_key()(source_row)
+        if position < 0:
+            if accepted:
+                position = self._bisect(key)
+                self.beginInsertRows(QModelIndex(), position, position)
+                self._rows.insert(position, source_row)
+                self._keys[source_row] = key
+                self.endInsertRows()
+            return
+
+        if key != self._keys[source_row]:
+            # 並び順が変わった行は、選択やスクロール位置を保つよう移動として通知する
+            del self._rows[position]
+            target = self._bisect(key)
+            self._rows.insert(position, source_row)
+            if target != position:
+                self.beginMoveRows(QModelIndex(), position, position, QModelIndex(),
+                                   target + 1 if target > position else target)
+                del self._rows[position]
+                self._rows.insert(target, source_row)
+                self._keys[source_row] = key
+                self.endMoveRows()
+                position = target
+            else:
+                self._keys[source_row] = key
+        self.dataChanged.emit(self.index(position, first_column), self.index(position, last_column))
@@ -0,0 +1,116 @@
+import os
+import math
+import shutil
+import tempfile
+
+# mutagenはm4aにタグを書き込む場合のみ必要（ffmpegはiTunes形式の任意のタグを書き込めない）
+try:
+    from mutagen.mp4 import MP4, MP4FreeForm
+except ImportError:
+    MP4 = None
+
+# タグを書き込める形式（拡張子 -> コンテナ）
+TAG_CONTAINERS = {
+    '.mp3': 'id3',
+    '.flac': 'flac',
+    '.ogg': 'ogg',
+    '.opus': 'ogg',
+    '.m4a': 'mp4',
+}
+
+REPLAYGAIN_GAIN_KEY = 'REPLAYGAIN_TRACK_GAIN'
+REPLAYGAIN_PEAK_KEY = 'REPLAYGAIN_TRACK_PEAK'
+R128_GAIN_KEY = 'R128_TRACK_GAIN'
+
+REPLAYGAIN_ALBUM_GAIN_KEY = 'REPLAYGAIN_ALBUM_GAIN'
+REPLAYGAIN_ALBUM_PEAK_KEY = 'REPLAYGAIN_ALBUM_PEAK'
+R128_ALBUM_GAIN_KEY = 'R128_ALBUM_GAIN'
+
+# ゲインの基準のラウドネス（ReplayGain 2.0 は -18 LUFS、R128_*_GAIN は -23 LUFS（RFC 7845））
+# ターゲットLUFSとの差はプレーヤーのプリアンプで調整する
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+R128_REFERENCE_LUFS = -23.0
+
+# R128_TRACK_GAIN は1/256dB単位の16bit整数（RFC 7845）
+R128_GAIN_SCALE = 256
+R128_GAIN_LIMIT = 32767
+
+# m4aの任意のタグ（iTunes形式のfreeformアトム）
+MP4_FREEFORM_PREFIX = "----:com.apple.iTunes:"
+
+
+class TagError(Exception):
+    """ゲインタグを書き込めないファイル"""
+
+
+def is_available():
+    """m4aへの書き込みに必要なmutagenがあるか"""
+    return MP4 is not None
+
+
+def container_of(file_path):
+    return TAG_CONTAINERS.get(os.path.splitext(file_path)[1].lower())
+
+
+def track_gain_tags(lufs, true_peak, codec):
+    """測定値からトラックゲインのタグを作成する（値が空文字列のタグは削除）
+
+    ゲインは各形式の基準のラウドネス（REPLAYGAIN_REFERENCE_LUFS・R128_REFERENCE_LUFS）に対する値。
+    Opusは R128_TRACK_GAIN のみを使用し、ReplayGainのタグは削除する。
+    """
+    return _gain_tags(lufs, true_peak, codec, REPLAYGAIN_GAIN_KEY, REPLAYGAIN_PEAK_KEY, R128_GAIN_KEY)
+
+
+def album_gain_tags(lufs, true_peak, codec):
+    """アルバム全体の測定値からアルバムゲインのタグを作成する（track_gain_tags と同じ形式）"""
+    return _gain_tags(lufs, true_peak, codec, REPLAYGAIN_ALBUM_GAIN_KEY, REPLAYGAIN_ALBUM_PEAK_KEY, R128_ALBUM_GAIN_KEY)
+
+
+def _gain_tags(lufs, true_peak, codec, gain_key, peak_key, r128_key):
+    if codec == 'opus':
+        gain = R128_REFERENCE_LUFS - lufs
+        r128_gain = max(-R128_GAIN_LIMIT - 1, min(R128_GAIN_LIMIT, int(round(gain * R128_GAIN_SCALE))))
+        return {r128_key: str(r128_gain), gain_key: "", peak_key: ""}
+
+    gain = REPLAYGAIN_REFERENCE_LUFS - lufs
+    tags = {gain_key: f"{gain:.2f} dB", peak_key: ""}
+    if true_peak is not None and math.isfinite(true_peak):
+        tags[peak_key] = f"{10 ** (true_peak / 20):.6f}"
+    return tags
+
+
+def write_mp4_tags(input_path, output_path, tags):
+    """m4aにタグを書き込む（output_path が異なる場合はコピーしてから書き込む）"""
+    if MP4 is None:
+        raise TagError("m4aにゲインタグを書き込むにはmutagenが必要です")
+
+    if os.path.abspath(input_path) == os.path.abspath(output_path):
+        update_mp4_tags(output_path, tags)
+        return
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".tags-", suffix=".m4a", dir=directory)
+    os.close(fd)
+    try:
+        shutil.copyfile(input_path, temp_path)
+        update_mp4_tags(temp_path, tags)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def update_mp4_tags(file_path, tags):
+    audio = MP4(file_path)
+    if audio.tags is None:
+        audio.add_tags()
+    for key, value in tags.items():
+        atom = MP4_FREEFORM_PREFIX + key.lower()
+        if value:
+            audio.tags[atom] = [MP4FreeForm(value.encode('utf-8'))]
+        else:
+            audio.tags.pop(atom, None)
+    audio.save()
@@ -0,0 +1,235 @@
+import os
+import re
+import sys
+import queue
+import threading
+
+# 自動の場合の、HDD・ネットワーク共有から同時に読み込むファイル数
+SLOW_DEVICE_READERS = 2
+# 次のファイルを先読みする最大バイト数（ページキャッシュを大きなファイルで埋めないよう先頭のみ）
+PREFETCH_BYTES = 64 * 1024 * 1024
+PREFETCH_CHUNK_SIZE = 1024 * 1024
+# 読み込む数を制限するデバイスで、処理の前にまとめて読み込む最大バイト数
+# （デバイスの枠はこの読み込みの間だけ使い、残りは処理しながら読む）
+LOAD_BYTES = 256 * 1024 * 1024
+# ネットワーク上のファイルシステム（/proc/self/mounts の種類）
+NETWORK_FILESYSTEMS = frozenset((
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', 'ceph', 'glusterfs', 'fuse.sshfs', '9p',
+))
+# /proc/self/mounts で空白などを表す8進数のエスケープ
+MOUNT_ESCAPE_PATTERN = re.compile(r'\\([0-7]{3})')
+
+
+def _read_mounts():
+    """/proc/self/mounts の (マウントポイント, 種類) のリスト（Linux以外では空）"""
+    try:
+        with open('/proc/self/mounts', encoding='utf-8', errors='replace') as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            mount_point = MOUNT_ESCAPE_PATTERN.sub(lambda match: chr(int(match.group(1), 8)), fields[1])
+            mounts.append((mount_point, fields[2]))
+    return mounts
+
+
+def is_network_path(file_path, mounts=None):
+    """ネットワーク共有上のファイルか（判定できない場合は False）"""
+    if sys.platform == 'win32':
+        return os.path.abspath(file_path).startswith('\\\\')
+    real_path = os.path.realpath(file_path)
+    best = ""
+    fstype = None
+    for mount_point, mount_type in (_read_mounts() if mounts is None else mounts):
+        prefix = os.path.join(mount_point, '')
+        if (real_path == mount_point or real_path.startswith(prefix)) and len(mount_point) >= len(best):
+            best = mount_point
+            fstype = mount_type
+    return fstype in NETWORK_FILESYSTEMS
+
+
+def is_rotational(device):
+    """デバイス番号 device のディスクがHDDか（判定できない場合はNone）"""
+    if not hasattr(os, 'major'):
+        return None
+    base = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    # パーティションの場合は親のディスクの設定を見る
+    for path in (f"{base}/queue/rotational", f"{base}/../queue/rotational"):
+        try:
+            with open(path, encoding='ascii') as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+class DeviceGroup:
+    """同じデバイス上のファイル（読み込む順に並べた file_list 上の位置）と同時に読み込める数"""
+
+    def __init__(self, device, readers, order):
+        self.device = device
+        self.readers = readers  # Noneの場合は制限しない
+        # 読み込む順序（'inode': HDD、'directory': ネットワーク共有、'list': 指定された順）
+        self.order = order
+        self.pending = []  # (並べ替えのキー, 位置)
+        self.active = 0
+
+    def sort_key(self, file_path, inode, i):
+        if self.order == 'inode':
+            return (inode, i)
+        if self.order == 'directory':
+            return (os.path.dirname(os.path.abspath(file_path)), i)
+        return (i,)
+
+
+class IOScheduler:
+    """読み込むデバイスを考慮してファイルを処理する順序を決める
+
+    ファイルをデバイス（st_dev）ごとにまとめ、HDDでは inode の順（ディスク上の配置に近い順）、
+    ネットワーク共有ではパスの順に並べる。HDD・ネットワーク共有は同時に読み込む数を
+    readers_per_device 個（Noneの場合は SLOW_DEVICE_READERS、0の場合は制限しない）に制限し、
+    デバイスを順に切り替えて取り出す。取り出すたびに同じデバイスの次のファイルを別スレッドで先読みする。
+    take() で取り出したファイルは load() で読み込んでから release() し、デコード・エンコードの間は
+    デバイスの枠を使わない（同時に処理するファイルの数は呼び出し側の並列数で決まる）。
+    """
+
+    def __init__(self, paths, readers_per_device=None, prefetch=True):
+        self.groups = []
+        self._group_of = {}
+        self._condition = threading.Condition()
+        self._remaining = len(paths)
+        self._next_group = 0
+        self._read_ahead = ReadAhead() if prefetch and paths else None
+
+        mounts = _read_mounts()
+        groups = {}
+        for i, file_path in enumerate(paths):
+            try:
+                stat = os.stat(file_path)
+                device, inode = stat.st_dev, stat.st_ino
+            except (OSError, TypeError, ValueError):
+                device, inode = None, 0
+            group = groups.get(device)
+            if group is None:
+                group = groups[device] = self._new_group(device, file_path, readers_per_device, mounts)
+                self.groups.append(group)
+            group.pending.append((group.sort_key(file_path, inode, i), i))
+            self._group_of[i] = group
+        for group in self.groups:
+            # 末尾から取り出すため逆順に並べる
+            group.pending.sort(reverse=True)
+        self._paths = paths
+
+    @staticmethod
+    def _new_group(device, file_path, readers_per_device, mounts):
+        if device is None:
+            return DeviceGroup(None, None, 'list')
+        network = is_network_path(file_path, mounts)
+        rotational = not network and bool(is_rotational(device))
+        if readers_per_device is None:
+            readers = SLOW_DEVICE_READERS if network or rotational else None
+        else:
+            readers = readers_per_device or None
+        order = 'directory' if network else 'inode' if rotational else 'list'
+        return DeviceGroup(device, readers, order)
+
+    def take(self):
+        """次に処理するファイルの位置を返す（読み込める数に空きができるまで待つ、すべて取り出した場合はNone）"""
+        with self._condition:
+            while True:
+                if self._remaining == 0:
+                    return None
+                group = self._available_group()
+                if group is not None:
+                    break
+                self._condition.wait()
+            _, i = group.pending.pop()
+            group.active += 1
+            self._remaining -= 1
+            if group.pending and self._read_ahead is not None:
+                self._read_ahead.request(self._paths[group.pending[-1][1]])
+            return i
+
+    def load(self, i):
+        """読み込む数を制限するデバイスのファイルは、先頭 LOAD_BYTES をページキャッシュに読み込む
+
+        take() と release() の間に呼ぶ。まとまった読み込みをデバイスごとに readers 個までに保ち、
+        その後の処理ではページキャッシュから読む。
+        """
+        if self._group_of[i].readers is None:
+            return
+        try:
+            prefetch(self._paths[i], LOAD_BYTES, wait=True)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def release(self, i):
+        """take() で取り出したファイルの読み込みが終わった"""
+        with self._condition:
+            self._group_of[i].active -= 1
+            self._condition.notify_all()
+
+    def close(self):
+        if self._read_ahead is not None:
+            self._read_ahead.close()
+
+    def _available_group(self):
+        # デバイスを順に切り替え、複数のデバイスを同時に使う
+        count = len(self.groups)
+        for offset in range(count):
+            group = self.groups[(self._next_group + offset) % count]
+            if group.pending and (group.readers is None or group.active < group.readers):
+                self._next_group = (self._next_group + offset + 1) % count
+                return group
+        return None
+
+
+class ReadAhead:
+    """ファイルの先頭 PREFETCH_BYTES をページキャッシュに読み込むスレッド
+
+    posix_fadvise(WILLNEED) を使える場合はカーネルに先読みを依頼し、それ以外は実際に読み込む。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, file_path):
+        self._queue.put(file_path)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            file_path = self._queue.get()
+            if file_path is None:
+                return
+            try:
+                prefetch(file_path)
+            except OSError:
+                pass
+
+
+def prefetch(file_path, length=PREFETCH_BYTES, wait=False):
+    """ファイルの先頭 length バイトをページキャッシュに読み込む
+
+    wait が False の場合は posix_fadvise(WILLNEED) を使えればカーネルに依頼するだけで戻り、
+    True の場合は読み込みが終わるまで待つ。
+    """
+    with open(file_path, 'rb') as f:
+        if not wait and hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+            return
+        buffer = bytearray(PREFETCH_CHUNK_SIZE)
+        remaining = length
+        while remaining > 0:
+            read = f.readinto(buffer)
+            if not read:
+                return
+            remaining -= read
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# ファイルごとの処理状態
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobJournal:
+    """バッチの設定とファイルごとの処理状態をディスクに記録するジャーナル
+
+    1ファイルの結果ごとにコミットするため、アプリケーションが異常終了しても
+    それまでに完了したファイルの記録は残り、中断したバッチを途中から再開できる。
+    完了したファイルは出力ファイル（複数の場合はすべて）のサイズと更新日時も記録し、
+    再開時には出力が変更・削除されていないものだけを完了済みとして扱う。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # 正規化ワーカーの複数スレッドから共有するため、接続はロックで保護する
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1),"
+                " settings TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " position INTEGER PRIMARY KEY,"
+                " path TEXT NOT NULL UNIQUE,"
+                " status TEXT NOT NULL,"
+                " outputs TEXT,"
+                " error TEXT,"
+                " updated REAL)"
+            )
+            self._conn.commit()
+
+    def begin(self, settings, paths):
+        """新しいバッチを開始する（前のバッチの記録は破棄）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM job")
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute(
+                "INSERT INTO job (id, settings, created) VALUES (1, ?, ?)",
+                (json.dumps(settings), time.time())
+            )
+            self._insert_pending(paths)
+            self._conn.commit()
+
+    def add(self, paths):
+        """再開するバッチに含まれていなかったファイルを未処理として追加する"""
+        with self._lock:
+            self._insert_pending(paths)
+            self._conn.commit()
+
+    def load(self):
+        """記録されているバッチの (設定, ファイルパスの一覧) を返す（記録がない場合はNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT settings FROM job WHERE id = 1").fetchone()
+            if row is None:
+                return None
+            paths = [path for path, in self._conn.execute("SELECT path FROM files ORDER BY position")]
+        return json.loads(row[0]), paths
+
+    def mark_done(self, file_path, output):
+        """完了を記録する（output は出力先のパス、または複数の出力先のパスのリスト）
+
+        出力の状態を取得できない場合は、再開時に処理し直すよう失敗として記録する。
+        """
+        outputs = []
+        for output_path in ([output] if isinstance(output, str) else output):
+            try:
+                stat = os.stat(output_path)
+            except OSError as e:
+                self.mark_failed(file_path, f"出力ファイルを確認できません: {e}")
+                return
+            outputs.append((output_path, stat.st_size, stat.st_mtime_ns))
+        self._update(file_path, STATUS_DONE, json.dumps({'output': output, 'files': outputs}), None)
+
+    def mark_failed(self, file_path, error):
+        self._update(file_path, STATUS_FAILED, None, error)
+
+    def completed_output(self, file_path):
+        """完了済みで出力が記録時のままであれば mark_done に渡した出力先を返す（それ以外はNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT outputs FROM files WHERE path = ? AND status = ?",
+                (file_path, STATUS_DONE)
+            ).fetchone()
+        if row is None:
+            return None
+        recorded = json.loads(row[0])
+        for output_path, size, mtime_ns in recorded['files']:
+            try:
+                stat = os.stat(output_path)
+            except OSError:
+                return None
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                return None
+        return recorded['output']
+
+    def pending(self, file_list):
+        """file_list のうち、完了済みでない（または出力が変更された）ファイルを返す"""
+        return [file_info for file_info in file_list if self.completed_output(file_info['path']) is None]
+
+    def has_unfinished(self):
+        """完了していないファイルが残っているバッチがあるか"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM files WHERE status != ?", (STATUS_DONE,)
+            ).fetchone()
+        return row[0] > 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _insert_pending(self, paths):
+        # 呼び出し側でロック済み
+        position = self._conn.execute("SELECT COALESCE(MAX(position), -1) FROM files").fetchone()[0]
+        rows = []
+        for path in paths:
+            position += 1
+            rows.append((position, path, STATUS_PENDING))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO files (position, path, status) VALUES (?, ?, ?)", rows
+        )
+
+    def _update(self, file_path, status, outputs, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET status = ?, outputs = ?, error = ?, updated = ? WHERE path = ?",
+                (status, outputs, error, time.time(), file_path)
+            )
+            self._conn.commit()
@@ -1 +1,2 @@
 pyinstaller --noconsole --icon "app.ico" --add-data "app.ico;." --onefile audio_normalizer.py
+pyinstaller --console --icon "app.ico" --onefile audio_normalizer_cli.py
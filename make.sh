@@ -1,3 +1,4 @@
 #!/bin/bash
 
 pyinstaller --noconsole --icon "app.ico" --add-data "app.ico;." --onefile audio_normalizer.py
+pyinstaller --console --icon "app.ico" --onefile audio_normalizer_cli.py
@@ -0,0 +1,449 @@
+import os
+import math
+import shutil
+import struct
+import tempfile
+from functools import lru_cache
+
+# global_gain の1単位あたりの音量変化（2^(1/4) 倍 = 1.5dB）
+GAIN_STEP_DB = 1.5
+GLOBAL_GAIN_MAX = 255
+
+# Layer III のビットレート（kbps、インデックス0はフリーフォーマット）
+MPEG1_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MPEG2_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+# バージョンのビット（0: MPEG2.5, 2: MPEG2, 3: MPEG1）ごとのサンプリング周波数
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+# 1フレームの最大長（MPEG1 320kbps 32kHz + パディング）
+MAX_FRAME_LENGTH = 1441
+
+# ファイルを読み込む単位（バイト）
+READ_CHUNK_SIZE = 1024 * 1024
+
+# VBRヘッダのフレーム（音声データを含まず、LAMEタグにはフレーム内容のCRCがあるため変更しない）
+VBR_HEADER_TAGS = (b'Xing', b'Info')
+VBRI_OFFSET = 36
+
+# mp3gain と互換の取り消し情報（APEv2タグの項目）
+UNDO_KEY = "MP3GAIN_UNDO"
+
+APE_PREAMBLE = b'APETAGEX'
+APE_VERSION = 2000
+APE_HEADER_SIZE = 32
+APE_FLAG_HAS_HEADER = 0x80000000
+APE_FLAG_IS_HEADER = 0x20000000
+ID3V1_SIZE = 128
+
+
+class MP3FormatError(Exception):
+    """global_gain を書き換えられないMP3（フリーフォーマット、フレームが見つからないなど）"""
+
+
+def gain_steps(lufs, target_lufs, true_peak=None, peak_ceiling=None):
+    """ターゲットまでの音量差を global_gain の単位数に変換する
+
+    true_peak と peak_ceiling（dBTP）を指定すると、ピークが上限を超えない範囲に抑える
+    （1.5dB単位のため、結果のラウドネスはターゲットから最大0.75dBずれる）。
+    """
+    steps = int(round((target_lufs - lufs) / GAIN_STEP_DB))
+    if true_peak is not None and peak_ceiling is not None and math.isfinite(true_peak):
+        steps = min(steps, int(math.floor((peak_ceiling - true_peak) / GAIN_STEP_DB)))
+    return steps
+
+
+@lru_cache(maxsize=None)
+def parse_frame_header(header):
+    """フレームヘッダ（32bit整数）を解析する
+
+    Layer III のフレームであれば (フレーム長, サイド情報の位置, サイド情報の長さ, global_gain のビット位置, CRCの有無)
+    を返し、それ以外は None を返す。
+    """
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 3
+    layer = (header >> 17) & 3
+    protected = not (header >> 16) & 1
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    padding = (header >> 9) & 1
+    mono = (header >> 6) & 3 == 3
+    # Layer III 以外・予約値・フリーフォーマットは対象外
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    if mpeg1:
+        length = 144000 * MPEG1_BITRATES[bitrate_index] // sample_rate + padding
+    else:
+        length = 72000 * MPEG2_BITRATES[bitrate_index] // sample_rate + padding
+
+    channels = 1 if mono else 2
+    if mpeg1:
+        # main_data_begin(9) + private_bits(5/3) + scfsi(4/ch)、1グラニュール・1チャンネルあたり59bit
+        side_info_length = 17 if mono else 32
+        start = 9 + (5 if mono else 3) + 4 * channels
+        offsets = tuple(start + i * 59 + 21 for i in range(2 * channels))
+    else:
+        # main_data_begin(8) + private_bits(1/2)、1グラニュールのみで1チャンネルあたり63bit
+        side_info_length = 9 if mono else 17
+        start = 8 + (1 if mono else 2)
+        offsets = tuple(start + i * 63 + 21 for i in range(channels))
+    side_info_offset = 6 if protected else 4
+    return length, side_info_offset, side_info_length, offsets, protected
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc=0xFFFF):
+    """MPEGオーディオのCRC-16（多項式 0x8005、初期値 0xFFFF）"""
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def frame_gains(data, pos, frame):
+    """data[pos:] のフレームの各グラニュール・チャンネルの global_gain を返す"""
+    base = pos + frame[1]
+    gains = []
+    for bit in frame[3]:
+        index = base + (bit >> 3)
+        value = (data[index] << 8) | data[index + 1]
+        gains.append((value >> (8 - (bit & 7))) & 0xFF)
+    return gains
+
+
+def limit_steps(steps, gain_range):
+    """どのフレームの global_gain も 0〜GLOBAL_GAIN_MAX の範囲に収まるよう steps を制限する
+
+    gain_range はファイル内の global_gain の (最小値, 最大値)（mp3gain と同じ方法）。
+    """
+    low, high = gain_range
+    return max(-low, min(GLOBAL_GAIN_MAX - high, steps))
+
+
+def patch_frame(data, pos, frame, steps):
+    """data[pos:] のフレームの global_gain を steps だけ変更し、範囲外に丸めた数を返す"""
+    _, side_info_offset, side_info_length, offsets, protected = frame
+    base = pos + side_info_offset
+    clipped = 0
+    for bit in offsets:
+        index = base + (bit >> 3)
+        shift = 8 - (bit & 7)
+        value = (data[index] << 8) | data[index + 1]
+        gain = ((value >> shift) & 0xFF) + steps
+        if gain < 0 or gain > GLOBAL_GAIN_MAX:
+            gain = min(max(gain, 0), GLOBAL_GAIN_MAX)
+            clipped += 1
+        value = (value & ~(0xFF << shift)) | (gain << shift)
+        data[index] = (value >> 8) & 0xFF
+        data[index + 1] = value & 0xFF
+    if protected:
+        # CRCはヘッダの後半2バイトとサイド情報が対象
+        crc = crc16(data[pos + 2:pos + 4])
+        crc = crc16(data[base:base + side_info_length], crc)
+        data[pos + 4] = crc >> 8
+        data[pos + 5] = crc & 0xFF
+    return clipped
+
+
+def is_vbr_header(data, pos, frame):
+    start = pos + frame[1] + frame[2]
+    return (bytes(data[start:start + 4]) in VBR_HEADER_TAGS
+            or bytes(data[pos + VBRI_OFFSET:pos + VBRI_OFFSET + 4]) == b'VBRI')
+
+
+def frame_at(data, pos):
+    if pos + 4 > len(data) or data[pos] != 0xFF:
+        return None
+    return parse_frame_header(int.from_bytes(data[pos:pos + 4], 'big'))
+
+
+def walk_frames(src, length, on_frame, dst=None, on_chunk=None):
+    """src から length バイトの音声データを読み、音声のフレームごとに on_frame(data, pos, frame) を呼ぶ
+
+    先頭のVBRヘッダのフレームは対象外。dst を指定すると、on_frame で変更した内容を含め
+    読み込んだデータをすべて dst に書き込む（フレームではない部分はそのまま）。戻り値はフレーム数。
+    on_chunk(読み込んだバイト数) は読み込みのたびに呼ばれる（キャンセルの確認などに使用）。
+    """
+    remaining = length
+    data = bytearray()
+    pos = 0
+    frames = 0
+    synced = False
+    while True:
+        if remaining and len(data) - pos < MAX_FRAME_LENGTH + 4:
+            if dst is not None:
+                dst.write(data[:pos])
+            del data[:pos]
+            pos = 0
+            chunk = src.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            data += chunk
+            if on_chunk is not None:
+                on_chunk(length - remaining)
+            continue
+
+        frame = frame_at(data, pos)
+        if frame is not None and pos + frame[0] > len(data):
+            # 末尾の不完全なフレームは変更しない
+            frame = None
+        if frame is not None and not synced:
+            # 同期が外れている間は、次のフレームも続いている場合のみフレームとみなす
+            next_pos = pos + frame[0]
+            if next_pos + 4 <= len(data) and frame_at(data, next_pos) is None:
+                frame = None
+        if frame is None:
+            synced = False
+            next_sync = data.find(b'\xff', pos + 1)
+            if next_sync == -1:
+                pos = len(data)
+                if not remaining:
+                    break
+            else:
+                pos = next_sync
+            continue
+
+        synced = True
+        if not (frames == 0 and is_vbr_header(data, pos, frame)):
+            on_frame(data, pos, frame)
+            frames += 1
+        pos += frame[0]
+        if pos >= len(data) and not remaining:
+            break
+    if dst is not None:
+        dst.write(data)
+    return frames
+
+
+def patch_frames(src, dst, length, steps, on_chunk=None):
+    """src から length バイトの音声データを読み、各フレームの global_gain を変更して dst に書き込む
+
+    戻り値は (変更したフレーム数, 範囲外に丸めた数)。
+    """
+    clipped = 0
+
+    def on_frame(data, pos, frame):
+        nonlocal clipped
+        clipped += patch_frame(data, pos, frame, steps)
+
+    frames = walk_frames(src, length, on_frame, dst, on_chunk)
+    return frames, clipped
+
+
+def scan_gain_range(src, length, on_chunk=None):
+    """src から length バイトの音声データを読み、global_gain の (最小値, 最大値) を返す（フレームがない場合はNone）"""
+    low = GLOBAL_GAIN_MAX
+    high = 0
+
+    def on_frame(data, pos, frame):
+        nonlocal low, high
+        gains = frame_gains(data, pos, frame)
+        low = min(low, *gains)
+        high = max(high, *gains)
+
+    if not walk_frames(src, length, on_frame, on_chunk=on_chunk):
+        return None
+    return low, high
+
+
+def id3v2_size(src):
+    """ファイル先頭のID3v2タグの長さ（ない場合は0）"""
+    src.seek(0)
+    header = src.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    # フッタがある場合はさらに10バイト
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def read_ape_tag(src, end):
+    """end の直前にあるAPEv2タグを読み込み (タグの開始位置, {キー: (フラグ, 値)}) を返す（ない場合は (None, {})）"""
+    if end < APE_HEADER_SIZE:
+        return None, {}
+    src.seek(end - APE_HEADER_SIZE)
+    footer = src.read(APE_HEADER_SIZE)
+    if footer[:8] != APE_PREAMBLE:
+        return None, {}
+    _, tag_size, count, flags = struct.unpack('<4I', footer[8:24])
+    start = end - tag_size - (APE_HEADER_SIZE if flags & APE_FLAG_HAS_HEADER else 0)
+    if tag_size < APE_HEADER_SIZE or start < 0:
+        return None, {}
+    src.seek(end - tag_size)
+    body = src.read(tag_size - APE_HEADER_SIZE)
+
+    items = {}
+    offset = 0
+    for _ in range(count):
+        if offset + 8 > len(body):
+            break
+        value_size, item_flags = struct.unpack('<2I', body[offset:offset + 8])
+        key_end = body.find(b'\0', offset + 8)
+        if key_end == -1:
+            break
+        key = body[offset + 8:key_end].decode('ascii', errors='replace')
+        items[key] = (item_flags, body[key_end + 1:key_end + 1 + value_size])
+        offset = key_end + 1 + value_size
+    return start, items
+
+
+def build_ape_tag(items):
+    """ヘッダとフッタを持つAPEv2タグのバイト列を作成する"""
+    body = b''.join(
+        struct.pack('<2I', len(value), item_flags) + key.encode('ascii') + b'\0' + value
+        for key, (item_flags, value) in items.items()
+    )
+    tag_size = len(body) + APE_HEADER_SIZE
+
+    def header(flags):
+        return APE_PREAMBLE + struct.pack('<4I', APE_VERSION, tag_size, len(items), flags) + b'\0' * 8
+
+    return header(APE_FLAG_HAS_HEADER | APE_FLAG_IS_HEADER) + body + header(APE_FLAG_HAS_HEADER)
+
+
+def parse_undo(value):
+    """MP3GAIN_UNDO の値（"+003,+003,N" の形式）から適用済みの単位数を返す"""
+    try:
+        return int(value.decode('ascii').split(',')[0])
+    except (AttributeError, ValueError, IndexError):
+        return 0
+
+
+def read_applied_steps(file_path):
+    """取り消し情報に記録されている適用済みの単位数（記録がない場合は0）"""
+    with open(file_path, 'rb') as src:
+        end = os.fstat(src.fileno()).st_size
+        src.seek(max(0, end - ID3V1_SIZE))
+        if src.read(3) == b'TAG':
+            end -= ID3V1_SIZE
+        _, items = read_ape_tag(src, end)
+    return parse_undo(items.get(UNDO_KEY, (0, None))[1])
+
+
+def audio_bounds(src):
+    """音声データの範囲とタグを (開始位置, 終了位置, APEv2タグの項目, ID3v1タグ) で返す"""
+    size = os.fstat(src.fileno()).st_size
+    audio_start = id3v2_size(src)
+    audio_end = size
+    src.seek(max(audio_start, size - ID3V1_SIZE))
+    id3v1 = src.read(ID3V1_SIZE)
+    if len(id3v1) == ID3V1_SIZE and id3v1[:3] == b'TAG':
+        audio_end -= ID3V1_SIZE
+    else:
+        id3v1 = b''
+    ape_start, items = read_ape_tag(src, audio_end)
+    if ape_start is not None and ape_start >= audio_start:
+        audio_end = ape_start
+    else:
+        items = {}
+    return audio_start, audio_end, items, id3v1
+
+
+def chunk_callback(length, on_progress, check):
+    """読み込みのたびに check() を呼び、読み込んだ割合を on_progress に通知する関数を返す"""
+    def on_chunk(done):
+        if check is not None:
+            check()
+        if on_progress is not None and length:
+            on_progress(done / length)
+    return on_chunk
+
+
+def gain_range(input_path, on_progress=None, check=None):
+    """ファイル内の global_gain の (最小値, 最大値) を返す（limit_steps に渡す）"""
+    with open(input_path, 'rb') as src:
+        audio_start, audio_end, _, _ = audio_bounds(src)
+        src.seek(audio_start)
+        length = audio_end - audio_start
+        result = scan_gain_range(src, length, chunk_callback(length, on_progress, check))
+    if result is None:
+        raise MP3FormatError("MPEG Layer III のフレームが見つかりません")
+    return result
+
+
+def write_gain(input_path, output_path, steps, on_progress=None, check=None):
+    """global_gain を steps（1.5dB単位）だけ変更した内容を output_path に書き込む
+
+    output_path は input_path とは別のファイル（書き込み途中の一時ファイルなど）を指定する。
+    steps は limit_steps で範囲内に制限しておくこと。
+    変更量はAPEv2タグの MP3GAIN_UNDO に累積して記録し、undo_gain で元に戻せる。
+    戻り値は {'frames': 変更したフレーム数, 'clipped': 範囲外に丸めた数, 'steps': steps}。
+    """
+    with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+        audio_start, audio_end, items, id3v1 = audio_bounds(src)
+        src.seek(0)
+        dst.write(src.read(audio_start))
+        length = audio_end - audio_start
+        frames, clipped = patch_frames(src, dst, length, steps, chunk_callback(length, on_progress, check))
+        if not frames:
+            raise MP3FormatError("MPEG Layer III のフレームが見つかりません")
+
+        applied = parse_undo(items.get(UNDO_KEY, (0, None))[1]) + steps
+        if applied:
+            items[UNDO_KEY] = (0, f"{applied:+04d},{applied:+04d},N".encode('ascii'))
+        else:
+            items.pop(UNDO_KEY, None)
+        if items:
+            dst.write(build_ape_tag(items))
+        dst.write(id3v1)
+    return {'frames': frames, 'clipped': clipped, 'steps': steps}
+
+
+def apply_gain(input_path, output_path, steps, on_progress=None, check=None):
+    """global_gain を steps（1.5dB単位）だけ変更したファイルを output_path に作成する
+
+    デコード・再エンコードは行わずフレームのサイド情報のみを書き換える。
+    書き込む前にファイル内の global_gain の範囲を調べ、どのフレームも範囲外にならないよう steps を制限する。
+    出力は一時ファイルに書き込んでから置き換えるため、input_path と同じパスも指定できる
+    （同じパスで変更量が0の場合は書き換えない）。
+    on_progress(割合) で進捗を通知し、check() は読み込みのたびに呼ばれる（例外を送出すると中断）。
+    戻り値は write_gain の戻り値に 'requested'（指定した steps）を加えたもの。
+    """
+    requested = steps
+    steps = limit_steps(steps, gain_range(input_path, on_progress and (lambda f: on_progress(f / 2)), check))
+    if steps == 0 and os.path.abspath(input_path) == os.path.abspath(output_path):
+        return {'frames': 0, 'clipped': 0, 'steps': 0, 'requested': requested}
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".mp3gain-", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        result = write_gain(input_path, temp_path, steps, on_progress and (lambda f: on_progress(0.5 + f / 2)), check)
+        shutil.copymode(input_path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    result['requested'] = requested
+    return result
+
+
+def undo_gain(input_path, output_path=None, on_progress=None, check=None):
+    """MP3GAIN_UNDO に記録された変更を取り消す（output_path を省略した場合は上書き）"""
+    applied = read_applied_steps(input_path)
+    return apply_gain(input_path, output_path or input_path, -applied, on_progress, check)
@@ -0,0 +1,390 @@
+import math
+
+# NumPyはネイティブ解析を使用する場合のみ必要
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 解析時にffmpegで変換するサンプリング周波数（K特性フィルタの係数はこの周波数用）
+SAMPLE_RATE = 48000
+
+# ブロック長（ITU-R BS.1770-4 / EBU Tech 3341, 3342）
+HOP_SAMPLES = SAMPLE_RATE // 10  # 100ms
+MOMENTARY_HOPS = 4  # 400ms
+SHORT_TERM_HOPS = 30  # 3s
+
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+LRA_RELATIVE_GATE = -20.0
+LRA_LOW_PERCENTILE = 10
+LRA_HIGH_PERCENTILE = 95
+
+# ラウドネスのヒストグラムの分解能（1LUあたりのビン数）
+# モーメンタリーラウドネス（400msブロック）を0.1LU単位で数えたもので、ファイルをまたいで合算できる
+HISTOGRAM_BINS_PER_LU = 10
+
+# K特性フィルタ（48kHz）の係数: (b, a)
+K_WEIGHTING_STAGES = (
+    # 頭部の音響効果を模したハイシェルフ
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285),
+     (1.0, -1.69065929318241, 0.73248077421585)),
+    # RLB特性のハイパス
+    ((1.0, -2.0, 1.0),
+     (1.0, -1.99004745483398, 0.99007225036621)),
+)
+
+# K特性フィルタのインパルス応答の長さ（末尾の振幅は1e-30未満になり誤差は無視できる）
+K_WEIGHTING_TAPS = 16384
+
+# 1回に処理するサンプル数（メモリ使用量はこの長さとチャンネル数で決まる）
+CHUNK_SAMPLES = 65536
+
+# トゥルーピーク測定のオーバーサンプリング倍率と1位相あたりのタップ数
+OVERSAMPLING = 4
+TRUE_PEAK_TAPS = 32
+
+# チャンネル数ごとの重み（ffmpegの標準レイアウトの並び順、LFEは0）
+CHANNEL_WEIGHTS = {
+    1: (1.0,),
+    2: (1.0, 1.0),
+    3: (1.0, 1.0, 1.0),
+    4: (1.0, 1.0, 1.41, 1.41),
+    5: (1.0, 1.0, 1.0, 1.41, 1.41),
+    6: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41),
+    7: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41),
+    8: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41, 1.41),
+}
+
+_k_weighting_response = None
+_true_peak_filter = None
+
+
+def is_available():
+    return np is not None
+
+
+def channel_weights(channels):
+    """チャンネル数に応じた重み（未知のレイアウトはすべて1.0）"""
+    return CHANNEL_WEIGHTS.get(channels, (1.0,) * channels)
+
+
+def k_weighting_response():
+    """K特性フィルタ（2段のバイカッド）のインパルス応答"""
+    global _k_weighting_response
+    if _k_weighting_response is None:
+        response = np.zeros(K_WEIGHTING_TAPS)
+        response[0] = 1.0
+        for b, a in K_WEIGHTING_STAGES:
+            response = _biquad(response, b, a)
+        _k_weighting_response = response
+    return _k_weighting_response
+
+
+def _biquad(x, b, a):
+    # インパルス応答を求めるときに一度だけ使う逐次計算
+    y = np.empty_like(x)
+    x1 = x2 = y1 = y2 = 0.0
+    for n, x0 in enumerate(x.tolist()):
+        y0 = b[0] * x0 + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        y[n] = y0
+        x2, x1 = x1, x0
+        y2, y1 = y1, y0
+    return y
+
+
+def true_peak_filter():
+    """オーバーサンプリング用の補間フィルタ（行: タップ, 列: 位相）"""
+    global _true_peak_filter
+    if _true_peak_filter is None:
+        length = OVERSAMPLING * TRUE_PEAK_TAPS
+        t = (np.arange(length) - (length - 1) / 2) / OVERSAMPLING
+        taps = np.sinc(t) * np.hanning(length + 2)[1:-1]
+        # 位相ごとに分解し、各位相のゲインを1に揃える
+        phases = taps.reshape(TRUE_PEAK_TAPS, OVERSAMPLING)
+        _true_peak_filter = phases / phases.sum(axis=0)
+    return _true_peak_filter
+
+
+class _OverlapSaveFilter:
+    """長いFIRフィルタをFFTで適用する（チャンクをまたいで連続した出力を得る）"""
+
+    def __init__(self, response, channels, block_size=CHUNK_SAMPLES):
+        self.overlap = len(response) - 1
+        self.fft_size = 1 << (block_size + self.overlap - 1).bit_length()
+        self.block_size = block_size
+        self.spectrum = np.fft.rfft(response, self.fft_size)[:, np.newaxis]
+        self.history = np.zeros((self.overlap, channels))
+
+    def process(self, samples):
+        """block_size 以下のサンプルを処理する"""
+        buffer = np.concatenate((self.history, samples))
+        filtered = np.fft.irfft(np.fft.rfft(buffer, self.fft_size, axis=0) * self.spectrum,
+                                self.fft_size, axis=0)
+        self.history = buffer[-self.overlap:]
+        return filtered[self.overlap:self.overlap + len(samples)]
+
+
+class LoudnessMeter:
+    """ITU-R BS.1770-4 / EBU R128 のラウドネスメーター
+
+    48kHzのPCM（行: サンプル, 列: チャンネル）を add_samples で順に渡し、
+    result() で統合ラウドネス・LRA・トゥルーピークを得る。
+    保持するのは100msごとのエネルギーだけなので、長いファイルでもメモリ使用量はほぼ一定。
+    """
+
+    def __init__(self, channels):
+        if np is None:
+            raise RuntimeError("ネイティブ解析にはNumPyが必要です")
+        self.channels = channels
+        self.weights = np.asarray(channel_weights(channels))
+        self._filter = _OverlapSaveFilter(k_weighting_response(), channels)
+        self._peak_filter = true_peak_filter()
+        self._peak_gain = float(np.abs(self._peak_filter).sum(axis=0).max())
+        self._peak_history = np.zeros((TRUE_PEAK_TAPS - 1, channels))
+        self._pending = np.zeros(0)
+        self._hops = []
+        self.sample_count = 0
+        self.true_peak = 0.0
+
+    def add_samples(self, samples):
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, self.channels)
+        # 一度に渡されたサンプルが多くても作業領域が一定になるよう分割して処理
+        for start in range(0, len(samples), CHUNK_SAMPLES):
+            self._process_chunk(samples[start:start + CHUNK_SAMPLES])
+
+    def _process_chunk(self, samples):
+        self.sample_count += len(samples)
+        self._update_true_peak(samples)
+
+        # K特性フィルタ後の二乗をチャンネルの重み付きで合計し、100msごとに集計
+        filtered = self._filter.process(samples)
+        energy = np.concatenate((self._pending, (filtered * filtered) @ self.weights))
+        hop_count = len(energy) // HOP_SAMPLES
+        used = hop_count * HOP_SAMPLES
+        if hop_count:
+            self._hops.append(energy[:used].reshape(hop_count, HOP_SAMPLES).sum(axis=1))
+        self._pending = energy[used:]
+
+    def _update_true_peak(self, samples):
+        buffer = np.concatenate((self._peak_history, samples))
+        self._peak_history = buffer[-(TRUE_PEAK_TAPS - 1):]
+        sample_peak = float(np.abs(samples).max())
+        self.true_peak = max(self.true_peak, sample_peak)
+
+        # 補間値は最大振幅×フィルタ係数の絶対値和を超えないため、
+        # 現在のピークを超える可能性がない区間は補間を省略する
+        if float(np.abs(buffer).max()) * self._peak_gain <= self.true_peak:
+            return
+        for channel in range(self.channels):
+            signal = buffer[:, channel]
+            for phase in self._peak_filter.T:
+                interpolated = np.convolve(signal, phase, 'valid')
+                self.true_peak = max(self.true_peak, float(np.abs(interpolated).max()))
+
+    def reset_measurements(self):
+        """フィルタの状態は保ったまま測定値を破棄する（区間の前に重ねた部分をフィルタの準備だけに使う）"""
+        self._hops = []
+        self._pending = np.zeros(0)
+        self.sample_count = 0
+        self.true_peak = 0.0
+
+    def hop_energies(self):
+        """100msごとのエネルギー（重み付き二乗和）"""
+        if not self._hops:
+            return np.zeros(0)
+        if len(self._hops) > 1:
+            self._hops = [np.concatenate(self._hops)]
+        return self._hops[0]
+
+    def result(self):
+        return measurement_result(self.hop_energies(), self.true_peak, self.sample_count)
+
+
+def measurement_result(hops, true_peak, sample_count):
+    """100msごとのエネルギーとトゥルーピーク（振幅）から測定結果を求める
+
+    区間ごとに測定した値をつなげたものを渡すと、ファイル全体を1回で測定した場合と同じ結果になる。
+    """
+    integrated, threshold = integrated_loudness(hops)
+    return {
+        'integrated': integrated,
+        'threshold': threshold,
+        'lra': loudness_range(hops),
+        'true_peak': to_decibels(true_peak),
+        'duration': sample_count / SAMPLE_RATE,
+        'histogram': hop_histogram(hops),
+    }
+
+
+def merge_segments(segments):
+    """区間ごとの (100msごとのエネルギー, トゥルーピーク（振幅）, サンプル数) を時間順につなげた測定結果を求める"""
+    hops = np.concatenate([segment[0] for segment in segments])
+    true_peak = max(segment[1] for segment in segments)
+    return measurement_result(hops, true_peak, sum(segment[2] for segment in segments))
+
+
+def to_decibels(amplitude):
+    return 20 * math.log10(amplitude) if amplitude > 0 else float('-inf')
+
+
+def block_energies(hops, block_hops):
+    """block_hops 個の連続した100msを1ブロックとした平均二乗値（100msずつずらす）"""
+    if len(hops) < block_hops:
+        return np.zeros(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(hops)))
+    return (cumulative[block_hops:] - cumulative[:-block_hops]) / (block_hops * HOP_SAMPLES)
+
+
+def energy_to_loudness(energy):
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(energy)
+
+
+def integrated_loudness(hops):
+    """ゲーティング後の統合ラウドネスと相対ゲートのしきい値を返す（測定できない場合は -inf）"""
+    energies = block_energies(hops, MOMENTARY_HOPS)
+    loudness = energy_to_loudness(energies)
+    gated = energies[loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return float('-inf'), float('-inf')
+    threshold = float(energy_to_loudness(gated.mean())) + RELATIVE_GATE
+    gated = energies[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+    if not len(gated):
+        return float('-inf'), threshold
+    return float(energy_to_loudness(gated.mean())), threshold
+
+
+def sampled_loudness(windows, coverage, confidence=2.0):
+    """ファイルの一部の区間の100msごとのエネルギーから、統合ラウドネスの推定値と信頼区間の幅（LU）を返す
+
+    ゲーティングはすべての区間の400msブロックをまとめて行う（区間の境界をまたぐブロックは作らない）。
+    幅は区間を単位とした比推定の標準誤差（区間ごとのゲート後のエネルギーの合計とブロック数のばらつき）に
+    有限母集団の補正（coverage はファイル全体に対する区間の長さの割合）をかけ、confidence 倍したもの。
+    測定できない場合は (-inf, inf)、区間が1つの場合は幅を inf とする。
+    """
+    blocks = [block_energies(hops, MOMENTARY_HOPS) for hops in windows]
+    energies = np.concatenate(blocks) if blocks else np.zeros(0)
+    gated = energies[energy_to_loudness(energies) > ABSOLUTE_GATE]
+    if not len(gated):
+        return float('-inf'), float('inf')
+    threshold = float(energy_to_loudness(gated.mean())) + RELATIVE_GATE
+    sums = np.zeros(len(blocks))
+    counts = np.zeros(len(blocks))
+    for i, window in enumerate(blocks):
+        loudness = energy_to_loudness(window)
+        kept = window[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+        sums[i] = kept.sum()
+        counts[i] = len(kept)
+    total = counts.sum()
+    if not total:
+        return float('-inf'), float('inf')
+    mean = sums.sum() / total
+    estimate = float(energy_to_loudness(mean))
+    if len(blocks) < 2:
+        return estimate, float('inf')
+    variance = (max(0.0, 1 - coverage) * len(blocks) / (len(blocks) - 1)
+                * float(np.sum((sums - mean * counts) ** 2)) / total ** 2)
+    # エネルギーの相対誤差をLUに換算する
+    return estimate, float(confidence * 10 / math.log(10) * math.sqrt(variance) / mean)
+
+
+def loudness_range(hops):
+    """ショートターム（3s）ラウドネスの分布から求めたLRA（LU）"""
+    energies = block_energies(hops, SHORT_TERM_HOPS)
+    loudness = energy_to_loudness(energies)
+    gated = energies[loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return 0.0
+    threshold = float(energy_to_loudness(gated.mean())) + LRA_RELATIVE_GATE
+    values = loudness[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+    if not len(values):
+        return 0.0
+    low, high = np.percentile(values, (LRA_LOW_PERCENTILE, LRA_HIGH_PERCENTILE))
+    return float(high - low)
+
+
+def hop_histogram(hops):
+    """100msごとのエネルギーから、絶対ゲートを超えたブロックのラウドネスのヒストグラム {ビン: 件数} を求める"""
+    loudness = energy_to_loudness(block_energies(hops, MOMENTARY_HOPS))
+    loudness = loudness[loudness > ABSOLUTE_GATE]
+    bins, counts = np.unique(np.round(loudness * HISTOGRAM_BINS_PER_LU).astype(np.int64), return_counts=True)
+    return dict(zip(bins.tolist(), counts.tolist()))
+
+
+def loudness_histogram(values):
+    """ブロックごとのラウドネス（LUFS）の列からヒストグラム {ビン: 件数} を求める（NumPy不要）"""
+    histogram = {}
+    for value in values:
+        if value > ABSOLUTE_GATE:
+            key = int(round(value * HISTOGRAM_BINS_PER_LU))
+            histogram[key] = histogram.get(key, 0) + 1
+    return histogram
+
+
+def merge_histograms(histograms):
+    """複数のファイルのヒストグラムを合算する"""
+    merged = {}
+    for histogram in histograms:
+        for key, count in histogram.items():
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def histogram_loudness(histogram):
+    """ヒストグラムから統合ラウドネスを求める（各ビンのエネルギーはビンの中央の値、測定できない場合は -inf）
+
+    ゲーティングは integrated_loudness と同じで、ブロック単位の測定値を合算したものと
+    ビンの幅（0.1LU）の範囲で一致する。NumPy不要。
+    """
+    bins = [(key / HISTOGRAM_BINS_PER_LU, count) for key, count in histogram.items()
+            if key / HISTOGRAM_BINS_PER_LU > ABSOLUTE_GATE]
+
+    def gated_mean(threshold):
+        total = 0.0
+        count_sum = 0
+        for loudness, count in bins:
+            if loudness > threshold:
+                total += count * 10 ** ((loudness + 0.691) / 10)
+                count_sum += count
+        if not count_sum:
+            return None
+        return -0.691 + 10 * math.log10(total / count_sum)
+
+    ungated = gated_mean(ABSOLUTE_GATE)
+    if ungated is None:
+        return float('-inf')
+    integrated = gated_mean(ungated + RELATIVE_GATE)
+    return float('-inf') if integrated is None else integrated
+
+
+def measure_stream(stream, channels, on_chunk=None, warmup_samples=0):
+    """32bit浮動小数点のPCMストリームを読み取って測定結果を返す
+
+    warmup_samples を指定すると、先頭のその長さはフィルタの準備だけに使い、測定値には含めない
+    （区間に分けて測定する場合に、前の区間と重ねて読み込んだ部分）。
+    """
+    meter = LoudnessMeter(channels)
+    frame_size = 4 * channels
+    chunk_bytes = CHUNK_SAMPLES * frame_size
+    remainder = b''
+    warmup = warmup_samples
+    while True:
+        data = stream.read(chunk_bytes)
+        if not data:
+            break
+        data = remainder + data
+        usable = len(data) - len(data) % frame_size
+        remainder = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<f4').reshape(-1, channels)
+        if warmup:
+            head = samples[:warmup]
+            samples = samples[warmup:]
+            meter.add_samples(head)
+            warmup -= len(head)
+            if not warmup:
+                meter.reset_measurements()
+        meter.add_samples(samples)
+        if on_chunk is not None:
+            on_chunk(meter)
+    return meter
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# リポジトリ直下のモジュールを読み込めるようにする（benchmarks と同じ方法）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
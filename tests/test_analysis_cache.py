@@ -0,0 +1,48 @@
+"""analysis_cache.AnalysisCache のテスト"""
+import analysis_cache
+from analysis_cache import AnalysisCache
+
+
+def make_files(directory, count):
+    paths = []
+    for i in range(count):
+        file_path = directory / f"{i}.flac"
+        file_path.write_bytes(b"audio")
+        paths.append(str(file_path))
+    return paths
+
+
+def test_evicts_oldest_entries_by_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_cache, 'EVICT_INTERVAL', 1)
+    cache = AnalysisCache(str(tmp_path / "cache.db"), max_bytes=2000)
+    paths = make_files(tmp_path, 20)
+    for file_path in paths:
+        cache.put(file_path, {'lufs': -20.0, 'histogram': "x" * 200}, 'native')
+    count, total = cache._conn.execute("SELECT COUNT(*), SUM(LENGTH(data)) FROM entries").fetchone()
+    assert total <= 2000
+    # 新しいエントリが残る
+    remaining = {row[0] for row in cache._conn.execute("SELECT path FROM entries")}
+    assert remaining == set(paths[-count:])
+    cache.close()
+
+
+def test_evicts_by_entry_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_cache, 'EVICT_INTERVAL', 1)
+    cache = AnalysisCache(str(tmp_path / "cache.db"), max_entries=5)
+    for file_path in make_files(tmp_path, 8):
+        cache.put(file_path, {'lufs': -20.0}, 'native')
+    assert cache._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 5
+    cache.close()
+
+
+def test_apply_checks_backend(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.db"))
+    file_path, = make_files(tmp_path, 1)
+    file_info = {'path': file_path, 'lufs': -16.5, 'channels': 2, 'loudnorm': {}, 'probe': {}, 'histogram': None}
+    cache.put(file_path, file_info, 'loudnorm')
+
+    result = {'path': file_path}
+    assert not cache.apply(result, ('native', 'segmented'))
+    assert cache.apply(result, ('loudnorm', 'segmented'))
+    assert result['lufs'] == -16.5
+    cache.close()
@@ -0,0 +1,47 @@
+"""audio_core.FileRecord とヒストグラムの圧縮（pack_histogram / unpack_histogram）のテスト"""
+import json
+import random
+
+import pytest
+
+from audio_core import FileRecord, pack_histogram, unpack_histogram
+
+
+@pytest.mark.parametrize("histogram", [
+    {},
+    {-230: 1},
+    {-700: 3, -699: 1, -120: 7},  # 範囲が広く、件数が0のビンを挟む
+    {-180: 255, -179: 1},  # 'B' に収まる最大の件数
+    {-180: 256, -179: 65535},  # 'H'
+    {-180: 65536, 5: 2},  # 'I'、0以上のビン
+])
+def test_pack_round_trip(histogram):
+    assert unpack_histogram(pack_histogram(histogram)) == histogram
+
+
+def test_pack_round_trip_random():
+    rng = random.Random(0)
+    for _ in range(200):
+        low = rng.randint(-700, 0)
+        histogram = {rng.randint(low, low + 300): rng.randint(1, 1 << rng.choice((4, 12, 20)))
+                     for _ in range(rng.randint(1, 100))}
+        assert unpack_histogram(pack_histogram(histogram)) == histogram
+
+
+def test_pack_accepts_json_keys():
+    # キャッシュから読み込んだヒストグラムはキーが文字列になる
+    histogram = {-230: 4, -225: 9}
+    loaded = json.loads(json.dumps(histogram))
+    assert unpack_histogram(pack_histogram(loaded)) == histogram
+
+
+def test_record_histogram():
+    record = FileRecord("/music/album/01.flac")
+    assert record['histogram'] is None
+    record['histogram'] = {-230: 4, -225: 9}
+    assert record['histogram'] == {-230: 4, -225: 9}
+    # 測定できたがゲートを超えるブロックがない場合は空のヒストグラムとして区別する
+    record['histogram'] = {}
+    assert record['histogram'] == {}
+    record['histogram'] = None
+    assert record['histogram'] is None
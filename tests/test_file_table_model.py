@@ -0,0 +1,135 @@
+"""FileFilterProxyModel のテスト（絞り込み・並べ替えを毎回やり直した結果と比較する）"""
+import os
+import random
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+
+from PyQt5.QtCore import Qt, QPersistentModelIndex  # noqa: E402
+from PyQt5.QtTest import QAbstractItemModelTester  # noqa: E402
+
+from audio_core import new_file_info  # noqa: E402
+import file_table_model  # noqa: E402
+from file_table_model import (COLUMN_CHANNELS, COLUMN_LUFS, COLUMN_NAME,  # noqa: E402
+                              FileFilterProxyModel, FileTableModel)
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def rebuilt_rows(proxy, model):
+    fresh = FileFilterProxyModel()
+    fresh.channel_filter, fresh.lufs_min, fresh.lufs_max = proxy.channel_filter, proxy.lufs_min, proxy.lufs_max
+    fresh.sort_column, fresh.sort_order = proxy.sort_column, proxy.sort_order
+    fresh.setSourceModel(model)
+    return fresh._rows
+
+
+def check(proxy, model):
+    rows = [proxy.mapToSource(proxy.index(position, 0)).row() for position in range(proxy.rowCount())]
+    assert rows == rebuilt_rows(proxy, model)
+    visible = set(rows)
+    for row in range(model.rowCount()):
+        position = proxy.mapFromSource(model.index(row, 0))
+        if row in visible:
+            assert rows[position.row()] == row
+        else:
+            assert not position.isValid()
+
+
+def random_file(rng, number):
+    file_info = new_file_info(f"/d{rng.randint(0, 3)}/f{rng.randint(0, 50)}_{number}.mp3")
+    if rng.random() < 0.3:
+        file_info['lufs'] = rng.choice([-15.0, -12.0, rng.uniform(-30, -5)])
+        file_info['channels'] = rng.choice([1, 2, 6])
+    return file_info
+
+
+def analyze_randomly(rng, file_info):
+    file_info['lufs'] = rng.choice([None, -15.0, rng.uniform(-30, -5)])
+    file_info['channels'] = rng.choice([1, 2, 6])
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_incremental_updates_match_rebuild(app, seed):
+    rng = random.Random(seed)
+    files = []
+    model = FileTableModel(files)
+    proxy = FileFilterProxyModel()
+    proxy.setSourceModel(model)
+    QAbstractItemModelTester(proxy, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    proxy.sort(rng.choice([COLUMN_LUFS, COLUMN_NAME, COLUMN_CHANNELS, -1]),
+               rng.choice([Qt.AscendingOrder, Qt.DescendingOrder]))
+    if seed % 3 == 0:
+        proxy.set_filter('unanalyzed', None, None)
+    elif seed % 3 == 1:
+        proxy.set_filter(None, -20.0, -10.0)
+
+    number = 0
+    for _ in range(40):
+        action = rng.random()
+        if action < 0.3 or not files:
+            batch = [random_file(rng, number + i) for i in range(rng.randint(1, 30))]
+            number += len(batch)
+            model.append_files(batch)
+        elif action < 0.4:
+            # 複数行の変更（analysis_changed）
+            for file_info in rng.sample(files, min(len(files), rng.randint(1, 10))):
+                analyze_randomly(rng, file_info)
+            model.analysis_changed()
+        else:
+            row = rng.randrange(len(files))
+            persistent = QPersistentModelIndex(proxy.mapFromSource(model.index(row, 0)))
+            analyze_randomly(rng, files[row])
+            model.file_changed(row)
+            if persistent.isValid():
+                assert proxy.mapToSource(proxy.index(persistent.row(), 0)).row() == row
+        check(proxy, model)
+
+
+@pytest.mark.parametrize("count", [5, 50])
+def test_analysis_changed_keeps_selection(app, monkeypatch, count):
+    # 大量の行が動く場合（まとめて並べ替え直す場合）も選択中の行を追う
+    monkeypatch.setattr(file_table_model, 'INCREMENTAL_CHANGE_LIMIT', 10)
+    rng = random.Random(count)
+    files = [new_file_info(f"/d/f{i:03d}.mp3") for i in range(100)]
+    for file_info in files:
+        file_info['lufs'] = rng.uniform(-30, -5)
+    model = FileTableModel(files)
+    proxy = FileFilterProxyModel()
+    proxy.setSourceModel(model)
+    QAbstractItemModelTester(proxy, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    proxy.sort(COLUMN_LUFS, Qt.AscendingOrder)
+
+    resets = []
+    proxy.modelReset.connect(lambda: resets.append(True))
+    selected = {row: QPersistentModelIndex(proxy.mapFromSource(model.index(row, 0))) for row in (3, 42, 97)}
+    for file_info in rng.sample(files, count):
+        file_info['lufs'] = rng.uniform(-30, -5)
+    model.analysis_changed()
+
+    assert not resets
+    for row, persistent in selected.items():
+        assert proxy.mapToSource(proxy.index(persistent.row(), 0)).row() == row
+    check(proxy, model)
+
+
+def test_unchanged_analysis_does_not_move_rows(app):
+    files = [new_file_info(f"/d/f{i:03d}.mp3") for i in range(20)]
+    model = FileTableModel(files)
+    proxy = FileFilterProxyModel()
+    proxy.setSourceModel(model)
+    proxy.sort(COLUMN_NAME, Qt.DescendingOrder)
+    events = []
+    for signal in (proxy.modelReset, proxy.layoutChanged, proxy.rowsMoved, proxy.rowsInserted, proxy.rowsRemoved):
+        signal.connect(lambda *args, name=signal: events.append(name))
+    changed = []
+    proxy.dataChanged.connect(lambda top_left, bottom_right, roles: changed.append((top_left.row(), bottom_right.row())))
+
+    model.analysis_changed()
+    assert not events
+    assert changed == [(0, 19)]
@@ -0,0 +1,90 @@
+"""job_journal.JobJournal のテスト（再開と出力の変更の検出）"""
+import os
+
+from job_journal import JobJournal
+
+SETTINGS = {'analyze': True, 'normalizer': {'target_lufs': "-16"}}
+
+
+def write(path, data=b"output"):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_resume_after_reopen(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    paths = [f"/music/{i:02d}.flac" for i in range(4)]
+    output = write(tmp_path / "00.flac")
+
+    journal = JobJournal(db_path)
+    journal.begin(SETTINGS, paths)
+    journal.mark_done(paths[0], output)
+    journal.mark_failed(paths[1], "エラー")
+    # 異常終了した場合と同じく、閉じずに別の接続で開き直す
+    resumed = JobJournal(db_path)
+    assert resumed.load() == (SETTINGS, paths)
+    assert resumed.has_unfinished()
+    pending = resumed.pending([{'path': path} for path in paths])
+    assert [file_info['path'] for file_info in pending] == paths[1:]
+    assert resumed.completed_output(paths[0]) == output
+    assert resumed.completed_output(paths[1]) is None
+
+    # 再開時に追加されたファイルは末尾に加え、記録済みのファイルの状態は変えない
+    resumed.add([paths[0], "/music/new.flac"])
+    assert resumed.load()[1] == paths + ["/music/new.flac"]
+    assert resumed.completed_output(paths[0]) == output
+    resumed.close()
+    journal.close()
+
+
+def test_finished_batch(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    assert journal.load() is None
+    journal.begin(SETTINGS, ["/music/a.flac"])
+    journal.mark_done("/music/a.flac", write(tmp_path / "a.flac"))
+    assert not journal.has_unfinished()
+
+    # 新しいバッチを開始すると前の記録は破棄する
+    journal.begin(SETTINGS, ["/music/b.flac"])
+    assert journal.load()[1] == ["/music/b.flac"]
+    assert journal.completed_output("/music/a.flac") is None
+    journal.close()
+
+
+def test_completed_output_invalidated_by_changes(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    sources = ["/music/resized.flac", "/music/touched.flac", "/music/deleted.flac"]
+    journal.begin(SETTINGS, sources)
+    outputs = [write(tmp_path / os.path.basename(path)) for path in sources]
+    for source, output in zip(sources, outputs):
+        journal.mark_done(source, output)
+    assert [journal.completed_output(source) for source in sources] == outputs
+
+    write(tmp_path / "resized.flac", b"longer output")
+    stat = os.stat(outputs[1])
+    os.utime(outputs[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    os.remove(outputs[2])
+    assert [journal.completed_output(source) for source in sources] == [None, None, None]
+    journal.close()
+
+
+def test_completed_output_with_several_outputs(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    journal.begin(SETTINGS, ["/music/a.flac"])
+    outputs = [write(tmp_path / "loud.flac"), write(tmp_path / "quiet.flac")]
+    journal.mark_done("/music/a.flac", outputs)
+    assert journal.completed_output("/music/a.flac") == outputs
+
+    # 出力の1つでも変更されていれば処理し直す
+    os.remove(outputs[1])
+    assert journal.completed_output("/music/a.flac") is None
+    journal.close()
+
+
+def test_missing_output_is_recorded_as_failed(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    journal.begin(SETTINGS, ["/music/a.flac"])
+    journal.mark_done("/music/a.flac", str(tmp_path / "missing.flac"))
+    assert journal.completed_output("/music/a.flac") is None
+    assert journal.has_unfinished()
+    journal.close()
@@ -0,0 +1,190 @@
+"""mp3_gain のテスト（合成したLayer IIIのフレームを使用）"""
+import os
+import random
+
+import pytest
+
+import mp3_gain
+
+# MPEG1: 128kbps 44.1kHz、MPEG2: 64kbps 22.05kHz
+MPEG1 = {'version': 3, 'bitrate_index': 9, 'rate_index': 0, 'length': 417}
+MPEG2 = {'version': 2, 'bitrate_index': 8, 'rate_index': 0, 'length': 208}
+
+
+class BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def write(self, value, width):
+        self.bits.extend((value >> (width - 1 - i)) & 1 for i in range(width))
+
+    def to_bytes(self):
+        bits = self.bits + [0] * (-len(self.bits) % 8)
+        return bytes(int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+
+
+def side_info(mpeg1, mono, gains, rng):
+    """仕様のフィールド順にサイド情報を作成する（global_gain 以外は乱数）"""
+    writer = BitWriter()
+    channels = 1 if mono else 2
+    if mpeg1:
+        writer.write(rng.getrandbits(9), 9)  # main_data_begin
+        writer.write(rng.getrandbits(5 if mono else 3), 5 if mono else 3)  # private_bits
+        writer.write(rng.getrandbits(4 * channels), 4 * channels)  # scfsi
+        granule_bits = 59
+    else:
+        writer.write(rng.getrandbits(8), 8)
+        writer.write(rng.getrandbits(1 if mono else 2), 1 if mono else 2)
+        granule_bits = 63
+    for gain in gains:
+        writer.write(rng.getrandbits(12), 12)  # part2_3_length
+        writer.write(rng.getrandbits(9), 9)  # big_values
+        writer.write(gain, 8)  # global_gain
+        writer.write(rng.getrandbits(granule_bits - 29), granule_bits - 29)
+    return writer.to_bytes()
+
+
+def make_frame(spec, gains, rng, mono=False, protected=False, payload=None):
+    header = (0x7FF << 21) | (spec['version'] << 19) | (1 << 17) | ((0 if protected else 1) << 16)
+    header |= (spec['bitrate_index'] << 12) | (spec['rate_index'] << 10) | ((3 if mono else 0) << 6)
+    frame = bytearray(header.to_bytes(4, 'big'))
+    if protected:
+        frame += b'\0\0'
+    info = side_info(spec['version'] == 3, mono, gains, rng)
+    frame += info
+    if protected:
+        crc = mp3_gain.crc16(bytes(frame[2:4]) + info)
+        frame[4:6] = crc.to_bytes(2, 'big')
+    if payload is not None:
+        frame += payload
+    frame += bytes(rng.getrandbits(8) & 0x7F for _ in range(spec['length'] - len(frame)))
+    return bytes(frame)
+
+
+def gain_count(spec, mono):
+    channels = 1 if mono else 2
+    return 2 * channels if spec['version'] == 3 else channels
+
+
+def make_file(path, spec, count=20, mono=False, protected=False, gains=None, vbr_header=False, seed=1):
+    rng = random.Random(seed)
+    data = bytearray(b'ID3\x03\x00\x00\x00\x00\x00\x05hello')
+    if vbr_header:
+        # サイド情報の直後に Xing があるフレーム
+        data += make_frame(spec, [0] * gain_count(spec, mono), rng, mono, payload=b'Xing')
+    for _ in range(count):
+        frame_gains = gains or [rng.randint(100, 200) for _ in range(gain_count(spec, mono))]
+        data += make_frame(spec, frame_gains, rng, mono, protected)
+    path.write_bytes(bytes(data))
+    return bytes(data)
+
+
+def read_gains(path):
+    data = path.read_bytes()
+    gains = []
+    pos = mp3_gain.id3v2_size(open(path, 'rb'))
+    # 末尾のAPEv2タグ（MP3GAIN_UNDO）の手前まで
+    while pos < len(data) and data[pos] == 0xFF:
+        frame = mp3_gain.frame_at(data, pos)
+        assert frame is not None
+        gains.append(mp3_gain.frame_gains(data, pos, frame))
+        pos += frame[0]
+    return gains
+
+
+def test_crc16_check_value():
+    # CRC-16（多項式 0x8005、初期値 0xFFFF、反転なし）の検査値
+    assert mp3_gain.crc16(b"123456789") == 0xAEE7
+
+
+@pytest.mark.parametrize("spec", [MPEG1, MPEG2], ids=["mpeg1", "mpeg2"])
+@pytest.mark.parametrize("mono", [False, True], ids=["stereo", "mono"])
+def test_global_gain_offsets(tmp_path, spec, mono):
+    path = tmp_path / "in.mp3"
+    expected = list(range(100, 100 + gain_count(spec, mono)))
+    make_file(path, spec, count=3, mono=mono, gains=expected)
+    frame = mp3_gain.parse_frame_header(int.from_bytes(path.read_bytes()[15:19], 'big'))
+    assert frame[0] == spec['length']
+    assert read_gains(path) == [expected] * 3
+
+    mp3_gain.apply_gain(str(path), str(path), 2)
+    assert read_gains(path) == [[gain + 2 for gain in expected]] * 3
+
+
+@pytest.mark.parametrize("spec", [MPEG1, MPEG2], ids=["mpeg1", "mpeg2"])
+def test_crc_is_updated(tmp_path, spec):
+    path = tmp_path / "in.mp3"
+    make_file(path, spec, count=5, protected=True)
+    mp3_gain.apply_gain(str(path), str(path), -3)
+
+    data = path.read_bytes()
+    pos = 15
+    while pos < len(data) and data[pos] == 0xFF:
+        frame = mp3_gain.frame_at(data, pos)
+        _, side_info_offset, side_info_length, _, protected = frame
+        assert protected
+        start = pos + side_info_offset
+        crc = mp3_gain.crc16(data[pos + 2:pos + 4] + data[start:start + side_info_length])
+        assert data[pos + 4:pos + 6] == crc.to_bytes(2, 'big')
+        pos += frame[0]
+
+
+def test_vbr_header_frame_is_not_changed(tmp_path):
+    path = tmp_path / "in.mp3"
+    original = make_file(path, MPEG1, count=4, vbr_header=True)
+    result = mp3_gain.apply_gain(str(path), str(path), 1)
+    assert result['frames'] == 4
+
+    data = path.read_bytes()
+    assert data[15:15 + MPEG1['length']] == original[15:15 + MPEG1['length']]
+    assert data[15 + MPEG1['length']:16 + MPEG1['length']] == b'\xff'
+
+
+@pytest.mark.parametrize("spec", [MPEG1, MPEG2], ids=["mpeg1", "mpeg2"])
+@pytest.mark.parametrize("protected", [False, True], ids=["nocrc", "crc"])
+def test_apply_and_undo_round_trip(tmp_path, spec, protected):
+    path = tmp_path / "in.mp3"
+    original = make_file(path, spec, protected=protected, vbr_header=True)
+    output = tmp_path / "out.mp3"
+
+    result = mp3_gain.apply_gain(str(path), str(output), 3)
+    assert result == {'frames': 20, 'clipped': 0, 'steps': 3, 'requested': 3}
+    assert mp3_gain.read_applied_steps(str(output)) == 3
+    assert path.read_bytes() == original
+
+    mp3_gain.apply_gain(str(output), str(output), -1)
+    assert mp3_gain.read_applied_steps(str(output)) == 2
+
+    assert mp3_gain.undo_gain(str(output))['steps'] == -2
+    assert output.read_bytes() == original
+
+
+def test_steps_are_limited_to_the_global_gain_range(tmp_path):
+    path = tmp_path / "in.mp3"
+    original = make_file(path, MPEG1, gains=[250, 120, 10, 200])
+    assert mp3_gain.gain_range(str(path)) == (10, 250)
+    assert mp3_gain.limit_steps(10, (10, 250)) == 5
+    assert mp3_gain.limit_steps(-20, (10, 250)) == -10
+
+    result = mp3_gain.apply_gain(str(path), str(path), 10)
+    assert result['steps'] == 5 and result['requested'] == 10 and result['clipped'] == 0
+    assert max(max(gains) for gains in read_gains(path)) == mp3_gain.GLOBAL_GAIN_MAX
+
+    mp3_gain.undo_gain(str(path))
+    assert path.read_bytes() == original
+
+
+def test_zero_steps_does_not_rewrite_in_place(tmp_path):
+    path = tmp_path / "in.mp3"
+    make_file(path, MPEG1, gains=[255, 255, 255, 255])
+    os.utime(path, ns=(1, 1))
+    result = mp3_gain.apply_gain(str(path), str(path), 4)
+    assert result['steps'] == 0 and result['requested'] == 4
+    assert os.stat(path).st_mtime_ns == 1
+
+
+def test_file_without_frames_is_rejected(tmp_path):
+    path = tmp_path / "in.mp3"
+    path.write_bytes(b'\0' * 4096)
+    with pytest.raises(mp3_gain.MP3FormatError):
+        mp3_gain.apply_gain(str(path), str(path), 1)
@@ -0,0 +1,26 @@
+"""audio_core.parse_profile / parse_profiles のテスト"""
+import pytest
+
+from audio_core import OutputProfile, parse_profile, parse_profiles
+
+DEFAULTS = OutputProfile("-16", "CBR", "160k", "44100")
+
+
+def test_parse_profile_overrides_defaults():
+    profile = parse_profile("target=-14, codec=aac, mode=VBR, bitrate=256, rate=48000, dir=streaming", DEFAULTS)
+    assert profile.to_dict() == {'target_lufs': "-14", 'bitrate_mode': "VBR", 'bitrate': "256k",
+                                 'sample_rate': "48000", 'codec': "aac", 'subdirectory': "streaming"}
+    # 省略した項目は既定値
+    assert parse_profile("dir=podcast", DEFAULTS).to_dict() == dict(DEFAULTS.to_dict(), subdirectory="podcast")
+
+
+@pytest.mark.parametrize("spec", ["size=1", "target", "codec=wav", "mode=ABR", "bitrate=fast", "target=loud"])
+def test_parse_profile_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_profile(spec, DEFAULTS)
+
+
+def test_parse_profiles():
+    profiles = parse_profiles(" target=-14,dir=a ; ; target=-16,dir=b;", DEFAULTS)
+    assert [(profile.target_lufs, profile.subdirectory) for profile in profiles] == [("-14", "a"), ("-16", "b")]
+    assert parse_profiles("  ", DEFAULTS) is None
@@ -0,0 +1,73 @@
+"""r128_meter のテスト（EBU Tech 3341・3342 の基準信号と、区間に分けた測定）"""
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import r128_meter  # noqa: E402
+
+RATE = r128_meter.SAMPLE_RATE
+
+
+def sine(amplitude_db, seconds, frequency=1000.0):
+    """両チャンネルに同じ正弦波を入れたステレオ信号"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    wave = 10 ** (amplitude_db / 20) * np.sin(2 * np.pi * frequency * t)
+    return np.column_stack((wave, wave))
+
+
+def measure(samples):
+    meter = r128_meter.LoudnessMeter(samples.shape[1])
+    meter.add_samples(samples)
+    return meter.result()
+
+
+def measure_segments(samples, boundaries):
+    """audio_core.measure_range と同じく、前の区間と重ねて読み込んだ部分をフィルタの準備に使って測定する"""
+    warmup_limit = int(r128_meter.SAMPLE_RATE * 1.0)
+    measured = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        warmup = min(start, warmup_limit)
+        pcm = samples[start - warmup:end].astype('<f4')
+        meter = r128_meter.measure_stream(io.BytesIO(pcm.tobytes()), samples.shape[1], warmup_samples=warmup)
+        hops = meter.hop_energies()[:(end - start) // r128_meter.HOP_SAMPLES]
+        measured.append((hops, meter.true_peak, meter.sample_count))
+    return r128_meter.merge_segments(measured)
+
+
+@pytest.mark.parametrize("level", [-23.0, -33.0])
+def test_tech3341_stereo_sine(level):
+    # Tech 3341 テスト1・2: 1kHz の正弦波（ステレオ、-23dBFS / -33dBFS）は level LUFS ±0.1
+    result = measure(sine(level, 20))
+    assert result['integrated'] == pytest.approx(level, abs=0.1)
+
+
+def test_tech3342_loudness_range():
+    # Tech 3342 テスト1: -20dBFS と -30dBFS の 1kHz の正弦波を20秒ずつ続けると LRA 10（規格の許容差は ±1）
+    samples = np.concatenate((sine(-20, 20), sine(-30, 20)))
+    assert measure(samples)['lra'] == pytest.approx(10.0, abs=0.1)
+
+
+def test_segmented_matches_single_pass():
+    # 音量が変化するノイズを、100msの境界で区切った区間ごとに測定してつなげる
+    rng = np.random.default_rng(0)
+    seconds = 30
+    envelope = 10 ** (np.repeat(rng.uniform(-40, -10, seconds), RATE) / 20)
+    samples = (rng.standard_normal((seconds * RATE, 2)) * envelope[:, None]).astype('<f4').astype(np.float64)
+    single = measure(samples)
+    segmented = measure_segments(samples, [0, 7 * RATE, 7 * RATE + RATE // 10 * 83, 22 * RATE, seconds * RATE])
+
+    assert segmented['integrated'] == pytest.approx(single['integrated'], abs=1e-6)
+    assert segmented['threshold'] == pytest.approx(single['threshold'], abs=1e-6)
+    assert segmented['lra'] == pytest.approx(single['lra'], abs=1e-6)
+    assert segmented['true_peak'] == pytest.approx(single['true_peak'], abs=1e-6)
+    assert segmented['duration'] == single['duration']
+    assert segmented['histogram'] == single['histogram']
+
+
+def test_histogram_loudness_matches_integrated():
+    samples = np.concatenate((sine(-20, 10), sine(-26, 10)))
+    result = measure(samples)
+    # ビンの幅（0.1LU）の範囲で一致する
+    assert r128_meter.histogram_loudness(result['histogram']) == pytest.approx(result['integrated'], abs=0.05)
@@ -0,0 +1,91 @@
+"""watch_folder.WatchFolderService のテスト（ポーリングで監視し、待ち時間を短くする）"""
+import os
+import threading
+import time
+
+from watch_folder import WatchFolderService
+
+
+def run_service(directory, process, until, **kwargs):
+    """until() が True を返すまで（最大5秒）サービスを実行し、サービスを返す"""
+    service = WatchFolderService([directory], process, settle_seconds=0, poll_interval=0.02,
+                                 force_polling=True, retry_delay=0.02, **kwargs)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=service.run, args=(stop_event,))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not until() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # 余分な処理が行われないことも確認できるよう、少し待ってから止める
+    time.sleep(0.2)
+    stop_event.set()
+    thread.join()
+    return service
+
+
+def write_file(directory, name="a.flac"):
+    file_path = os.path.join(str(directory), name)
+    with open(file_path, 'wb') as f:
+        f.write(b"audio")
+    return file_path
+
+
+def test_failure_is_reported_and_retried(tmp_path):
+    file_path = write_file(tmp_path)
+    calls = []
+    errors = []
+
+    def process(path):
+        calls.append(path)
+        if len(calls) == 1:
+            raise RuntimeError("一時的なエラー")
+        return True
+
+    service = run_service(tmp_path, process, lambda: len(calls) >= 2,
+                          on_error=lambda path, error: errors.append((path, str(error))))
+    assert calls == [file_path, file_path]
+    assert errors == [(file_path, "一時的なエラー")]
+    assert file_path in service._processed
+    assert file_path not in service._failures
+
+
+def test_failure_gives_up_after_retries(tmp_path):
+    file_path = write_file(tmp_path)
+    calls = []
+
+    def process(path):
+        calls.append(path)
+        return False
+
+    service = run_service(tmp_path, process, lambda: len(calls) >= 3, max_retries=2)
+    # 最初の1回と再試行2回だけ処理し、変更されるまで処理済みと同じ扱いにする
+    assert len(calls) == 3
+    assert file_path in service._processed
+    assert service._failures[file_path][1] == 3
+
+
+def test_skip_error_is_reported(tmp_path):
+    file_path = write_file(tmp_path)
+    errors = []
+
+    def skip(path):
+        raise OSError("ジャーナルを読み込めません")
+
+    run_service(tmp_path, lambda path: True, lambda: errors, skip=skip, max_retries=0,
+                on_error=lambda path, error: errors.append(path))
+    assert errors == [file_path]
+
+
+def test_prune_removes_deleted_and_changed_files(tmp_path):
+    kept = write_file(tmp_path, "kept.flac")
+    deleted = write_file(tmp_path, "deleted.flac")
+    changed = write_file(tmp_path, "changed.flac")
+    calls = []
+    service = run_service(tmp_path, lambda path: calls.append(path) or True, lambda: len(calls) >= 3)
+    assert set(service._processed) == {kept, deleted, changed}
+
+    os.remove(deleted)
+    with open(changed, 'ab') as f:
+        f.write(b"more")
+    service._prune()
+    assert set(service._processed) == {kept}
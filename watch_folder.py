@@ -0,0 +1,407 @@
+import os
+import sys
+import time
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from audio_core import is_audio_file, iter_audio_files
+
+# 書き込みが止まったとみなすまでの時間と、フォルダの監視・ファイルの状態を確認する間隔（秒）
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 処理に失敗したファイルを再試行する回数と、最初の再試行までの時間（秒、再試行のたびに倍にする）
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 30.0
+
+# 処理済みの記録から、削除・変更されたファイルを取り除く間隔（秒）
+PRUNE_INTERVAL = 600.0
+
+# inotifyのイベント（<sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+# 削除されたフォルダの監視は IN_IGNORED で外す
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    """inotifyでフォルダを監視できるか（Linux以外ではポーリングを使用する）"""
+    return _libc is not None
+
+
+class PollingWatcher:
+    """フォルダ以下を一定間隔で検索し、追加・変更されたオーディオファイルを返す
+
+    ネットワーク共有など、inotifyでは他のマシンからの書き込みを検知できない場合にも使用する。
+    """
+
+    def __init__(self, directories, interval=DEFAULT_POLL_INTERVAL):
+        self.directories = list(directories)
+        self.interval = interval
+        self._known = {}  # パス -> (サイズ, 更新日時)
+        self._first = True
+
+    def changes(self, stop_event):
+        """変更されたファイルのパスを返す（初回は既存のすべてのファイル）"""
+        if not self._first and stop_event.wait(self.interval):
+            return []
+        self._first = False
+        changed = []
+        known = {}
+        for directory in self.directories:
+            for file_path in iter_audio_files(directory):
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                known[file_path] = (stat.st_size, stat.st_mtime_ns)
+                if self._known.get(file_path) != known[file_path]:
+                    changed.append(file_path)
+        self._known = known
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """inotifyでフォルダ以下（サブフォルダを含む）を監視し、書き込まれたオーディオファイルを返す
+
+    後から作成されたサブフォルダも監視に加える。イベントがあふれた場合はすべてを検索し直す。
+    """
+
+    def __init__(self, directories, interval=DEFAULT_POLL_INTERVAL):
+        self.directories = list(directories)
+        self.interval = interval
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}  # 監視記述子 -> フォルダ
+        self._pending = []  # 監視を始めた時点で存在するファイル
+        for directory in self.directories:
+            self._pending.extend(self._watch_tree(directory))
+
+    def changes(self, stop_event):
+        """変更されたファイルのパスを返す（初回は既存のすべてのファイル）"""
+        if self._pending:
+            changed, self._pending = self._pending, []
+            return changed
+        readable, _, _ = select.select([self._fd], [], [], self.interval)
+        if not readable or stop_event.is_set():
+            return []
+        try:
+            data = os.read(self._fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # 取りこぼしたイベントがあるため検索し直す
+                for directory in self.directories:
+                    changed.extend(self._watch_tree(directory))
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.extend(self._watch_tree(path))
+            elif is_audio_file(path):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _watch_tree(self, directory):
+        """フォルダ以下を監視に加え、その時点で存在するオーディオファイルを返す"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                continue
+            self._watches[wd] = current
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        # 監視を始める前に書き込まれたファイルはイベントが届かないため検索する
+        return list(iter_audio_files(directory))
+
+
+def open_watcher(directories, interval=DEFAULT_POLL_INTERVAL, force_polling=False):
+    """inotifyを使用できる場合は InotifyWatcher、それ以外は PollingWatcher を返す"""
+    if not force_polling and inotify_available():
+        try:
+            return InotifyWatcher(directories, interval)
+        except OSError:
+            pass
+    return PollingWatcher(directories, interval)
+
+
+class StableFileTracker:
+    """ファイルのサイズと更新日時が settle_seconds の間変わらなくなったものを取り出す
+
+    コピー中のファイルを処理しないよう、変更を検知するたびに待ち時間をやり直す。
+    """
+
+    def __init__(self, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._files = {}  # パス -> [(サイズ, 更新日時), 最後に変化を確認した時刻]
+
+    def __len__(self):
+        return len(self._files)
+
+    def touch(self, paths):
+        now = time.monotonic()
+        for file_path in paths:
+            entry = self._files.get(file_path)
+            if entry is None:
+                self._files[file_path] = [None, now]
+            else:
+                entry[1] = now
+
+    def ready(self, limit=None):
+        """書き込みが止まったファイルのパスと (サイズ, 更新日時) の組を最大 limit 件返す（返したものは追跡から外す）"""
+        now = time.monotonic()
+        stable = []
+        for file_path, entry in list(self._files.items()):
+            if limit is not None and len(stable) >= limit:
+                break
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # 削除・移動された
+                del self._files[file_path]
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != entry[0]:
+                entry[0] = signature
+                entry[1] = now
+            elif now - entry[1] >= self.settle_seconds and stat.st_size > 0:
+                del self._files[file_path]
+                stable.append((file_path, signature))
+        return stable
+
+
+def _unchanged(file_path, signature):
+    """ファイルが存在し、サイズと更新日時が signature と同じか"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    return (stat.st_size, stat.st_mtime_ns) == signature
+
+
+class WatchFolderService:
+    """フォルダを監視し、書き込みが止まったファイルを並列数 workers で process(パス) に渡す
+
+    処理待ちのキューは queue_size 件までで、一杯の間は新しいファイルを取り込まずに待機させる
+    （監視は続け、書き込みが止まったファイルも追跡したまま、空きができた分だけ取り込む）。
+    同じ内容のファイルは一度だけ処理する。停止するときは処理待ちのファイルを破棄し、処理中のものだけ終わらせる。
+    exclude に指定したフォルダ（出力先など）以下のファイルと、名前が "." で始まる一時ファイルは対象外。
+    skip(パス) が True を返すファイル（処理済みの出力があるものなど）は処理しない。
+
+    process が False を返すか例外を送出したファイルは、retry_delay 秒後から間隔を倍にしながら
+    max_retries 回まで再試行する（再試行しても失敗した場合は、ファイルが変更されるまで処理しない）。
+    skip・process が送出した例外は on_error(パス, 例外) に渡す。
+    """
+
+    def __init__(self, directories, process, workers=1, queue_size=None, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, exclude=(), force_polling=False, skip=None,
+                 on_backpressure=None, on_error=None, max_retries=DEFAULT_MAX_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.process = process
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self.skip = skip
+        self.on_backpressure = on_backpressure
+        self.on_error = on_error
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.exclude = [os.path.join(os.path.abspath(directory), '') for directory in exclude if directory]
+        self.tracker = StableFileTracker(settle_seconds)
+        self._queue = queue.Queue(maxsize=queue_size or self.workers * 2)
+        self._processed = {}  # パス -> 処理したときの (サイズ, 更新日時)
+        self._failures = {}  # パス -> [(サイズ, 更新日時), 失敗した回数, 再試行する時刻]
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    @property
+    def backlog(self):
+        """処理を待っているファイル数（キューに入れたものと、取り込みを待っているものを含む）"""
+        return len(self.tracker) + self._queue.qsize()
+
+    def run(self, stop_event):
+        """stop_event が設定されるまで監視と処理を続ける"""
+        watcher = open_watcher(self.directories, self.poll_interval, self.force_polling)
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        throttled = False
+        try:
+            while not stop_event.is_set():
+                self.tracker.touch(path for path in watcher.changes(stop_event) if self.accepts(path))
+                self.tracker.touch(self._due_retries())
+                if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                    self._prune()
+                # 空きがある分だけ取り込む（正規化が追いつかない場合の背圧）
+                # キューに入れるのはこのスレッドだけなので、取り出した件数は必ず入る
+                free = self._queue.maxsize - self._queue.qsize()
+                if free > 0:
+                    for file_path, signature in self.tracker.ready(free):
+                        with self._lock:
+                            if self._processed.get(file_path) == signature or file_path in self._queued:
+                                continue
+                            self._queued.add(file_path)
+                        self._queue.put_nowait((file_path, signature))
+                full = self._queue.full() and len(self.tracker) > 0
+                if full != throttled:
+                    throttled = full
+                    if self.on_backpressure is not None:
+                        self.on_backpressure(throttled, self.backlog)
+        finally:
+            watcher.close()
+            self._discard_queued()
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+
+    def _discard_queued(self):
+        """処理を始めていないファイルをキューから取り除く（次に起動したときに検索し直す）"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                with self._lock:
+                    self._queued.discard(item[0])
+
+    def _due_retries(self):
+        """再試行する時刻になったファイルのパスを返す（返したものは次に失敗するまで返さない）"""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for file_path, entry in self._failures.items():
+                if entry[2] is not None and entry[2] <= now:
+                    entry[2] = None
+                    due.append(file_path)
+        return due
+
+    def _prune(self):
+        """削除・変更されたファイルを処理済み・失敗の記録から取り除く（長時間の監視で記録が増え続けないよう）"""
+        self._pruned_at = time.monotonic()
+        with self._lock:
+            processed = list(self._processed.items())
+            failed = [(file_path, entry[0]) for file_path, entry in self._failures.items() if entry[2] is None]
+        stale_processed = [(file_path, signature) for file_path, signature in processed
+                           if not _unchanged(file_path, signature)]
+        stale_failed = [(file_path, signature) for file_path, signature in failed
+                        if not _unchanged(file_path, signature)]
+        with self._lock:
+            # 確認している間に処理し直したファイルは残す
+            for file_path, signature in stale_processed:
+                if self._processed.get(file_path) == signature:
+                    del self._processed[file_path]
+            for file_path, signature in stale_failed:
+                entry = self._failures.get(file_path)
+                if (entry is not None and entry[0] == signature and entry[2] is None
+                        and file_path not in self._queued):
+                    del self._failures[file_path]
+
+    def accepts(self, file_path):
+        file_path = os.path.abspath(file_path)
+        if os.path.basename(file_path).startswith('.') or not is_audio_file(file_path):
+            return False
+        return not any(file_path.startswith(directory) for directory in self.exclude)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            file_path, signature = item
+            try:
+                if self.skip is not None and self.skip(file_path):
+                    succeeded = True
+                else:
+                    succeeded = self.process(file_path) is not False
+            except Exception as e:
+                # 1ファイルの失敗で監視を止めないよう、報告して再試行する
+                succeeded = False
+                if self.on_error is not None:
+                    self.on_error(file_path, e)
+            # 元のファイルに書き込む処理（タグの書き込みなど）で変わった場合は、処理後の状態を記録する
+            try:
+                stat = os.stat(file_path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                pass
+            with self._lock:
+                self._queued.discard(file_path)
+                if succeeded:
+                    self._failures.pop(file_path, None)
+                    self._processed[file_path] = signature
+                else:
+                    self._record_failure(file_path, signature)
+
+    def _record_failure(self, file_path, signature):
+        """失敗を記録して次の再試行の時刻を決める（_lock を取得した状態で呼ぶ）"""
+        entry = self._failures.get(file_path)
+        # 内容が変わったファイルは新しいファイルとして数え直す
+        attempts = entry[1] + 1 if entry is not None and entry[0] == signature else 1
+        if attempts <= self.max_retries:
+            retry_at = time.monotonic() + self.retry_delay * 2 ** (attempts - 1)
+        else:
+            # 再試行をやめ、変更されるまで処理済みと同じ扱いにする
+            retry_at = None
+            self._processed[file_path] = signature
+        self._failures[file_path] = [signature, attempts, retry_at]